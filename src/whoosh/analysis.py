@@ -54,8 +54,17 @@ a filter first or a tokenizer after the first item).
 from array import array
 import copy, re
 from itertools import chain
+from threading import Lock
 
-from whoosh.lang.porter import stem
+
+def stem(word):
+    """Returns the Porter stem of the given word. This is the default stemming
+    function of :class:`StemFilter`; the stemmer module is only imported the
+    first time a word is stemmed.
+    """
+
+    from whoosh.lang.porter import stem as porter_stem
+    return porter_stem(word)
 
 # Default list of stop words (words so common it's usually wasteful to index
 # them). This list is used by the StopFilter class, which allows you to supply
@@ -75,6 +84,130 @@ def unstopped(tokenstream):
     return (t for t in tokenstream if not t.stopped)
 
 
+def analyze_batch(analyzer, values, positions=False, start_pos=0, **kwargs):
+    """Analyzes a list of unicode strings with the given analyzer, and returns
+    a list containing, for each string, a list of the texts of its unstopped
+    tokens, or of (text, position) pairs if positions=True. This uses the
+    analyzer's ``analyze_batch`` method if it has one (the analyzers in this
+    module do), or else simply calls the analyzer on each string.
+    """
+    
+    method = getattr(analyzer, "analyze_batch", None)
+    if method is not None:
+        return method(values, positions=positions, start_pos=start_pos,
+                      **kwargs)
+    return _analyze_each(analyzer, values, positions, start_pos, kwargs)
+
+
+def _analyze_each(analyzer, values, positions, start_pos, kwargs):
+    # The general implementation of analyze_batch: runs the whole token
+    # stream for each value
+    result = []
+    for value in values:
+        tokens = unstopped(analyzer(value, positions=positions,
+                                    start_pos=start_pos, **kwargs))
+        if positions:
+            result.append([(t.text, t.pos) for t in tokens])
+        else:
+            result.append([t.text for t in tokens])
+    return result
+
+
+# Keyword arguments the fused batch analysis (below) can ignore, since they
+# don't change the output of the chains it handles
+_fusable_args = frozenset(("mode", "removestops"))
+
+# Cache of expressions with their groups made non-capturing, keyed by the
+# original expression
+_findall_cache = {}
+
+def _findall_fn(expression):
+    # Returns a function that returns the list of whole matches of the given
+    # compiled expression in a string. re.findall() is much faster than
+    # iterating over match objects, but if the expression has groups it
+    # returns the groups instead of the whole match, so when it's safe this
+    # makes the groups non-capturing, e.g. the default tokenizer expression
+    # r"\w+(\.?\w+)*" becomes r"\w+(?:\.?\w+)*".
+    
+    if not expression.groups:
+        return expression.findall
+    if expression in _findall_cache:
+        return _findall_cache[expression]
+    
+    pattern = expression.pattern
+    findall = None
+    if ("[" not in pattern and "\\(" not in pattern
+        and not re.search(r"\\[1-9]", pattern)):
+        plain = re.compile(re.sub(r"\((?!\?)", "(?:", pattern),
+                           expression.flags)
+        if not plain.groups:
+            findall = plain.findall
+    if findall is None:
+        def findall(value):
+            return [m.group(0) for m in expression.finditer(value)]
+    _findall_cache[expression] = findall
+    return findall
+
+def _fused_batch(values, tokenizer, lower, stopper, stemmer, positions,
+                 start_pos):
+    # Does the work of a RegexTokenizer followed by an optional
+    # LowercaseFilter, StopFilter and StemFilter for a list of values, working
+    # on lists of strings instead of passing a Token object through a chain of
+    # generators
+    
+    findall = _findall_fn(tokenizer.expression)
+    
+    if stopper:
+        stops = stopper.stops
+        minsize = stopper.min
+        renumber = stopper.renumber
+    if stemmer:
+        ignores = stemmer.ignores
+        stem_words = stemmer.cache.stem_words
+    
+    result = []
+    for value in values:
+        assert isinstance(value, unicode), "%r is not unicode" % value
+        words = findall(value)
+        if lower:
+            words = [w.lower() for w in words]
+        
+        if positions:
+            if stopper:
+                poslist = []
+                kept = []
+                pos = None
+                for i, w in enumerate(words):
+                    if len(w) >= minsize and w not in stops:
+                        if not renumber:
+                            pos = start_pos + i
+                        elif pos is None:
+                            pos = start_pos + i
+                        else:
+                            pos += 1
+                        kept.append(w)
+                        poslist.append(pos)
+                words = kept
+            else:
+                poslist = xrange(start_pos, start_pos + len(words))
+        elif stopper:
+            words = [w for w in words if len(w) >= minsize and w not in stops]
+        
+        if stemmer:
+            if ignores:
+                stems = iter(stem_words([w for w in words
+                                         if w not in ignores]))
+                words = [w if w in ignores else stems.next() for w in words]
+            else:
+                words = stem_words(words)
+        
+        if positions:
+            result.append(zip(words, poslist))
+        else:
+            result.append(words)
+    return result
+
+
 # Token object
 
 class Token(object):
@@ -163,6 +296,12 @@ class Tokenizer(Composable):
     
     def __eq__(self, other):
         return other and self.__class__ is other.__class__
+    
+    def analyze_batch(self, values, positions=False, start_pos=0, **kwargs):
+        """Tokenizes a list of unicode strings. See :func:`analyze_batch`.
+        """
+        
+        return _analyze_each(self, values, positions, start_pos, kwargs)
 
 
 class IDTokenizer(Tokenizer):
@@ -224,6 +363,12 @@ class RegexTokenizer(Tokenizer):
                 return True
         return False
     
+    def analyze_batch(self, values, positions=False, start_pos=0, **kwargs):
+        if self.gaps or not _fusable_args.issuperset(kwargs):
+            return _analyze_each(self, values, positions, start_pos, kwargs)
+        return _fused_batch(values, self, False, None, None, positions,
+                            start_pos)
+    
     def __call__(self, value, positions=False, chars=False,
                  keeporiginal=False, removestops=True,
                  start_pos=0, start_char=0,
@@ -660,6 +805,145 @@ class StopFilter(Filter):
                     yield t
 
 
+class StemCache(object):
+    """A bounded cache of the stems of words, for a given stemming function.
+    
+    The cache keeps two generations of words: new words go into the current
+    generation, and when it's full it replaces the previous generation (which
+    is thrown away). Words found in the previous generation are moved to the
+    current one, so the words in use stay in the cache, and the cache never
+    holds more than ``size`` words. Since a word always has the same stem, the
+    cache can be shared by any number of analyzers and threads without
+    locking.
+    
+    The ``hits`` and ``misses`` attributes count the lookups that were (or
+    weren't) answered from the cache.
+    
+    You should usually get the cache for a stemming function with
+    :func:`shared_stem_cache` instead of creating one.
+    """
+    
+    def __init__(self, stemfn, size=50000):
+        """
+        :param stemfn: the function to use for stemming.
+        :param size: the maximum number of words to keep in the cache.
+        """
+        
+        self.stemfn = stemfn
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+    
+    def __repr__(self):
+        return "<%s %r %d/%d words, %d hits, %d misses>" % (self.__class__.__name__,
+                                                            self.stemfn,
+                                                            len(self), self.size,
+                                                            self.hits,
+                                                            self.misses)
+    
+    def __len__(self):
+        return len(self._current) + len(self._previous)
+    
+    def __contains__(self, word):
+        return word in self._current or word in self._previous
+    
+    def clear(self):
+        """Removes all words from the cache.
+        """
+        
+        self._current = {}
+        self._previous = {}
+    
+    def hit_rate(self):
+        """Returns the fraction of lookups that were answered from the cache.
+        """
+        
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return self.hits / float(total)
+    
+    def _lookup(self, word):
+        # Looks up a word that isn't in the current generation
+        s = self._previous.get(word)
+        if s is None:
+            s = self.stemfn(word)
+            self.misses += 1
+        else:
+            self.hits += 1
+        
+        current = self._current
+        current[word] = s
+        if len(current) >= max(1, self.size // 2):
+            self._previous = current
+            self._current = {}
+        return s
+    
+    def stem(self, word):
+        """Returns the stem of the given word.
+        """
+        
+        s = self._current.get(word)
+        if s is None:
+            return self._lookup(word)
+        self.hits += 1
+        return s
+    
+    def stem_words(self, words):
+        """Returns a list of the stems of the given list of words.
+        """
+        
+        get = self._current.get
+        stems = [get(w) for w in words]
+        found = len(stems)
+        lookup = self._lookup
+        for i, s in enumerate(stems):
+            if s is None:
+                stems[i] = lookup(words[i])
+                found -= 1
+        self.hits += found
+        return stems
+    
+    def prewarm(self, words):
+        """Adds the stems of the given words to the cache, until it's full. For
+        example, to fill the cache with the stems of the terms in a field that
+        is indexed without stemming::
+        
+            cache.prewarm(ixreader.lexicon("title"))
+        """
+        
+        limit = max(1, self.size // 2)
+        current = self._current
+        stemfn = self.stemfn
+        for word in words:
+            if len(current) >= limit:
+                break
+            if word not in current:
+                current[word] = stemfn(word)
+
+
+_stem_caches = {}
+_stem_caches_lock = Lock()
+
+def shared_stem_cache(stemfn, size=50000):
+    """Returns the :class:`StemCache` shared by everything that uses the given
+    stemming function, creating it if necessary. If the existing cache is
+    smaller than ``size``, it is enlarged.
+    """
+    
+    _stem_caches_lock.acquire()
+    try:
+        cache = _stem_caches.get(stemfn)
+        if cache is None:
+            cache = _stem_caches[stemfn] = StemCache(stemfn, size)
+        elif cache.size < size:
+            cache.size = size
+        return cache
+    finally:
+        _stem_caches_lock.release()
+
+
 class StemFilter(Filter):
     """Stems (removes suffixes from) the text of tokens using the Porter
     stemming algorithm. Stemming attempts to reduce multiple forms of the same
@@ -671,20 +955,26 @@ class StemFilter(Filter):
     >>> stemmer = StemFilter()
     >>> [token.text for token in stemmer(stream)]
     [u"fundament", u"willow"]
+    
+    The filter memoizes stemmed words in a bounded :class:`StemCache`, which
+    is shared by all StemFilters (and threads) using the same stemming
+    function.
     """
     
-    __inittypes__ = dict(stemfn=object, ignore=list)
+    __inittypes__ = dict(stemfn=object, ignore=list, cachesize=int)
     
-    def __init__(self, stemfn=stem, ignore=None):
+    def __init__(self, stemfn=stem, ignore=None, cachesize=50000):
         """
         :param stemfn: the function to use for stemming.
         :param ignore: a set/list of words that should not be stemmed. This is
             converted into a frozenset. If you omit this argument, all tokens
             are stemmed.
+        :param cachesize: the maximum number of stemmed words to keep in the
+            shared cache for the stemming function.
         """
         
         self.stemfn = stemfn
-        self.cache = {}
+        self.cachesize = cachesize
         if ignore is None:
             self.ignores = frozenset()
         else:
@@ -695,32 +985,42 @@ class StemFilter(Filter):
                 and self.__class__ is other.__class__
                 and self.stemfn == other.stemfn)
     
+    def __setstate__(self, state):
+        # Older versions kept an unbounded cache dictionary in the filter
+        state.pop("cache", None)
+        state.setdefault("cachesize", 50000)
+        self.__dict__.update(state)
+    
+    @property
+    def cache(self):
+        """The :class:`StemCache` for this filter's stemming function.
+        """
+        return shared_stem_cache(self.stemfn, self.cachesize)
+    
     def __call__(self, tokens):
         assert hasattr(tokens, "__iter__")
-        stemfn = self.stemfn
-        cache = self.cache
+        stem = self.cache.stem
         ignores = self.ignores
         
         for t in tokens:
-            if t.stopped:
-                yield t
-                continue
-            
-            text = t.text
-            if text in ignores:
-                yield t
-            elif text in cache:
-                t.text = cache[text]
-                yield t
-            else:
-                t.text = s = stemfn(text)
-                cache[text] = s
-                yield t
+            if not t.stopped and t.text not in ignores:
+                t.text = stem(t.text)
+            yield t
+    
+    def prewarm(self, words):
+        """Fills the stem cache with the stems of the given words, for example
+        the terms of a field indexed without stemming::
+        
+            stemfilter.prewarm(ixreader.lexicon("title"))
+        """
+        
+        self.cache.prewarm(w for w in words if w not in self.ignores)
                 
     def clean(self):
         """
         This filter memoizes previously stemmed words to greatly speed up
-        stemming. This method clears the cache of previously stemmed words.
+        stemming. This method clears the (shared) cache of previously stemmed
+        words.
         """
         self.cache.clear()
 
@@ -817,6 +1117,30 @@ class NgramFilter(Filter):
                     yield t
 
 
+_unicode_class_strings = None
+
+def _unicode_classes():
+    # Returns regex-escaped strings of the unicode digit, uppercase, and
+    # lowercase characters. Building these takes a noticeable fraction of a
+    # second, so it's done the first time an IntraWordFilter is created
+    # instead of when this module is imported
+    global _unicode_class_strings
+    if _unicode_class_strings is None:
+        digits = array("u")
+        uppers = array("u")
+        lowers = array("u")
+        for n in xrange(2 ** 16 - 1):
+            ch = unichr(n)
+            if ch.islower(): lowers.append(ch)
+            elif ch.isupper(): uppers.append(ch)
+            elif ch.isdigit(): digits.append(ch)
+        
+        _unicode_class_strings = (re.escape("".join(digits)),
+                                  re.escape("".join(uppers)),
+                                  re.escape("".join(lowers)))
+    return _unicode_class_strings
+
+
 class IntraWordFilter(Filter):
     """Splits words into subwords and performs optional transformations on
     subword groups. This filter is funtionally based on yonik's
@@ -870,22 +1194,6 @@ class IntraWordFilter(Filter):
     (See :class:`MultiFilter`.)
     """
 
-    # Create sets of unicode digit, uppercase, and lowercase characters.
-    digits = array("u")
-    uppers = array("u")
-    lowers = array("u")
-    for n in xrange(2 ** 16 - 1):
-        ch = unichr(n)
-        if ch.islower(): lowers.append(ch)
-        elif ch.isupper(): uppers.append(ch)
-        elif ch.isdigit(): digits.append(ch)
-    
-    # Create escaped strings of characters for use in regular expressions
-    digits = re.escape("".join(digits))
-    uppers = re.escape("".join(uppers))
-    lowers = re.escape("".join(lowers))
-    letters = uppers + lowers
-    
     __inittypes__ = dict(delims=unicode, splitwords=bool, splitnums=bool,
                          mergewords=bool, mergenums=bool)
     
@@ -905,17 +1213,19 @@ class IntraWordFilter(Filter):
         """
         
         self.delims = re.escape(delims)
+        digits, uppers, lowers = _unicode_classes()
+        letters = uppers + lowers
         
         # Expression for splitting at delimiter characters
         self.splitter = re.compile(u"[%s]+" % (self.delims,), re.UNICODE)
         # Expression for removing "'s" from the end of sub-words
-        dispat = u"(?<=[%s])'[Ss](?=$|[%s])" % (self.letters, self.delims)
+        dispat = u"(?<=[%s])'[Ss](?=$|[%s])" % (letters, self.delims)
         self.disposses = re.compile(dispat, re.UNICODE)
         
         # Expression for finding case and letter-number transitions
-        lower2upper = u"[%s][%s]" % (self.lowers, self.uppers)
-        letter2digit = u"[%s][%s]" % (self.letters, self.digits)
-        digit2letter = u"[%s][%s]" % (self.digits, self.letters)
+        lower2upper = u"[%s][%s]" % (lowers, uppers)
+        letter2digit = u"[%s][%s]" % (letters, digits)
+        digit2letter = u"[%s][%s]" % (digits, letters)
         if splitwords and splitnums:
             splitpat = u"(%s|%s|%s)" % (lower2upper, letter2digit, digit2letter)
             self.boundary = re.compile(splitpat, re.UNICODE)
@@ -1221,6 +1531,18 @@ class Analyzer(Composable):
     def __call__(self, value, **kwargs):
         raise NotImplementedError
     
+    def analyze_batch(self, values, positions=False, start_pos=0, **kwargs):
+        """Analyzes a list of unicode strings in one call, and returns a list
+        containing, for each string, a list of the texts of its unstopped
+        tokens, or of (text, position) pairs if positions=True.
+        
+        >>> ana = StandardAnalyzer()
+        >>> ana.analyze_batch([u"Hello there", u"This is a TEST"])
+        [[u"hello", u"there"], [u"test"]]
+        """
+        
+        return _analyze_each(self, values, positions, start_pos, kwargs)
+    
     def clean(self):
         pass
 
@@ -1245,6 +1567,40 @@ class CompositeAnalyzer(Analyzer):
             gen = item(gen)
         return gen
     
+    def analyze_batch(self, values, positions=False, start_pos=0, **kwargs):
+        # Chains of a RegexTokenizer followed by a LowercaseFilter, StopFilter
+        # and/or StemFilter (such as StandardAnalyzer and StemmingAnalyzer)
+        # are run with a fused implementation that avoids the per-token
+        # overhead of the generator chain
+        fused = None
+        if _fusable_args.issuperset(kwargs):
+            fused = self._fused_parts()
+        if fused is None:
+            return _analyze_each(self, values, positions, start_pos, kwargs)
+        return _fused_batch(values, *(fused + (positions, start_pos)))
+    
+    def _fused_parts(self):
+        # Returns a tuple of (tokenizer, lowercase, stopfilter, stemfilter) if
+        # this chain can use the fused batch analysis, or else None
+        items = self.items
+        tokenizer = items[0]
+        if type(tokenizer) is not RegexTokenizer or tokenizer.gaps:
+            return None
+        
+        lower = False
+        stopper = stemmer = None
+        for item in items[1:]:
+            t = type(item)
+            if t is LowercaseFilter and not (lower or stopper or stemmer):
+                lower = True
+            elif t is StopFilter and not (stopper or stemmer):
+                stopper = item
+            elif t is StemFilter and not stemmer:
+                stemmer = item
+            else:
+                return None
+        return (tokenizer, lower, stopper, stemmer)
+    
     def __getitem__(self, item):
         return self.items.__getitem__(item)
     
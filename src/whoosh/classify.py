@@ -19,6 +19,7 @@ documents.
 """
 
 from collections import defaultdict
+from heapq import nlargest
 from math import log
 
 
@@ -85,19 +86,17 @@ class Expander(object):
             scoring.Bo1Model by default.
         """
         
+        self.ixreader = ixreader
         self.fieldname = fieldname
         
         if type(model) is type:
             model = model(ixreader, fieldname)
         self.model = model
         
-        # Cache the collection frequency of every term in this field. This
-        # turns out to be much faster than reading each individual weight from
-        # the term index as we add words.
-        self.collection_freq = dict((word, freq) for word, _, freq
-                                      in ixreader.iter_field(fieldname))
-        
-        # Maps words to their weight in the top N documents.
+        # Maps words to their weight in the top N documents. The collection
+        # frequencies are only looked up for these words (the candidates)
+        # when the expanded terms are requested, instead of reading the
+        # whole lexicon of the field up front.
         self.topN_weight = defaultdict(float)
         
         # Total weight of all terms in the top N documents.
@@ -130,10 +129,13 @@ class Expander(object):
         model = self.model
         tlist = []
         maxweight = 0
-        collection_freq = self.collection_freq
+        ixreader = self.ixreader
+        fieldnum = ixreader.schema.to_number(self.fieldname)
+        frequency = ixreader.frequency
         
         for word, weight in self.topN_weight.iteritems():
-            score = model.score(weight, collection_freq[word], self.top_total)
+            score = model.score(weight, frequency(fieldnum, word),
+                                self.top_total)
             if score > maxweight: maxweight = score
             tlist.append((score, word))
         
@@ -141,10 +143,9 @@ class Expander(object):
             norm = model.normalizer(maxweight, self.top_total)
         else:
             norm = maxweight
-        tlist = [(weight / norm, t) for weight, t in tlist]
-        tlist.sort(reverse=True)
+        tlist = [(weight / norm, t) for weight, t in nlargest(number, tlist)]
         
-        return [(t, weight) for weight, t in tlist[:number]]
+        return [(t, weight) for weight, t in tlist]
 
 
 
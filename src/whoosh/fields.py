@@ -18,10 +18,12 @@
 """
 
 import datetime, re, struct
+from collections import defaultdict
 
 from whoosh.analysis import (IDAnalyzer, RegexAnalyzer, KeywordAnalyzer,
-                             StandardAnalyzer, NgramAnalyzer)
-from whoosh.formats import Format, Existence, Frequency, Positions
+                             StandardAnalyzer, NgramAnalyzer, unstopped)
+from whoosh.formats import (Format, Existence, Frequency, Positions,
+                            Characters)
 
 # Exceptions
 
@@ -31,6 +33,35 @@ class UnknownFieldError(Exception):
     pass
 
 
+# Character used to mark the reversed terms indexed by fields created with
+# reverse=True. It sorts after the characters that normally appear in terms, so
+# the reversed terms come after the normal terms in the field.
+REVERSE_MARK = u"\uffff"
+
+
+def reverse_term(text):
+    """Returns the reversed form of a term that is indexed in fields created
+    with ``reverse=True``.
+    """
+    
+    return REVERSE_MARK + text[::-1]
+
+
+# Prefix of the word pair terms indexed by fields created with bigrams=True.
+# These sort after the normal and reversed terms in the field. Because the
+# prefix starts with REVERSE_MARK, the readers and queries that skip reversed
+# terms skip the word pair terms too.
+BIGRAM_MARK = REVERSE_MARK * 2
+
+
+def bigram_term(first, second):
+    """Returns the term indexed in fields created with ``bigrams=True`` for a
+    pair of adjacent words.
+    """
+    
+    return u"%s%s %s" % (BIGRAM_MARK, first, second)
+
+
 # Field Types
 
 class FieldType(object):
@@ -57,6 +88,15 @@ class FieldType(object):
       fields marked as 'unique' to find the previous version of a document
       being updated.
       
+    * reverse (boolean): whether the field also indexes each term reversed
+      (see :func:`reverse_term`), so wildcard queries that start with a
+      wildcard can seek through the term index instead of checking every term.
+      
+    * bigrams (boolean): whether the field also indexes each pair of adjacent
+      words (see :func:`bigram_term`), so phrase queries can find candidate
+      documents from the postings of the pairs instead of checking the
+      positions of the words in every document that contains all of them.
+      
     The constructor for the base field type simply lets you supply your own
     configured field format, vector format, and scorable and stored values.
     Subclasses may configure some or all of this for you.
@@ -66,6 +106,8 @@ class FieldType(object):
     format = vector = scorable = stored = unique = None
     parse_query = None
     indexed = True
+    reverse = False
+    bigrams = False
     __inittypes__ = dict(format=Format, vector=Format,
                          scorable=bool, stored=bool, unique=bool)
     
@@ -89,7 +131,9 @@ class FieldType(object):
                     (self.vector == other.vector),
                     (self.scorable == other.scorable),
                     (self.stored == other.stored),
-                    (self.unique == other.unique)))
+                    (self.unique == other.unique),
+                    (self.reverse == other.reverse),
+                    (self.bigrams == other.bigrams)))
     
     def clean(self):
         """Clears any cached information in the field and any child objects.
@@ -110,6 +154,35 @@ class FieldType(object):
             raise ValueError("%r is not unicode" % value)
         return self.format.word_values(value, mode="index", **kwargs)
     
+    def index_bigrams(self, value, **kwargs):
+        """Returns an iterator of (termtext, frequency, encoded_value) tuples
+        for the pairs of adjacent words in the value, where termtext is the
+        :func:`bigram_term` for the pair and encoded_value holds the positions
+        of the first word of each occurrence of the pair.
+        """
+        
+        # Group the words by position, then pair up the words at each
+        # position with the words at the same and the next position
+        bypos = defaultdict(list)
+        for t in unstopped(self.format.analyze(value, mode="index",
+                                               positions=True, **kwargs)):
+            bypos[t.pos].append(t.text)
+        
+        seen = defaultdict(list)
+        for pos in sorted(bypos):
+            words = bypos[pos]
+            following = bypos.get(pos + 1, ())
+            for first in words:
+                for second in words:
+                    if second != first:
+                        seen[bigram_term(first, second)].append(pos)
+                for second in following:
+                    seen[bigram_term(first, second)].append(pos)
+        
+        encode = self.format.encode
+        return ((w, len(poslist), encode(poslist))
+                for w, poslist in seen.iteritems())
+    
     def process_text(self, qstring, mode='', **kwargs):
         if not self.format:
             raise Exception("%s field has no format" % self)
@@ -123,15 +196,20 @@ class ID(FieldType):
     of a file.
     """
     
-    __inittypes__ = dict(stored=bool, unique=bool, field_boost=float)
+    __inittypes__ = dict(stored=bool, unique=bool, field_boost=float,
+                         reverse=bool)
     
-    def __init__(self, stored=False, unique=False, field_boost=1.0):
+    def __init__(self, stored=False, unique=False, field_boost=1.0,
+                 reverse=False):
         """
         :param stored: Whether the value of this field is stored with the document.
+        :param reverse: Whether to also index the reversed value, to make
+            wildcard queries that start with a wildcard fast.
         """
         self.format = Existence(analyzer=IDAnalyzer(), field_boost=field_boost)
         self.stored = stored
         self.unique = unique
+        self.reverse = reverse
 
 
 class IDLIST(FieldType):
@@ -297,16 +375,18 @@ class KEYWORD(FieldType):
     """
     
     __inittypes__ = dict(stored=bool, lowercase=bool, commas=bool, scorable=bool,
-                         unique=bool, field_boost=float)
+                         unique=bool, field_boost=float, reverse=bool)
     
     def __init__(self, stored=False, lowercase=False, commas=False,
-                 scorable=False, unique=False, field_boost=1.0):
+                 scorable=False, unique=False, field_boost=1.0, reverse=False):
         """
         :param stored: Whether to store the value of the field with the
             document.
         :param comma: Whether this is a comma-separated field. If this is False
             (the default), it is treated as a space-separated field.
         :param scorable: Whether this field is scorable.
+        :param reverse: Whether to also index each keyword reversed, to make
+            wildcard queries that start with a wildcard fast.
         """
         
         ana = KeywordAnalyzer(lowercase=lowercase, commas=commas)
@@ -314,6 +394,7 @@ class KEYWORD(FieldType):
         self.scorable = scorable
         self.stored = stored
         self.unique = unique
+        self.reverse = reverse
 
 
 class TEXT(FieldType):
@@ -323,10 +404,12 @@ class TEXT(FieldType):
     """
     
     __inittypes__ = dict(analyzer=object, phrase=bool, vector=Format,
-                         stored=bool, field_boost=float)
+                         stored=bool, field_boost=float, reverse=bool,
+                         bigrams=bool, chars=bool)
     
     def __init__(self, analyzer=None, phrase=True, vector=None,
-                 stored=False, field_boost=1.0):
+                 stored=False, field_boost=1.0, reverse=False, bigrams=False,
+                 chars=False):
         """
         :param stored: Whether to store the value of this field with the
             document. Since this field type generally contains a lot of text,
@@ -337,11 +420,24 @@ class TEXT(FieldType):
         :param analyzer: The analysis.Analyzer to use to index the field
             contents. See the analysis module for more information. If you omit
             this argument, the field uses analysis.StandardAnalyzer.
+        :param reverse: Whether to also index each word reversed, to make
+            wildcard queries that start with a wildcard fast.
+        :param bigrams: Whether to also index each pair of adjacent words, to
+            make phrase queries containing common words fast. This requires
+            ``phrase=True``.
+        :param chars: Whether to store the character offsets of each word
+            along with its positions, so search results can be highlighted
+            without re-analyzing the stored text.
         """
         
+        if bigrams and not phrase:
+            raise FieldConfigurationError("Indexing bigrams requires phrase=True")
+        
         ana = analyzer or StandardAnalyzer()
         
-        if phrase:
+        if chars:
+            formatclass = Characters
+        elif phrase:
             formatclass = Positions
         else:
             formatclass = Frequency
@@ -350,6 +446,8 @@ class TEXT(FieldType):
         
         self.scorable = True
         self.stored = stored
+        self.reverse = reverse
+        self.bigrams = bigrams
 
 
 class NGRAM(FieldType):
@@ -15,6 +15,7 @@
 #===============================================================================
 
 import cPickle, re
+from array import array
 from bisect import bisect_right
 from time import time
 from threading import Lock
@@ -29,9 +30,8 @@ from whoosh.support.bitvector import BitVector
 from whoosh.system import _INT_SIZE, _FLOAT_SIZE
 
 
-_INDEX_VERSION = -105
-_EXTENSIONS = "dci|dcz|tiz|fvz|pst|vps"
-
+_INDEX_VERSION = -111
+_EXTENSIONS = "dci|dcz|tiz|fvz|pst|pos|vps|vtm"
 
 # A mix-in that adds methods for deleting
 # documents from self.segments. These methods are on IndexWriter as
@@ -158,7 +158,7 @@ class FileIndex(SegmentDeletionMixin, Index):
         stream.write_string(cPickle.dumps(self.schema, -1))
         stream.write_int(self.generation)
         stream.write_int(self.segment_counter)
-        stream.write_pickle(self.segments)
+        _write_segments(stream, self.segments)
         stream.close()
 
         # Rename temporary file to the proper filename
@@ -194,7 +194,7 @@ class FileIndex(SegmentDeletionMixin, Index):
         generation = stream.read_int()
         assert generation == self.generation
         self.segment_counter = stream.read_int()
-        self.segments = stream.read_pickle()
+        self.segments = _read_segments(stream)
         stream.close()
 
     def _next_segment_name(self):
@@ -425,8 +425,9 @@ class SegmentSet(object):
 
 class Segment(object):
     """Do not instantiate this object directly. It is used by the Index object
-    to hold information about a segment. A list of objects of this class are
-    pickled as part of the TOC file.
+    to hold information about a segment. The TOC file stores the name,
+    document count, field length totals and deleted documents of each
+    segment.
     
     The TOC file stores a minimal amount of information -- mostly a list of
     Segment objects. Segments are the real reverse indexes. Having multiple
@@ -460,7 +461,9 @@ class Segment(object):
         self.term_filename = self.name + ".tiz"
         self.vector_filename = self.name + ".fvz"
         self.posts_filename = self.name + ".pst"
+        self.positions_filename = self.name + ".pos"
         self.vectorposts_filename = self.name + ".vps"
+        self.vectorterms_filename = self.name + ".vtm"
 
     def __repr__(self):
         return "%s(%r)" % (self.__class__.__name__, self.name)
@@ -539,6 +542,49 @@ class Segment(object):
 
 # Utility functions
 
+def _write_segments(stream, segments):
+    """Writes the metadata of the segments in the given SegmentSet to a TOC
+    stream.
+    """
+
+    stream.write_varint(len(segments))
+    for segment in segments:
+        stream.write_string(segment.name)
+        stream.write_varint(segment.max_doc)
+
+        totals = segment.field_length_totals
+        stream.write_varint(len(totals))
+        for fieldnum in sorted(totals):
+            stream.write_varint(fieldnum)
+            stream.write_ulong(totals[fieldnum])
+
+        deleted = segment.deleted or ()
+        stream.write_varint(len(deleted))
+        stream.write_array(array("I", sorted(deleted)))
+
+def _read_segments(stream):
+    """Reads the segment metadata written by :func:`_write_segments` and
+    returns a SegmentSet.
+    """
+
+    segments = []
+    for _ in xrange(stream.read_varint()):
+        name = stream.read_string()
+        max_doc = stream.read_varint()
+
+        totals = {}
+        for _ in xrange(stream.read_varint()):
+            fieldnum = stream.read_varint()
+            totals[fieldnum] = stream.read_ulong()
+
+        deleted = None
+        deletedcount = stream.read_varint()
+        if deletedcount:
+            deleted = set(stream.read_array("I", deletedcount))
+
+        segments.append(Segment(name, max_doc, totals, deleted))
+    return SegmentSet(segments)
+
 def _toc_pattern(indexname):
     """Returns a regular expression object that matches TOC filenames.
     name is the name of the index.
@@ -22,9 +22,29 @@ from whoosh.system import _INT_SIZE
 from whoosh.util import utf8encode, utf8decode
 
 
+def _split_values(format, posfile):
+    # Returns True if postings in the given format should be written/read with
+    # the variable-length part of each value in a separate positions file
+    return (posfile is not None and format.posting_size < 0
+            and format.head_size is not None)
+
+
 class FilePostingWriter(PostingWriter):
-    def __init__(self, postfile, stringids=False, blocklimit=48):
+    def __init__(self, postfile, stringids=False, blocklimit=48, posfile=None):
+        """
+        :param postfile: the StructFile to write the posting blocks to.
+        :param stringids: whether the posting IDs are strings (for vectors)
+            rather than integers.
+        :param blocklimit: the maximum number of postings in a block.
+        :param posfile: an optional StructFile for the variable-length part
+            of the posting values. If this is given, and a format has a fixed
+            size "head" (see :attr:`whoosh.formats.Format.head_size`), only
+            the heads are written inline in the posting blocks and the rest of
+            each value (e.g. the positions) goes into this file, so readers
+            that only need frequencies or weights don't have to read it.
+        """
         self.postfile = postfile
+        self.posfile = posfile
         self.stringids = stringids
 
         if blocklimit > 255:
@@ -47,6 +67,7 @@ class FilePostingWriter(PostingWriter):
             raise Exception("Called start() in a block")
 
         self.format = format
+        self.split = _split_values(format, self.posfile)
         self.blockcount = 0
         self.posttotal = 0
         self.startoffset = self.postfile.tell()
@@ -82,15 +103,22 @@ class FilePostingWriter(PostingWriter):
         else:
             pf.write_array(ids)
 
-        if posting_size < 0:
-            # Write array of value lengths
-            lengths = array("I")
-            for valuestring in values:
-                lengths.append(len(valuestring))
-            pf.write_array(lengths)
+        if self.split:
+            # Write the fixed-size heads of the values inline, followed by a
+            # pointer to the rest of the values in the positions file
+            head_size = self.format.head_size
+            pf.write("".join(v[:head_size] for v in values))
+            pf.write_uint(self._write_tails(values, head_size))
+        else:
+            if posting_size < 0:
+                # Write array of value lengths
+                lengths = array("I")
+                for valuestring in values:
+                    lengths.append(len(valuestring))
+                pf.write_array(lengths)
 
-        if posting_size != 0:
-            pf.write("".join(values))
+            if posting_size != 0:
+                pf.write("".join(values))
 
         # Seek back and write the pointer to the next block
         pf.flush()
@@ -103,6 +131,16 @@ class FilePostingWriter(PostingWriter):
         self._reset_block()
         self.blockcount += 1
 
+    def _write_tails(self, values, head_size):
+        # Writes an array of the lengths of the value tails followed by the
+        # tails themselves to the positions file, and returns the offset
+        posf = self.posfile
+        offset = posf.tell()
+        tails = [v[head_size:] for v in values]
+        posf.write_array(array("I", [len(t) for t in tails]))
+        posf.write("".join(tails))
+        return offset
+
     def write(self, id, valuestring):
         self.blockids.append(id)
         self.blockvalues.append(valuestring)
@@ -130,15 +168,24 @@ class FilePostingWriter(PostingWriter):
         if hasattr(self, "blockids") and self.blockids:
             self.finish()
         self.postfile.close()
+        if self.posfile:
+            self.posfile.close()
 
 
 
 class FilePostingReader(PostingReader):
-    def __init__(self, postfile, offset, format, stringids=False):
+    # Value types that can be decoded from the head of a split value without
+    # reading the rest of the value from the positions file
+    head_types = frozenset(("frequency", "weight"))
+
+    def __init__(self, postfile, offset, format, stringids=False,
+                 posfile=None):
         self.postfile = postfile
+        self.posfile = posfile
         self.format = format
         self.decode = format.decode_as
         self.stringids = stringids
+        self.split = _split_values(format, posfile)
 
         self.offset = offset
         self.blockcount = postfile.get_uint(offset)
@@ -153,13 +200,15 @@ class FilePostingReader(PostingReader):
 
     def close(self):
         self.postfile.close()
+        if self.posfile:
+            self.posfile.close()
 
     def all_items(self):
         nextoffset = self.baseoffset
         for _ in xrange(self.blockcount):
             maxid, nextoffset, postcount, offset = self._read_block_header(nextoffset)
             ids, offset = self._read_ids(offset, postcount)
-            values = self._read_values(offset, nextoffset, postcount)
+            values = self._block_values(offset, nextoffset, postcount)
             for id, valuestring in zip(ids, values):
                 yield id, valuestring
 
@@ -200,8 +249,33 @@ class FilePostingReader(PostingReader):
     def value(self):
         if self.id is None:
             raise ReadTooFar
+
+        posting_size = self.format.posting_size
+        if posting_size > 0:
+            # Fixed-size values can be sliced straight out of the file map
+            start = self.valueoffset + self.i * posting_size
+            return self.postfile.map[start:start + posting_size]
+        elif posting_size == 0:
+            return ''
+
+        if self.values is None:
+            # The variable-length values for this block haven't been read yet
+            self.values = self._block_values(self.valueoffset, self.nextoffset,
+                                             self.postcount)
         return self.values[self.i]
 
+    def value_as(self, astype):
+        if self.split and self.values is None and astype in self.head_types:
+            if self.id is None:
+                raise ReadTooFar
+            # The value can be decoded from the fixed-size head, so there's
+            # no need to read the rest of the value
+            head_size = self.format.head_size
+            start = self.valueoffset + self.i * head_size
+            head = self.postfile.map[start:start + head_size]
+            return self.format.decoder(astype)(head)
+        return self.format.decoder(astype)(self.value())
+
     def _read_block_header(self, offset):
         pf = self.postfile
         if self.stringids:
@@ -268,10 +342,49 @@ class FilePostingReader(PostingReader):
 
         return values
 
+    def _block_values(self, offset, endoffset, postcount):
+        # Returns the list of value strings for the block whose values start
+        # at the given offset
+        if self.split:
+            heads, tailoffset = self._read_heads(offset, postcount)
+            return self._join_tails(heads, tailoffset)
+        else:
+            return self._read_values(offset, endoffset, postcount)
+
+    def _read_heads(self, offset, postcount):
+        # Reads the fixed-size value heads inline in a split block and the
+        # pointer to the rest of the values in the positions file
+        pf = self.postfile
+        head_size = self.format.head_size
+        size = head_size * postcount
+        allheads = pf.map[offset:offset + size]
+        heads = [allheads[i * head_size:i * head_size + head_size]
+                 for i in xrange(postcount)]
+        return (heads, pf.get_uint(offset + size))
+
+    def _join_tails(self, heads, tailoffset):
+        # Reads the tails of a block's values from the positions file and
+        # returns the complete value strings
+        posf = self.posfile
+        postcount = len(heads)
+        lengths = posf.get_array(tailoffset, "I", postcount)
+        pos = tailoffset + _INT_SIZE * postcount
+        alltails = posf.map[pos:pos + sum(lengths)]
+
+        pos = 0
+        values = []
+        for head, length in zip(heads, lengths):
+            values.append(head + alltails[pos:pos + length])
+            pos += length
+        return values
+
     def _consume_block(self, offset):
         postcount = self.postcount
         ids, offset = self._read_ids(offset, postcount)
-        self.values = self._read_values(offset, self.nextoffset, postcount)
+        # Don't read the values until they're asked for; value() and
+        # value_as() decode them straight from the file map
+        self.valueoffset = offset
+        self.values = None
 
         self.i = 0
         self.ids = ids
@@ -16,14 +16,16 @@
 
 from threading import Lock
 
-from whoosh.fields import FieldConfigurationError
+from whoosh.fields import FieldConfigurationError, REVERSE_MARK
 from whoosh.filedb.filepostings import FilePostingReader
 from whoosh.filedb.filetables import (FileTableReader, FileRecordReader,
-                                      FileListReader, encode_termkey,
+                                      StoredFieldReader, PrefixTableReader,
+                                      VectorReader,
+                                      encode_termkey,
                                       decode_termkey, encode_vectorkey,
                                       decode_vectorkey, decode_terminfo,
-                                      depickle, unpackint)
-from whoosh.postings import Exclude
+                                      decode_storedfields, unpackint)
+from whoosh.postings import Exclude, CachedPostingReader
 from whoosh.reading import IndexReader, TermNotFound
 from whoosh.util import protected
 
@@ -32,7 +34,7 @@ from whoosh.util import protected
 
 def open_terms(storage, segment):
     termfile = storage.open_file(segment.term_filename)
-    return FileTableReader(termfile,
+    return PrefixTableReader(termfile,
                            keycoder=encode_termkey,
                            keydecoder=decode_termkey,
                            valuedecoder=decode_terminfo)
@@ -45,11 +47,10 @@ def open_doclengths(storage, segment, fieldcount):
 
 def open_storedfields(storage, segment, storedfieldnames):
     def dictifier(value):
-        value = depickle(value)
+        value = decode_storedfields(value)
         return dict(zip(storedfieldnames, value))
     listfile = storage.open_file(segment.docs_filename, mapped=False)
-    return FileListReader(listfile, segment.doc_count_all(),
-                          valuedecoder=dictifier)
+    return StoredFieldReader(listfile, valuedecoder=dictifier)
 
 def open_vectors(storage, segment):
     vectorfile = storage.open_file(segment.vector_filename)
@@ -72,8 +73,10 @@ class SegmentReader(IndexReader):
 
         self.termtable = open_terms(storage, segment)
         self.postfile = None
+        self.posfile = None
+        self._stored_field_names = schema.stored_field_names()
         self.docstable = open_storedfields(storage, segment,
-                                           schema.stored_field_names())
+                                           self._stored_field_names)
         self.doclengths = None
         if self._scorable_fields:
             self.doclengths = open_doclengths(storage, segment,
@@ -100,8 +103,11 @@ class SegmentReader(IndexReader):
         self.termtable.close()
         if self.postfile:
             self.postfile.close()
+        if self.posfile:
+            self.posfile.close()
         if self.vectortable:
             self.vectortable.close()
+            self.vectorreader.close()
         if self.doclengths:
             self.doclengths.close()
         self.is_closed = True
@@ -110,23 +116,50 @@ class SegmentReader(IndexReader):
         if not self.vectortable:
             storage, segment = self.storage, self.segment
             self.vectortable = open_vectors(storage, segment)
-            self.vpostfile = storage.open_file(segment.vectorposts_filename,
-                                               mapped=False)
+            vpostfile = storage.open_file(segment.vectorposts_filename)
+            vtermfile = storage.open_file(segment.vectorterms_filename)
+            self.vectorreader = VectorReader(vpostfile, vtermfile)
 
-    def vector(self, docnum, fieldid):
+    def _vector_items(self, docnum, fieldnum):
         self._open_vectors()
-        schema = self.schema
-        fieldnum = schema.to_number(fieldid)
-        vformat = schema[fieldnum].vector
-
+        vformat = self.schema[fieldnum].vector
         offset = self.vectortable[(docnum, fieldnum)]
-        return FilePostingReader(self.vpostfile, offset, vformat,
-                                 stringids=True)
+        return vformat, self.vectorreader.items(offset, vformat.posting_size)
+
+    def vector(self, docnum, fieldid):
+        fieldnum = self.schema.to_number(fieldid)
+        vformat, items = self._vector_items(docnum, fieldnum)
+        return CachedPostingReader(items, format=vformat)
+
+    def vector_as(self, astype, docnum, fieldid):
+        fieldnum = self.schema.to_number(fieldid)
+        vformat, items = self._vector_items(docnum, fieldnum)
+        decoder = vformat.decoder(astype)
+        return [(text, decoder(valuestring)) for text, valuestring in items]
 
     @protected
     def stored_fields(self, docnum):
         return self.docstable[docnum]
 
+    @protected
+    def stored_fields_many(self, docnums, fields=None):
+        names = self._stored_field_names
+        if fields is None:
+            positions = range(len(names))
+        else:
+            positions = sorted(names.index(name) for name in fields
+                               if name in names)
+
+        # Read the documents in order to keep file access sequential, and
+        # only unpickle the requested fields
+        raw = self.docstable.raw
+        found = {}
+        for docnum in sorted(set(docnums)):
+            values = decode_storedfields(raw(docnum), positions)
+            found[docnum] = dict((names[pos], value) for pos, value
+                                 in zip(positions, values))
+        return [found[docnum] for docnum in docnums]
+
     @protected
     def all_stored_fields(self):
         is_deleted = self.segment.is_deleted
@@ -194,12 +227,12 @@ class SegmentReader(IndexReader):
     def lexicon(self, fieldid):
         # The base class has a lexicon() implementation that uses iter_from()
         # and throws away the value, but overriding to use
-        # FileTableReader.keys_from() is much, much faster.
+        # PrefixTableReader.keys_from() is much, much faster.
 
         tt = self.termtable
         fieldid = self.schema.to_number(fieldid)
         for fn, t in tt.keys_from((fieldid, '')):
-            if fn != fieldid:
+            if fn != fieldid or t.startswith(REVERSE_MARK):
                 return
             yield t
 
@@ -207,12 +240,21 @@ class SegmentReader(IndexReader):
     def expand_prefix(self, fieldid, prefix):
         # The base class has an expand_prefix() implementation that uses
         # iter_from() and throws away the value, but overriding to use
-        # FileTableReader.keys_from() is much, much faster.
+        # PrefixTableReader.keys_from() is much, much faster.
 
         tt = self.termtable
         fieldid = self.schema.to_number(fieldid)
         for fn, t in tt.keys_from((fieldid, prefix)):
-            if fn != fieldid or not t.startswith(prefix):
+            if (fn != fieldid or not t.startswith(prefix)
+                or t.startswith(REVERSE_MARK)):
+                return
+            yield t
+
+    @protected
+    def terms_from(self, fieldid, text):
+        fieldid = self.schema.to_number(fieldid)
+        for fn, t in self.termtable.keys_from((fieldid, text)):
+            if fn != fieldid:
                 return
             yield t
 
@@ -232,9 +274,12 @@ class SegmentReader(IndexReader):
             exclude_docs = self.segment.deleted
 
         if not self.postfile:
-            self.postfile = self.storage.open_file(self.segment.posts_filename,
-                                                   mapped=False)
-        postreader = FilePostingReader(self.postfile, offset, format)
+            # All the posting readers for this segment share the same file
+            # objects (and so the same memory maps)
+            self.postfile = self.storage.open_file(self.segment.posts_filename)
+            self.posfile = self.storage.open_file(self.segment.positions_filename)
+        postreader = FilePostingReader(self.postfile, offset, format,
+                                       posfile=self.posfile)
         if exclude_docs:
             postreader = Exclude(postreader, exclude_docs)
         return postreader
@@ -53,6 +53,7 @@ class FileStorage(Storage):
         return f
 
     def open_file(self, name, *args, **kwargs):
+        kwargs.setdefault("mapped", self.mapped)
         f = StructFile(open(self._fpath(name), "rb"), *args, **kwargs)
         f._name = name
         return f
@@ -158,7 +159,13 @@ class RamStorage(FileStorage):
     def open_file(self, name, *args, **kwargs):
         if name not in self.files:
             raise NameError
-        return StructFile(StringIO(self.files[name]), *args, **kwargs)
+        content = self.files[name]
+        f = StructFile(StringIO(content), *args, **kwargs)
+        if kwargs.get("mapped", True):
+            # The file contents are already in memory, so decode from them
+            # directly
+            f.set_map(content)
+        return f
 
     def lock(self, name):
         if name not in self.locks:
@@ -15,18 +15,21 @@
 #===============================================================================
 
 """This module defines writer and reader classes for a fast, immutable
-on-disk key-value database format. The current format is identical
-to D. J. Bernstein's CDB format (http://cr.yp.to/cdb.html).
+on-disk key-value database format. The hash table format is identical
+to D. J. Bernstein's CDB format (http://cr.yp.to/cdb.html). The prefix table
+format stores sorted keys front-coded in small blocks.
 """
 
 from array import array
-from bisect import bisect_right
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
 from cPickle import dumps, loads
 from struct import Struct
+from zlib import compress, decompress
 
 from whoosh.system import _USHORT_SIZE, _INT_SIZE
-from whoosh.util import utf8encode, utf8decode
+from whoosh.util import (utf8encode, utf8decode, varint, first_diff,
+                         LRUCache)
 
 
 def cdb_hash(key):
@@ -87,12 +90,149 @@ def encode_terminfo(cf_offset_df):
     return _terminfo_pack(*cf_offset_df)
 decode_terminfo = _terminfo_struct.unpack
 
+def decode_varint_at(s, pos):
+    """Decodes a variable-length integer starting at the given position in
+    string s, and returns a tuple of (integer, position after the integer).
+    """
+    b = ord(s[pos])
+    pos += 1
+    i = b & 0x7F
+    shift = 7
+    while b & 0x80 != 0:
+        b = ord(s[pos])
+        pos += 1
+        i |= (b & 0x7F) << shift
+        shift += 7
+    return i, pos
+
 def enpickle(data):
     "Encodes a value as a string for storage in a table."
     return dumps(data, -1)
 
 depickle = loads
 
+_long_struct = Struct("!q")
+_double_struct = Struct("!d")
+_MIN_LONG = -(2 ** 63)
+_MAX_LONG = 2 ** 63 - 1
+
+def _encode_value(value, output):
+    # Appends the encoding of the value to the output list. Each encoded value
+    # starts with a one-character type code.
+    if value is None:
+        output.append("n")
+    elif isinstance(value, bool):
+        output.append(value and "t" or "f")
+    elif isinstance(value, (int, long)):
+        if _MIN_LONG <= value <= _MAX_LONG:
+            output.append("i" + _long_struct.pack(value))
+        else:
+            s = str(value)
+            output.append("I" + varint(len(s)) + s)
+    elif isinstance(value, float):
+        output.append("d" + _double_struct.pack(value))
+    elif isinstance(value, unicode):
+        s = value.encode("utf8")
+        output.append("u" + varint(len(s)) + s)
+    elif isinstance(value, str):
+        output.append("s" + varint(len(value)) + value)
+    elif isinstance(value, (list, tuple)):
+        output.append((isinstance(value, list) and "l" or "T")
+                      + varint(len(value)))
+        for v in value:
+            _encode_value(v, output)
+    elif isinstance(value, dict):
+        output.append("D" + varint(len(value)))
+        for k, v in value.iteritems():
+            _encode_value(k, output)
+            _encode_value(v, output)
+    else:
+        # Fall back to pickling other types (datetimes, sets, etc.)
+        s = dumps(value, -1)
+        output.append("p" + varint(len(s)) + s)
+
+def _decode_value(s, pos):
+    # Decodes the value starting at the given position in the string, and
+    # returns a tuple of (value, position after the value)
+    code = s[pos]
+    pos += 1
+    if code == "n":
+        return None, pos
+    elif code == "t":
+        return True, pos
+    elif code == "f":
+        return False, pos
+    elif code == "i":
+        return _long_struct.unpack(s[pos:pos + 8])[0], pos + 8
+    elif code == "d":
+        return _double_struct.unpack(s[pos:pos + 8])[0], pos + 8
+    elif code in "usIp":
+        length, pos = decode_varint_at(s, pos)
+        v = s[pos:pos + length]
+        if code == "u":
+            v = v.decode("utf8")
+        elif code == "I":
+            v = long(v)
+        elif code == "p":
+            v = loads(v)
+        return v, pos + length
+    elif code in "lT":
+        length, pos = decode_varint_at(s, pos)
+        items = []
+        for _ in xrange(length):
+            v, pos = _decode_value(s, pos)
+            items.append(v)
+        if code == "T":
+            items = tuple(items)
+        return items, pos
+    elif code == "D":
+        length, pos = decode_varint_at(s, pos)
+        d = {}
+        for _ in xrange(length):
+            k, pos = _decode_value(s, pos)
+            d[k], pos = _decode_value(s, pos)
+        return d, pos
+    else:
+        raise ValueError("Unknown stored value type %r" % code)
+
+def encode_value(value):
+    """Encodes a stored field value as a string. None, bool, int, long,
+    float, str, and unicode values, and lists, tuples, and dicts of them, are
+    encoded without using pickle. Any other value is pickled, so it must be
+    pickle-able.
+    """
+    output = []
+    _encode_value(value, output)
+    return "".join(output)
+
+def decode_value(s):
+    """Decodes a string created by :func:`encode_value`.
+    """
+    return _decode_value(s, 0)[0]
+
+def encode_storedfields(values):
+    """Encodes a list of stored field values as a string, encoding each value
+    separately so a reader can decode only the values it needs.
+    """
+    encoded = [encode_value(v) for v in values]
+    lengths = [len(e) for e in encoded]
+    header = Struct("!H%dI" % len(encoded)).pack(len(encoded), *lengths)
+    return header + "".join(encoded)
+
+def decode_storedfields(s, positions=None):
+    """Decodes a string created by :func:`encode_storedfields`. If
+    ``positions`` is given, only the values at those positions are decoded.
+    """
+    count = unpackushort(s[:_USHORT_SIZE])
+    lengths = Struct("!%dI" % count).unpack(s[_USHORT_SIZE:_USHORT_SIZE + _INT_SIZE * count])
+    if positions is None:
+        positions = xrange(count)
+
+    offsets = [_USHORT_SIZE + _INT_SIZE * count]
+    for length in lengths:
+        offsets.append(offsets[-1] + length)
+    return [decode_value(s[offsets[i]:offsets[i + 1]]) for i in positions]
+
 
 # Table classes
 
@@ -426,6 +566,221 @@ class FileTableReader(OrderedHashReader):
             yield kd(k)
 
 
+class PrefixTableWriter(object):
+    """Writes an ordered key-value table where the keys are front-coded: the
+    keys are split into blocks of ``blocksize`` entries, and each key after the
+    first one in a block is stored as the length of the prefix it shares with
+    the previous key followed by the remaining suffix. This makes tables with
+    many similar keys (such as the term table for URL or ID fields) much
+    smaller than the hash table format, at the cost of having to decode a
+    block to look up a key.
+    
+    The first key of each block and the block offsets are kept in an index at
+    the end of the file, so a key can be found by bisecting the index and then
+    decoding a single block.
+    """
+
+    def __init__(self, dbfile, keycoder=None, valuecoder=None, blocksize=32):
+        """
+        :param dbfile: the :class:`~whoosh.filedb.structfile.StructFile` to
+            write to.
+        :param keycoder: a function to encode keys as strings.
+        :param valuecoder: a function to encode values as strings.
+        :param blocksize: the number of keys in each front-coded block.
+        """
+
+        self.dbfile = dbfile
+        self.keycoder = keycoder or str
+        self.valuecoder = valuecoder or enpickle
+        self.blocksize = blocksize
+
+        self.blockkeys = []
+        self.blockpositions = []
+        self.blockcount = 0
+        self.lastkey = None
+
+        # Place holder for the position of the block index
+        dbfile.write_uint(0)
+
+    def add_all(self, items):
+        """Adds a sequence of (key, value) pairs, where both the key and value
+        are already-encoded strings. The keys must be in increasing order.
+        """
+
+        dbfile = self.dbfile
+        write = dbfile.write
+        blockkeys = self.blockkeys
+        blockpositions = self.blockpositions
+        bs = self.blocksize
+        bc = self.blockcount
+        lk = self.lastkey
+
+        for key, value in items:
+            if lk is not None and key <= lk:
+                raise ValueError("Keys must increase: %r .. %r" % (lk, key))
+
+            if lk is None or bc == bs:
+                # Start a new block with the full key
+                blockkeys.append(key)
+                blockpositions.append(dbfile.tell())
+                bc = 0
+                prefix = 0
+            else:
+                prefix = first_diff(lk, key)
+
+            write(chr(prefix) + varint(len(key) - prefix) + key[prefix:]
+                  + varint(len(value)) + value)
+            bc += 1
+            lk = key
+
+        self.blockcount = bc
+        self.lastkey = lk
+
+    def add(self, key, data):
+        self.add_all(((self.keycoder(key), self.valuecoder(data)),))
+
+    def close(self):
+        dbfile = self.dbfile
+        indexpos = dbfile.tell()
+        dbfile.write_pickle((self.blockkeys, self.blockpositions))
+        dbfile.flush()
+        dbfile.seek(0)
+        dbfile.write_uint(indexpos)
+        dbfile.close()
+
+
+class PrefixTableReader(object):
+    """Reads a table written by :class:`PrefixTableWriter`. The interface is
+    the same as :class:`FileTableReader`.
+    """
+
+    def __init__(self, dbfile, keycoder=None, keydecoder=None,
+                 valuedecoder=None):
+        self.dbfile = dbfile
+        self.map = dbfile.map
+        self.keycoder = keycoder or str
+        self.keydecoder = keydecoder or int
+        self.valuedecoder = valuedecoder or depickle
+        self.is_closed = False
+
+        self.end_of_data = dbfile.get_uint(0)
+        dbfile.seek(self.end_of_data)
+        self.blockkeys, self.blockpositions = dbfile.read_pickle()
+
+        # The most recently decoded block, as (blocknum, keys, values)
+        self._current = (None, None, None)
+
+    def close(self):
+        if self.is_closed:
+            raise Exception("Tried to close %r twice" % self)
+        del self.map
+        self.dbfile.close()
+        self.is_closed = True
+
+    def _block(self, blocknum):
+        # Decodes the given block into a list of keys and a list of values,
+        # remembering the last decoded block since lookups tend to cluster.
+
+        current = self._current
+        if current[0] == blocknum:
+            return current[1], current[2]
+
+        positions = self.blockpositions
+        start = positions[blocknum]
+        if blocknum + 1 < len(positions):
+            end = positions[blocknum + 1]
+        else:
+            end = self.end_of_data
+        data = self.map[start:end]
+
+        keys = []
+        values = []
+        lastkey = ""
+        pos = 0
+        datalen = len(data)
+        while pos < datalen:
+            prefix = ord(data[pos])
+            length, pos = decode_varint_at(data, pos + 1)
+            lastkey = lastkey[:prefix] + data[pos:pos + length]
+            keys.append(lastkey)
+            length, pos = decode_varint_at(data, pos + length)
+            values.append(data[pos:pos + length])
+            pos += length
+
+        self._current = (blocknum, keys, values)
+        return keys, values
+
+    def _locate(self, key):
+        # Returns the block number and the position within the block of the
+        # first key greater than or equal to the given key.
+        blocknum = max(0, bisect_right(self.blockkeys, key) - 1)
+        keys, _ = self._block(blocknum)
+        return blocknum, bisect_left(keys, key)
+
+    def _raw_get(self, key):
+        if not self.blockkeys:
+            raise KeyError(key)
+        blocknum, i = self._locate(key)
+        keys, values = self._block(blocknum)
+        if i < len(keys) and keys[i] == key:
+            return values[i]
+        raise KeyError(key)
+
+    def _raw_items(self, blocknum=0, i=0):
+        for b in xrange(blocknum, len(self.blockkeys)):
+            keys, values = self._block(b)
+            for j in xrange(i, len(keys)):
+                yield (keys[j], values[j])
+            i = 0
+
+    def _raw_items_from(self, key):
+        if not self.blockkeys:
+            return iter(())
+        blocknum, i = self._locate(key)
+        return self._raw_items(blocknum, i)
+
+    def __iter__(self):
+        return self.items()
+
+    def __getitem__(self, key):
+        return self.valuedecoder(self._raw_get(self.keycoder(key)))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self._raw_get(self.keycoder(key))
+            return True
+        except KeyError:
+            return False
+
+    def items(self):
+        kd = self.keydecoder
+        vd = self.valuedecoder
+        for key, value in self._raw_items():
+            yield (kd(key), vd(value))
+
+    def items_from(self, key):
+        kd = self.keydecoder
+        vd = self.valuedecoder
+        for k, value in self._raw_items_from(self.keycoder(key)):
+            yield (kd(k), vd(value))
+
+    def keys(self):
+        kd = self.keydecoder
+        for key, _ in self._raw_items():
+            yield kd(key)
+
+    def keys_from(self, key):
+        kd = self.keydecoder
+        for k, _ in self._raw_items_from(self.keycoder(key)):
+            yield kd(k)
+
+
 class FileRecordWriter(object):
     def __init__(self, dbfile, format):
         self.dbfile = dbfile
@@ -496,11 +851,298 @@ class FileListReader(object):
         self.dbfile.close()
 
     def __getitem__(self, num):
+        return self.valuedecoder(self.raw(num))
+
+    def raw(self, num):
+        """Returns the encoded value string for the given item number without
+        decoding it.
+        """
         dbfile = self.dbfile
         offset = self.offset + num * (_INT_SIZE * 2)
         position, length = unpack2ints(dbfile.map[offset:offset + _INT_SIZE * 2])
-        v = dbfile.map[position:position + length]
-        return self.valuedecoder(v)
+        return dbfile.map[position:position + length]
+
+
+class StoredFieldWriter(object):
+    """Writes the stored fields of each document, grouping the documents into
+    blocks which are compressed with zlib.
+    """
+
+    def __init__(self, dbfile, blocksize=16 * 1024, compression=3):
+        """
+        :param dbfile: the StructFile to write to.
+        :param blocksize: the approximate size in bytes of the uncompressed
+            data in each block.
+        :param compression: the zlib compression level (1-9), or 0 to not
+            compress the blocks.
+        """
+
+        self.dbfile = dbfile
+        self.blocksize = blocksize
+        self.compression = compression
+        dbfile.write_uint(0)
+
+        self.docnum = 0
+        self.firstdocs = array("I")
+        self.offsets = array("I")
+        self._reset_block()
+
+    def _reset_block(self):
+        self.blockdocs = []
+        self.blocklength = 0
+
+    def _write_block(self):
+        f = self.dbfile
+        docs = self.blockdocs
+        self.firstdocs.append(self.docnum - len(docs))
+        self.offsets.append(f.tell())
+
+        header = Struct("!I%dI" % len(docs)).pack(len(docs),
+                                                   *[len(d) for d in docs])
+        data = header + "".join(docs)
+        if self.compression:
+            data = compress(data, self.compression)
+        f.write(data)
+        self._reset_block()
+
+    def append(self, values):
+        """Adds the stored field values (a list in stored field order) of the
+        next document.
+        """
+
+        self.append_encoded(encode_storedfields(values))
+
+    def append_encoded(self, encoded):
+        """Adds the stored field values of the next document, already encoded
+        with :func:`encode_storedfields`.
+        """
+
+        self.blockdocs.append(encoded)
+        self.blocklength += len(encoded)
+        self.docnum += 1
+        if self.blocklength >= self.blocksize:
+            self._write_block()
+
+    def close(self):
+        if self.blockdocs:
+            self._write_block()
+
+        f = self.dbfile
+        directory_pos = f.tell()
+        f.write_byte(self.compression)
+        f.write_uint(len(self.offsets))
+        f.write_array(self.firstdocs)
+        f.write_array(self.offsets)
+        f.flush()
+        f.seek(0)
+        f.write_uint(directory_pos)
+        f.close()
+
+
+class StoredFieldReader(object):
+    """Reads the stored fields written by :class:`StoredFieldWriter`. Keeps a
+    small least-recently-used cache of decompressed blocks, so reading
+    documents that are close together (such as the hits on a page of search
+    results, read in sorted order) only decompresses each block once.
+    """
+
+    def __init__(self, dbfile, valuedecoder=decode_storedfields, cachesize=8):
+        """
+        :param dbfile: the StructFile to read from.
+        :param valuedecoder: a function to decode the encoded stored fields
+            of a document returned by :meth:`StoredFieldReader.raw`.
+        :param cachesize: the number of decompressed blocks to keep in memory.
+        """
+
+        self.dbfile = dbfile
+        self.valuedecoder = valuedecoder
+        self.cache = LRUCache(cachesize)
+
+        self.directory_pos = dbfile.get_uint(0)
+        self.compression = dbfile.get_byte(self.directory_pos)
+        blockcount = dbfile.get_uint(self.directory_pos + 1)
+        pos = self.directory_pos + 1 + _INT_SIZE
+        self.firstdocs = dbfile.get_array(pos, "I", blockcount)
+        pos += _INT_SIZE * blockcount
+        self.offsets = dbfile.get_array(pos, "I", blockcount)
+
+    def close(self):
+        self.dbfile.close()
+
+    def __getitem__(self, docnum):
+        return self.valuedecoder(self.raw(docnum))
+
+    def _block(self, blocknum):
+        # Returns a tuple of (list of document positions, data) for the given
+        # block, decompressing it if it's not in the cache
+        block = self.cache.get(blocknum)
+        if block is None:
+            start = self.offsets[blocknum]
+            if blocknum < len(self.offsets) - 1:
+                end = self.offsets[blocknum + 1]
+            else:
+                end = self.directory_pos
+            data = self.dbfile.map[start:end]
+            if self.compression:
+                data = decompress(data)
+
+            count = unpackint(data[:_INT_SIZE])
+            lengths = Struct("!%dI" % count).unpack(data[_INT_SIZE:_INT_SIZE * (count + 1)])
+            positions = [_INT_SIZE * (count + 1)]
+            for length in lengths:
+                positions.append(positions[-1] + length)
+
+            block = (positions, data)
+            self.cache[blocknum] = block
+        return block
+
+    def raw(self, docnum):
+        """Returns the encoded stored fields of the given document without
+        decoding them.
+        """
+
+        blocknum = bisect_right(self.firstdocs, docnum) - 1
+        if blocknum < 0:
+            raise IndexError(docnum)
+        positions, data = self._block(blocknum)
+        i = docnum - self.firstdocs[blocknum]
+        if i >= len(positions) - 1:
+            raise IndexError(docnum)
+        return data[positions[i]:positions[i + 1]]
+
+
+class VectorWriter(object):
+    """Writes term vectors in a compact format. Instead of repeating the text
+    of each term in every document, each term is assigned an ordinal number
+    the first time it's seen in the segment, and each vector is written as a
+    single contiguous record of (ordinal, value) pairs. The term texts are
+    written once each to a separate terms file.
+    """
+
+    def __init__(self, dbfile, termfile):
+        """
+        :param dbfile: the StructFile to write the vector records to.
+        :param termfile: the StructFile to write the term texts to.
+        """
+
+        self.dbfile = dbfile
+        self.termfile = termfile
+        termfile.write_uint(0)
+
+        self.ordinals = {}
+        self.termoffsets = array("I")
+
+    def _add_term(self, text):
+        ordinal = len(self.termoffsets)
+        self.termoffsets.append(self.termfile.tell())
+        self.termfile.write(utf8encode(text)[0])
+        self.ordinals[text] = ordinal
+        return ordinal
+
+    def add(self, items, posting_size):
+        """Writes a term vector and returns its offset in the vector file.
+        
+        :param items: a sequence of (unicode text, encoded value) pairs, in
+            sorted order.
+        :param posting_size: the ``posting_size`` attribute of the vector's
+            format. Fixed-size values are written without their length, and
+            zero-length values aren't written at all.
+        """
+
+        ordinals = self.ordinals
+        output = []
+        count = 0
+        for text, valuestring in items:
+            assert isinstance(text, unicode), "%r is not unicode" % text
+            ordinal = ordinals.get(text)
+            if ordinal is None:
+                ordinal = self._add_term(text)
+            output.append(varint(ordinal))
+            if posting_size < 0:
+                output.append(varint(len(valuestring)))
+            if posting_size != 0:
+                output.append(valuestring)
+            count += 1
+
+        record = varint(count) + "".join(output)
+        f = self.dbfile
+        offset = f.tell()
+        f.write_varint(len(record))
+        f.write(record)
+        return offset
+
+    def close(self):
+        termfile = self.termfile
+        self.termoffsets.append(termfile.tell())
+        directory_pos = termfile.tell()
+        termfile.write_array(self.termoffsets)
+        termfile.flush()
+        termfile.seek(0)
+        termfile.write_uint(directory_pos)
+        termfile.close()
+        self.dbfile.close()
+
+
+class VectorReader(object):
+    """Reads the term vectors written by :class:`VectorWriter`.
+    """
+
+    def __init__(self, dbfile, termfile):
+        """
+        :param dbfile: the StructFile to read the vector records from.
+        :param termfile: the StructFile to read the term texts from.
+        """
+
+        self.dbfile = dbfile
+        self.termfile = termfile
+        self.directory_pos = termfile.get_uint(0)
+        # Cache of decoded term texts, keyed by ordinal
+        self.terms = {}
+
+    def close(self):
+        self.dbfile.close()
+        self.termfile.close()
+
+    def term(self, ordinal):
+        """Returns the unicode text of the term with the given ordinal.
+        """
+
+        terms = self.terms
+        if ordinal in terms:
+            return terms[ordinal]
+
+        termfile = self.termfile
+        pos = self.directory_pos + ordinal * _INT_SIZE
+        start = termfile.get_uint(pos)
+        end = termfile.get_uint(pos + _INT_SIZE)
+        text = utf8decode(termfile.map[start:end])[0]
+        terms[ordinal] = text
+        return text
+
+    def items(self, offset, posting_size):
+        """Returns a list of (unicode text, encoded value) pairs for the term
+        vector at the given offset.
+        
+        :param posting_size: the ``posting_size`` attribute of the vector's
+            format.
+        """
+
+        dbfile = self.dbfile
+        length, pos = decode_varint_at(dbfile.map, offset)
+        record = dbfile.map[pos:pos + length]
+
+        term = self.term
+        count, pos = decode_varint_at(record, 0)
+        items = []
+        for _ in xrange(count):
+            ordinal, pos = decode_varint_at(record, pos)
+            if posting_size < 0:
+                size, pos = decode_varint_at(record, pos)
+            else:
+                size = posting_size
+            items.append((term(ordinal), record[pos:pos + size]))
+            pos += size
+        return items
 
 
 # Utility functions
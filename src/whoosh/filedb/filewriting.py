@@ -17,18 +17,22 @@
 from array import array
 from collections import defaultdict
 
-from whoosh.fields import UnknownFieldError
+from whoosh.fields import UnknownFieldError, reverse_term
 from whoosh.store import LockError
-from whoosh.writing import IndexWriter
 from whoosh.filedb import postpool
 from whoosh.support.filelock import try_for
 from whoosh.filedb.fileindex import SegmentDeletionMixin, Segment, SegmentSet
 from whoosh.filedb.filepostings import FilePostingWriter
-from whoosh.filedb.filetables import (FileTableWriter, FileListWriter,
-                                      FileRecordWriter, encode_termkey,
+from whoosh.filedb.filetables import (FileTableWriter, StoredFieldWriter,
+                                      FileRecordWriter, PrefixTableWriter,
+                                      VectorWriter,
+                                      encode_termkey,
                                       encode_vectorkey, encode_terminfo,
-                                      enpickle, packint)
+                                      encode_storedfields, packint)
+from whoosh.ramdb.ramindex import RamIndex
+from whoosh.reading import MultiReader
 from whoosh.util import fib
+from whoosh.writing import IndexWriter, IndexingError
 
 
 DOCLENGTH_TYPE = "H"
@@ -80,13 +84,35 @@ def OPTIMIZE(ix, writer, segments):
 
 def create_terms(storage, segment):
     termfile = storage.create_file(segment.term_filename)
-    return FileTableWriter(termfile,
+    return PrefixTableWriter(termfile,
                            keycoder=encode_termkey,
                            valuecoder=encode_terminfo)
 
-def create_storedfields(storage, segment):
+def _check_compatible(schema, ixschema):
+    # Raises an IndexingError if the postings, vectors, and stored fields
+    # written with the first schema couldn't be read with the second. The
+    # analyzers don't matter because the terms have already been produced.
+    if schema.field_names() != ixschema.field_names():
+        raise IndexingError("The field names %r don't match the index's %r"
+                            % (schema.field_names(), ixschema.field_names()))
+    for name, field in schema.fields():
+        ixfield = ixschema[name]
+        for attr in ("format", "vector"):
+            f1, f2 = getattr(field, attr), getattr(ixfield, attr)
+            if f1.__class__ is not f2.__class__:
+                raise IndexingError("The %s of field %r (%s) doesn't match "
+                                    "the index (%s)"
+                                    % (attr, name, f1.__class__.__name__,
+                                       f2.__class__.__name__))
+        for attr in ("scorable", "stored", "reverse", "bigrams"):
+            if getattr(field, attr) != getattr(ixfield, attr):
+                raise IndexingError("Field %r has %s=%r but the index has "
+                                    "%r" % (name, attr, getattr(field, attr),
+                                            getattr(ixfield, attr)))
+
+def create_storedfields(storage, segment, compression=3):
     listfile = storage.create_file(segment.docs_filename)
-    return FileListWriter(listfile, valuecoder=enpickle)
+    return StoredFieldWriter(listfile, compression=compression)
 
 def create_vectors(storage, segment):
     vectorfile = storage.create_file(segment.vector_filename)
@@ -106,7 +132,7 @@ class FileIndexWriter(SegmentDeletionMixin, IndexWriter):
     # multiple SegmentWriters during merging/optimizing.
 
     def __init__(self, ix, postlimit=32 * 1024 * 1024, blocklimit=128,
-                 timeout=0.0, delay=0.1):
+                 timeout=0.0, delay=0.1, compression=3, nrt=False):
         """
         :param ix: the Index object you want to write to.
         :param postlimit: Essentially controls the maximum amount of memory the
@@ -115,6 +141,12 @@ class FileIndexWriter(SegmentDeletionMixin, IndexWriter):
             overhead). The default (32MB) is a bit small. You may want to
             increase this value for very large collections, e.g.
             ``postlimit=256*1024*1024``.
+        :param compression: the zlib compression level (1-9) for the blocks of
+            stored fields, or 0 to not compress them.
+        :param nrt: if True, the writer also keeps the documents you add in an
+            in-memory index, so you can search them before they're committed
+            with :meth:`FileIndexWriter.nrt_searcher`. This uses more memory
+            while indexing.
         """
 
         self.lock = ix.storage.lock(ix.indexname + "_LOCK")
@@ -125,26 +157,138 @@ class FileIndexWriter(SegmentDeletionMixin, IndexWriter):
         self.segments = ix.segments.copy()
         self.postlimit = postlimit
         self.blocklimit = blocklimit
+        self.compression = compression
+        self.nrt = nrt
         self._segment_writer = None
         self._searcher = ix.searcher()
 
+        # SegmentReaders for the committed segments, keyed by segment name,
+        # shared by the readers returned by nrt_reader(). Readers replaced
+        # after a deletion are kept in _old_nrt_readers until the writer is
+        # finished, since earlier NRT readers may still be using them.
+        self._nrt_readers = {}
+        self._old_nrt_readers = []
+
     def _finish(self):
         self._close_reader()
+        self._close_nrt_readers()
         self.lock.release()
         self._segment_writer = None
 
+    def _close_nrt_readers(self):
+        for reader in self._nrt_readers.values() + self._old_nrt_readers:
+            reader.close()
+        self._nrt_readers = {}
+        self._old_nrt_readers = []
+
+    def delete_document(self, docnum, delete=True):
+        SegmentDeletionMixin.delete_document(self, docnum, delete=delete)
+
+        # The cached NRT reader for the segment no longer matches its
+        # deletions, so the next call to nrt_reader() opens a new one
+        segment, _ = self.segments._segment_and_docnum(docnum)
+        reader = self._nrt_readers.pop(segment.name, None)
+        if reader is not None:
+            self._old_nrt_readers.append(reader)
+
     def segment_writer(self):
         """Returns the underlying SegmentWriter object.
         """
 
         if not self._segment_writer:
+            buffer = None
+            if self.nrt:
+                buffer = RamIndex(self.index.schema)
             self._segment_writer = SegmentWriter(self.index, self.postlimit,
-                                                 self.blocklimit)
+                                                 self.blocklimit,
+                                                 compression=self.compression,
+                                                 buffer=buffer)
         return self._segment_writer
 
     def add_document(self, **fields):
         self.segment_writer().add_document(fields)
 
+    def add_ramindex(self, ramindex):
+        """Writes the documents in a :class:`whoosh.ramdb.ramindex.RamIndex`
+        into a new segment of this index, without re-analyzing them. The new
+        segment becomes part of the index when this writer is committed. This
+        allows indexing into RAM and periodically checkpointing to disk:
+        
+        >>> ram = RamIndex(ix.schema)
+        >>> ramwriter = ram.writer()
+        >>> ramwriter.add_document(title=u"breaking news")
+        >>> writer = ix.writer()
+        >>> writer.add_ramindex(ram)
+        >>> writer.commit()
+        
+        Documents deleted in the RamIndex are not written.
+        """
+
+        _check_compatible(ramindex.schema, self.index.schema)
+
+        sw = SegmentWriter(self.index, self.postlimit, self.blocklimit,
+                           compression=self.compression)
+        try:
+            sw.add_ramindex(ramindex)
+        except:
+            sw._close_all()
+            raise
+        sw.close()
+        if sw.max_doc:
+            self.segments.append(sw.segment())
+
+    def nrt_reader(self):
+        """Returns a reader for the committed segments (with any deletions
+        made through this writer) combined with the documents added to this
+        writer but not committed yet. The writer must have been created with
+        ``nrt=True``.
+        
+        The reader sees the documents that were added when it was created, so
+        to see newer documents get a new reader. Documents added to this writer
+        are numbered after the committed documents.
+        
+        The readers for the committed segments are opened once and shared by
+        all the readers this method returns, until documents in a segment are
+        deleted. They stay open until the writer is committed or cancelled.
+        """
+
+        if not self.nrt:
+            raise IndexingError("This writer was not created with nrt=True")
+
+        from whoosh.filedb.filereading import SegmentReader
+
+        ix = self.index
+        schema = ix.schema
+        segments = self.segments
+        cache = self._nrt_readers
+        readers = []
+        for segment in segments:
+            reader = cache.get(segment.name)
+            if reader is None:
+                # Open the reader on a copy of the segment, so later deletions
+                # through this writer don't change what it sees
+                reader = cache[segment.name] = SegmentReader(ix.storage,
+                                                             segment.copy(),
+                                                             schema)
+            readers.append(reader)
+        offsets = segments.doc_offsets()
+        readers.append(self.segment_writer().buffer.reader())
+        offsets.append(segments.doc_count_all())
+        return _NrtReader(readers, offsets, schema)
+
+    def nrt_searcher(self, **kwargs):
+        """Returns a :class:`whoosh.searching.Searcher` for the reader
+        returned by :meth:`FileIndexWriter.nrt_reader`. Keyword arguments are
+        passed to the Searcher.
+        
+        >>> writer = ix.writer(nrt=True)
+        >>> writer.add_document(title=u"breaking news")
+        >>> searcher = writer.nrt_searcher()
+        """
+
+        from whoosh.searching import Searcher
+        return Searcher(self.nrt_reader(), **kwargs)
+
     def commit(self, mergetype=MERGE_SMALL):
         """Finishes writing and unlocks the index.
         
@@ -173,6 +317,15 @@ class FileIndexWriter(SegmentDeletionMixin, IndexWriter):
         self.segments = new_segments
 
 
+class _NrtReader(MultiReader):
+    # The reader returned by FileIndexWriter.nrt_reader(). The segment readers
+    # belong to the writer, which closes them when it's finished, so closing
+    # this reader leaves them open.
+
+    def close(self):
+        self.is_closed = True
+
+
 class SegmentWriter(object):
     """Do not instantiate this object directly; it is created by the
     IndexWriter object.
@@ -181,15 +334,22 @@ class SegmentWriter(object):
     fields, handles the posting pool, and writes out the term index.
     """
 
-    def __init__(self, ix, postlimit, blocklimit, name=None):
+    def __init__(self, ix, postlimit, blocklimit, name=None, compression=3,
+                 buffer=None):
         """
         :param ix: the Index object in which to write the new segment.
         :param postlimit: the maximum size for a run in the posting pool.
         :param blocklimit: the maximum number of postings in a posting block.
         :param name: the name of the segment.
+        :param compression: the zlib compression level for the stored fields.
+        :param buffer: an optional :class:`whoosh.ramdb.ramindex.RamIndex`.
+            If this is given, the analyzed contents of each document added with
+            add_document() are also added to it, so the documents can be
+            searched before the segment is written.
         """
 
         self.index = ix
+        self.buffer = buffer
         self.schema = ix.schema
         self.storage = storage = ix.storage
         self.name = name or ix._next_segment_name()
@@ -215,20 +375,24 @@ class SegmentWriter(object):
         # we only have to do it in one place).
         tempseg = Segment(self.name, 0, 0, None)
         self.termtable = create_terms(storage, tempseg)
-        self.docslist = create_storedfields(storage, tempseg)
+        self.docslist = create_storedfields(storage, tempseg,
+                                            compression=compression)
         self.doclengths = None
         if self.schema.scorable_fields():
             self.doclengths = create_doclengths(storage, tempseg, len(self._scorable_to_pos))
 
         postfile = storage.create_file(tempseg.posts_filename)
-        self.postwriter = FilePostingWriter(postfile, blocklimit=blocklimit)
+        posfile = storage.create_file(tempseg.positions_filename)
+        self.postwriter = FilePostingWriter(postfile, blocklimit=blocklimit,
+                                            posfile=posfile)
 
         self.vectortable = None
         if self.schema.has_vectored_fields():
             # Table associating document fields with (postoffset, postcount)
             self.vectortable = create_vectors(storage, tempseg)
             vpostfile = storage.create_file(tempseg.vectorposts_filename)
-            self.vpostwriter = FilePostingWriter(vpostfile, stringids=True)
+            vtermfile = storage.create_file(tempseg.vectorterms_filename)
+            self.vectorwriter = VectorWriter(vpostfile, vtermfile)
 
         # Keep track of the total number of tokens (across all docs)
         # in each field
@@ -248,7 +412,7 @@ class SegmentWriter(object):
 
         if self.vectortable:
             self.vectortable.close()
-            self.vpostwriter.close()
+            self.vectorwriter.close()
 
     def close(self):
         """Finishes writing the segment (flushes the posting pool out to disk)
@@ -326,10 +490,82 @@ class SegmentWriter(object):
                 freq = decoder(valuestring)
                 self.pool.add_posting(fieldnum, text, newdoc, freq, valuestring)
 
+    def add_ramindex(self, ramindex):
+        """Writes the documents in a :class:`whoosh.ramdb.ramindex.RamIndex`
+        to this segment, leaving out deleted documents. The RamIndex already
+        has sorted terms, postings, field lengths and vectors, so they are
+        written directly instead of re-analyzing the documents and sorting the
+        postings through the posting pool. This must be the only content of
+        the segment.
+        """
+
+        if self.max_doc:
+            raise IndexingError("add_ramindex() needs an empty segment")
+
+        # Work from a reader so documents added while this runs are ignored
+        reader = ramindex.reader()
+        schema = self.schema
+        deleted = reader.deleted
+        scorable_fieldnums = schema.scorable_fields()
+        vectored_fieldnums = schema.vectored_fields()
+
+        # Copy the document data, and map the document numbers in the RamIndex
+        # to numbers in this segment, or -1 for deleted documents
+        doc_map = array("i")
+        for docnum in xrange(reader.maxdoc):
+            if docnum in deleted:
+                doc_map.append(-1)
+                continue
+            doc_map.append(self.max_doc)
+
+            fieldlengths = array(DOCLENGTH_TYPE)
+            for fieldnum in scorable_fieldnums:
+                length = reader.doc_field_length(docnum, fieldnum)
+                self.field_length_totals[fieldnum] += length
+                fieldlengths.append(min(length, DOCLENGTH_LIMIT))
+            self._add_doc_data(reader.storedfields[docnum], fieldlengths)
+
+            for fieldnum in vectored_fieldnums:
+                vlist = reader.vectors.get((docnum, fieldnum))
+                if vlist is not None:
+                    self._add_vector(fieldnum, vlist)
+
+            self.max_doc += 1
+
+        # Write the postings of each term in (field number, text) order, the
+        # same order they would come out of the posting pool
+        termtable = self.termtable
+        postwriter = self.postwriter
+        maxdoc = reader.maxdoc
+        for fieldnum in sorted(reader.invertedindex):
+            format = schema[fieldnum].format
+            fielddict = reader.invertedindex[fieldnum]
+            for text in reader.sorted_terms(fieldnum):
+                ids, freqs, values = fielddict[text]
+                offset = None
+                current_freq = 0
+                for i, docnum in enumerate(ids):
+                    if docnum >= maxdoc:
+                        break
+                    newdoc = doc_map[docnum]
+                    if newdoc < 0:
+                        continue
+                    if offset is None:
+                        offset = postwriter.start(format)
+                    postwriter.write(newdoc, values[i])
+                    current_freq += freqs[i]
+
+                if offset is not None:
+                    postcount = postwriter.finish()
+                    termtable.add((fieldnum, text),
+                                  (current_freq, offset, postcount))
+
     def add_document(self, fields):
         scorable_to_pos = self._scorable_to_pos
         stored_to_pos = self._stored_to_pos
         schema = self.schema
+        buffer = self.buffer
+        docnum = self.max_doc
 
         # Sort the keys by their order in the schema
         fieldnames = [name for name in fields.keys()
@@ -350,6 +586,22 @@ class SegmentWriter(object):
         # field, we don't want to have a list in the wrong order/of the wrong
         # length.
         storedvalues = [None] * len(stored_to_pos)
+        for name in fieldnames:
+            value = fields.get(name)
+            if value:
+                fieldnum = schema.name_to_number(name)
+                if schema.field_by_number(fieldnum).stored:
+                    # Caller can override the stored value by including a key
+                    # _stored_<fieldname>
+                    storedname = "_stored_" + name
+                    if storedname in fields:
+                        value = fields[storedname]
+                    storedvalues[stored_to_pos[fieldnum]] = value
+
+        # Encode the stored values before adding anything to the posting pool,
+        # so if a value can't be stored the exception doesn't leave the
+        # document half-added
+        encoded = encode_storedfields(storedvalues)
 
         for name in fieldnames:
             value = fields.get(name)
@@ -367,19 +619,37 @@ class SegmentWriter(object):
 
                     # TODO: Method for adding progressive field values, ie
                     # setting start_pos/start_char?
+                    postings = []
                     for w, freq, valuestring in field.index(value):
                         #assert w != ""
-                        self.pool.add_posting(fieldnum, w, self.max_doc, freq,
-                                              valuestring)
+                        postings.append((w, freq, valuestring))
+                        if field.reverse:
+                            postings.append((reverse_term(w), freq,
+                                             valuestring))
                         count += freq
                         unique += 1
 
+                    if field.bigrams:
+                        # The word pairs don't count toward the field length
+                        postings.extend(field.index_bigrams(value))
+
+                    for w, freq, valuestring in postings:
+                        self.pool.add_posting(fieldnum, w, docnum, freq,
+                                              valuestring)
+                    if buffer:
+                        for w, freq, valuestring in postings:
+                            buffer.add_posting(fieldnum, w, docnum, freq,
+                                               valuestring)
+
                     if field.scorable:
                         # Add the term count to the total for this field
                         self.field_length_totals[fieldnum] += count
                         # Set the term count to the per-document field length
                         pos = scorable_to_pos[fieldnum]
                         fieldlengths[pos] = min(count, DOCLENGTH_LIMIT)
+                        if buffer:
+                            buffer.add_field_length(docnum, fieldnum,
+                                                    fieldlengths[pos])
 
                 # If the field is vectored, add the words in the value to the
                 # vector table
@@ -390,40 +660,29 @@ class SegmentWriter(object):
                     vlist = sorted((w, valuestring) for w, freq, valuestring
                                    in vector.word_values(value, mode="index"))
                     self._add_vector(fieldnum, vlist)
+                    if buffer:
+                        buffer.add_vector(docnum, fieldnum, vlist)
 
-                # If the field is stored, put the value in storedvalues
-                if field.stored:
-                    # Caller can override the stored value by including a key
-                    # _stored_<fieldname>
-                    storedname = "_stored_" + name
-                    if storedname in fields:
-                        stored_value = fields[storedname]
-                    else :
-                        stored_value = value
-
-                    storedvalues[stored_to_pos[fieldnum]] = stored_value
-
-        self._add_doc_data(storedvalues, fieldlengths)
+        self._add_encoded_doc_data(encoded, fieldlengths)
+        if buffer:
+            buffer.finish_document(storedvalues)
         self.max_doc += 1
 
     def _add_terms(self):
         pass
 
     def _add_doc_data(self, storedvalues, fieldlengths):
-        self.docslist.append(storedvalues)
+        self._add_encoded_doc_data(encode_storedfields(storedvalues),
+                                   fieldlengths)
+
+    def _add_encoded_doc_data(self, encoded, fieldlengths):
+        self.docslist.append_encoded(encoded)
         if self.doclengths:
             self.doclengths.append(fieldlengths)
 
     def _add_vector(self, fieldnum, vlist):
-        vpostwriter = self.vpostwriter
         vformat = self.schema[fieldnum].vector
-
-        offset = vpostwriter.start(vformat)
-        for text, valuestring in vlist:
-            assert isinstance(text, unicode), "%r is not unicode" % text
-            vpostwriter.write(text, valuestring)
-        vpostwriter.finish()
-
+        offset = self.vectorwriter.add(vlist, vformat.posting_size)
         self.vectortable.add((self.max_doc, fieldnum), offset)
 
     def _flush_pool(self):
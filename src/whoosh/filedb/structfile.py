@@ -17,7 +17,7 @@
 import mmap, os
 from cPickle import dump as dump_pickle
 from cPickle import load as load_pickle
-from struct import calcsize, unpack, Struct
+from struct import calcsize, unpack, unpack_from, Struct
 
 from whoosh.system import _INT_SIZE, _USHORT_SIZE, _ULONG_SIZE, _FLOAT_SIZE
 from whoosh.util import varint, read_varint, float_to_byte, byte_to_float
@@ -78,8 +78,9 @@ class StructFile(object):
             fd = fileobj.fileno()
             self.size = os.fstat(fd).st_size
             try:
-                self.map = mmap.mmap(fd, self.size, access=mmap.ACCESS_READ)
-            except OSError:
+                self.set_map(mmap.mmap(fd, self.size, access=mmap.ACCESS_READ))
+            except (OSError, ValueError):
+                # mmap raises ValueError for empty files
                 self._setup_fake_map()
         else:
             self._setup_fake_map()
@@ -118,6 +119,32 @@ class StructFile(object):
                     return _self.read(slice.stop - slice.start)
         self.map = fakemap()
 
+    def set_map(self, buf):
+        """Sets the 'map' attribute to the given buffer, which must be an mmap
+        or string containing the entire contents of the file, and makes the
+        get_* methods decode values directly from the buffer with
+        ``struct.unpack_from`` instead of copying them out first.
+        """
+
+        self.map = buf
+        self.get_sbyte = self._buffer_getter(_sbyte_struct)
+        self.get_ushort = self._buffer_getter(_ushort_struct)
+        self.get_int = self._buffer_getter(_int_struct)
+        self.get_uint = self._buffer_getter(_uint_struct)
+        self.get_ulong = self._buffer_getter(_ulong_struct)
+        self.get_float = self._buffer_getter(_float_struct)
+        self.get_array = self._buffer_get_array
+
+    def _buffer_getter(self, struct):
+        unpack_from = struct.unpack_from
+        buf = self.map
+        def getter(position):
+            return unpack_from(buf, position)[0]
+        return getter
+
+    def _buffer_get_array(self, position, typecode, length):
+        return unpack_from("!" + typecode * length, self.map, position)
+
     def write_string(self, s):
         """Writes a string to the wrapped file. This method writes the length
         of the string first, so you can read the string back without having to
@@ -24,7 +24,7 @@ from collections import defaultdict
 from struct import pack, unpack, calcsize
 from cStringIO import StringIO
 
-from whoosh.analysis import unstopped
+from whoosh.analysis import unstopped, analyze_batch
 from whoosh.system import _INT_SIZE, _USHORT_SIZE, _FLOAT_SIZE
 from whoosh.util import varint, read_varint, float_to_byte, byte_to_float
 
@@ -36,9 +36,16 @@ class Format(object):
     Format objects are responsible for writing and reading the low-level
     representation of a field. It controls what kind/level of information to
     store about the indexed fields.
+    
+    Formats with variable-length values (``posting_size < 0``) that begin
+    with a fixed number of bytes sufficient to decode the frequency and weight
+    should set the ``head_size`` attribute to that number. This lets the
+    posting writer store the rest of the value (e.g. positions) separately, so
+    queries that only need the frequency don't read it.
     """
     
     posting_size = -1
+    head_size = None
     textual = True
     __inittypes__ = dict(analyzer=object, field_boost=float)
     
@@ -81,6 +88,18 @@ class Format(object):
         """
         raise NotImplementedError
     
+    def word_values_batch(self, values, **kwargs):
+        """Returns a list containing, for each unicode string in values, a list
+        of the ("tokentext", frequency, valuestring) tuples
+        :meth:`Format.word_values` would yield for it. The built-in formats
+        that don't store character offsets or boosts analyze all the values
+        in one call to :func:`whoosh.analysis.analyze_batch`, which is much
+        faster than running the analyzer's token stream for common analyzers
+        such as StandardAnalyzer.
+        """
+        
+        return [list(self.word_values(value, **kwargs)) for value in values]
+    
     def analyze(self, unicodestring, mode='', **kwargs):
         """Returns a :class:`whoosh.analysis.Token` iterator from the given
         unicode string.
@@ -139,9 +158,11 @@ class Existence(Format):
         self.options = options
     
     def word_values(self, value, **kwargs):
-        wordset = set(t.text for t
-                      in unstopped(self.analyzer(value, **kwargs)))
-        return ((w, 1, '') for w in wordset)
+        return self.word_values_batch([value], **kwargs)[0]
+    
+    def word_values_batch(self, values, **kwargs):
+        return [[(w, 1, '') for w in set(words)] for words
+                in analyze_batch(self.analyzer, values, **kwargs)]
     
     def encode(self, value):
         return ''
@@ -181,16 +202,29 @@ class Frequency(Format):
         self.options = options
         
     def word_values(self, value, **kwargs):
+        if not self.boost_as_freq:
+            return self.word_values_batch([value], **kwargs)[0]
+        
         seen = defaultdict(int)
-        if self.boost_as_freq:
-            for t in unstopped(self.analyzer(value, boosts=True, **kwargs)):
-                seen[t.text] += int(t.boost)
-        else:
-            for t in unstopped(self.analyzer(value, **kwargs)):
-                seen[t.text] += 1
+        for t in unstopped(self.analyzer(value, boosts=True, **kwargs)):
+            seen[t.text] += int(t.boost)
         
         encode = self.encode
         return ((w, freq, encode(freq)) for w, freq in seen.iteritems())
+    
+    def word_values_batch(self, values, **kwargs):
+        if self.boost_as_freq:
+            return Format.word_values_batch(self, values, **kwargs)
+        
+        encode = self.encode
+        result = []
+        for words in analyze_batch(self.analyzer, values, **kwargs):
+            seen = defaultdict(int)
+            for w in words:
+                seen[w] += 1
+            result.append([(w, freq, encode(freq))
+                           for w, freq in seen.iteritems()])
+        return result
 
     def encode(self, freq):
         return pack("!I", freq)
@@ -213,13 +247,19 @@ class DocBoosts(Frequency):
     posting_size = _INT_SIZE + 1
     
     def word_values(self, value, doc_boost=1.0, **kwargs):
-        seen = defaultdict(int)
-        for t in unstopped(self.analyzer(value, **kwargs)):
-            seen[t.text] += 1
-        
+        return self.word_values_batch([value], doc_boost=doc_boost,
+                                      **kwargs)[0]
+    
+    def word_values_batch(self, values, doc_boost=1.0, **kwargs):
         encode = self.encode
-        return ((w, freq, encode((freq, doc_boost)))
-                for w, freq in seen.iteritems())
+        result = []
+        for words in analyze_batch(self.analyzer, values, **kwargs):
+            seen = defaultdict(int)
+            for w in words:
+                seen[w] += 1
+            result.append([(w, freq, encode((freq, doc_boost)))
+                           for w, freq in seen.iteritems()])
+        return result
     
     def encode(self, freq_docboost):
         freq, docboost = freq_docboost
@@ -249,15 +289,23 @@ class Positions(Format):
     position boost = 1.0).
     """
     
+    head_size = _INT_SIZE
+    
     def word_values(self, value, start_pos=0, **kwargs):
-        seen = defaultdict(list)
-        for t in unstopped(self.analyzer(value, positions=True,
-                                         start_pos=start_pos, **kwargs)):
-            seen[t.text].append(start_pos + t.pos)
-        
+        return self.word_values_batch([value], start_pos=start_pos,
+                                      **kwargs)[0]
+    
+    def word_values_batch(self, values, start_pos=0, **kwargs):
         encode = self.encode
-        return ((w, len(poslist), encode(poslist))
-                for w, poslist in seen.iteritems())
+        result = []
+        for tokens in analyze_batch(self.analyzer, values, positions=True,
+                                    start_pos=start_pos, **kwargs):
+            seen = defaultdict(list)
+            for w, pos in tokens:
+                seen[w].append(start_pos + pos)
+            result.append([(w, len(poslist), encode(poslist))
+                           for w, poslist in seen.iteritems()])
+        return result
     
     def encode(self, positions):
         # positions = [pos1, pos2, ...]
@@ -296,6 +344,9 @@ class Characters(Positions):
     position boost = 1.0), characters.
     """
     
+    def word_values_batch(self, values, **kwargs):
+        return Format.word_values_batch(self, values, **kwargs)
+    
     def word_values(self, value, start_pos=0, start_char=0, **kwargs):
         seen = defaultdict(list)
         
@@ -346,6 +397,11 @@ class PositionBoosts(Positions):
     Supports: frequency, weight, positions, position_boosts.
     """
     
+    head_size = _INT_SIZE + _FLOAT_SIZE
+    
+    def word_values_batch(self, values, **kwargs):
+        return Format.word_values_batch(self, values, **kwargs)
+    
     def word_values(self, value, start_pos=0, **kwargs):
         seen = defaultdict(iter)
         for t in unstopped(self.analyzer(value, positions=True, boosts=True,
@@ -417,6 +473,8 @@ class CharacterBoosts(Characters):
     character_boosts.
     """
     
+    head_size = _INT_SIZE + _FLOAT_SIZE
+    
     def word_values(self, value, start_pos=0, start_char=0, **kwargs):
         seen = defaultdict(iter)
         for t in unstopped(self.analyzer(value, positions=True,
@@ -23,6 +23,8 @@ from __future__ import division
 from heapq import nlargest
 from cgi import escape as htmlescape
 
+from whoosh.analysis import Token
+
 # Fragment object
 
 class Fragment(object):
@@ -233,6 +235,65 @@ class ContextFragmenter(object):
             yield Fragment(current)
 
 
+class OffsetFragmenter(object):
+    """Builds fragments around the matched tokens only, ignoring any unmatched
+    tokens in the stream. Because it doesn't need the tokens in between the
+    matches, this fragmenter can work from a list of matched term offsets
+    taken from the index (see :func:`offset_tokens`) without tokenizing the
+    document text.
+    
+    The fragment boundaries are moved to the nearest space in the surrounding
+    context, so fragments usually start and end on whole words.
+    """
+    
+    def __init__(self, maxchars=200, surround=20):
+        """
+        :param maxchars: The maximum number of characters allowed in a
+            fragment (not counting the surrounding context).
+        :param surround: The number of extra characters of context to add both
+            before the first matched term and after the last matched term.
+        """
+        
+        self.maxchars = maxchars
+        self.surround = surround
+    
+    def _fragment(self, text, tokens):
+        surround = self.surround
+        textlen = len(text)
+        f = Fragment(tokens, charsbefore=surround, charsafter=surround,
+                     textlen=textlen)
+        
+        # If the context cuts a word in half, move the boundary to the space
+        # between words
+        sc = f.startchar
+        if sc > 0 and text[sc - 1] != " ":
+            space = text.find(" ", sc, tokens[0].startchar)
+            if space > -1:
+                f.startchar = space + 1
+        ec = f.endchar
+        if ec < textlen and text[ec] != " ":
+            space = text.rfind(" ", tokens[-1].endchar, ec)
+            if space > -1:
+                f.endchar = space
+        return f
+    
+    def __call__(self, text, tokens):
+        maxchars = self.maxchars
+        
+        current = []
+        for t in tokens:
+            if not t.matched:
+                continue
+            
+            if current and t.endchar - current[0].startchar > maxchars:
+                yield self._fragment(text, current)
+                current = []
+            current.append(t)
+        
+        if current:
+            yield self._fragment(text, current)
+
+
 #class VectorFragmenter(object):
 #    def __init__(self, termmap, maxchars=200, charsbefore=20, charsafter=20):
 #        """
@@ -490,6 +551,83 @@ class GenshiFormatter(object):
         return self.Stream(output)
 
 
+# Offsets
+
+def offset_tokens(termchars):
+    """Takes a dictionary mapping terms to lists of (startchar, endchar)
+    tuples, and returns a list of matched :class:`whoosh.analysis.Token`
+    objects sorted by their position in the text.
+    """
+    
+    tokens = []
+    for text, chars in termchars.iteritems():
+        for startchar, endchar in chars:
+            tokens.append(Token(chars=True, text=text, startchar=startchar,
+                                endchar=endchar, matched=True))
+    tokens.sort(key=lambda t: t.startchar)
+    return tokens
+
+
+def term_offsets(ixreader, fieldname, docnums, terms):
+    """Gets the character offsets of the given terms in the given documents
+    directly from the index, without re-analyzing the text. The offsets are
+    read from the field's term vectors if they store characters, or else from
+    the field's postings. Returns a dictionary mapping each document number to
+    a dictionary of the form accepted by :func:`offset_tokens`, or None if the
+    field doesn't store character offsets.
+    
+    This reads each term's postings only once for all the documents, so it's
+    most efficient to call it with a whole page of hits at once.
+    
+    :param ixreader: a :class:`whoosh.reading.IndexReader` object.
+    :param fieldname: the name of the field to get the offsets from.
+    :param docnums: a sequence of document numbers.
+    :param terms: a collection of unicode term texts.
+    """
+    
+    field = ixreader.schema[fieldname]
+    fieldnum = ixreader.schema.to_number(fieldname)
+    docnums = sorted(docnums)
+    terms = sorted(terms)
+    result = dict((docnum, {}) for docnum in docnums)
+    
+    def offsets(reader):
+        return [(startchar, endchar) for _, startchar, endchar
+                in reader.value_as("characters")]
+    
+    if field.vector and field.vector.supports("characters"):
+        for docnum in docnums:
+            if not ixreader.has_vector(docnum, fieldnum):
+                continue
+            
+            vreader = ixreader.vector(docnum, fieldnum)
+            termchars = result[docnum]
+            for text in terms:
+                vreader.skip_to(text)
+                if vreader.id is None:
+                    break
+                if vreader.id == text:
+                    termchars[text] = offsets(vreader)
+    
+    elif field.format and field.format.supports("characters"):
+        for text in terms:
+            if (fieldname, text) not in ixreader:
+                continue
+            
+            postreader = ixreader.postings(fieldname, text)
+            for docnum in docnums:
+                postreader.skip_to(docnum)
+                if postreader.id is None:
+                    break
+                if postreader.id == docnum:
+                    result[docnum][text] = offsets(postreader)
+    
+    else:
+        return None
+    
+    return result
+
+
 # Highlighting
 
 def top_fragments(text, terms, analyzer, fragmenter, top=3,
@@ -510,6 +648,26 @@ def highlight(text, terms, analyzer, fragmenter, formatter, top=3,
                               top=top, minscore=minscore)
     fragments.sort(key=order)
     return formatter(text, fragments)
+
+
+def highlight_offsets(text, termchars, fragmenter, formatter, top=3,
+                      scorer=BasicFragmentScorer, minscore=1, order=FIRST):
+    """Like :func:`highlight`, but instead of running the text through an
+    analyzer, takes the character offsets of the matched terms (as returned by
+    :func:`term_offsets`) and only slices the text around the best fragments.
+    The fragmenter is only given the matched tokens, so it should be one that
+    doesn't need the unmatched tokens, such as :class:`OffsetFragmenter`.
+    
+    :param termchars: a dictionary mapping terms to lists of
+        (startchar, endchar) tuples.
+    """
+    
+    tokens = offset_tokens(termchars)
+    scored_frags = nlargest(top, ((scorer(f), f)
+                                  for f in fragmenter(text, tokens)))
+    fragments = [sf for score, sf in scored_frags if score > minscore]
+    fragments.sort(key=order)
+    return formatter(text, fragments)
     
 
 if __name__ == '__main__':
@@ -21,10 +21,17 @@ into an object suitable for looking up synonyms and performing query expansion.
 http://wordnetcode.princeton.edu/3.0/WNprolog-3.0.tar.gz
 """
 
+from array import array
 from collections import defaultdict
 
 from whoosh.fields import Schema, ID, STORED
 from whoosh.index import Index
+from whoosh.system import _INT_SIZE
+
+
+# Identifies the file format written by write_synonym_file()
+_SYNFILE_TAG = "WNSY"
+_SYNFILE_VERSION = 1
 
 
 def parse_file(f):
@@ -86,6 +93,163 @@ def synonyms(word2nums, num2words, word):
     return sorted(syns)
 
 
+def write_synonym_file(dbfile, word2nums, num2words):
+    """Writes the synonyms in word2nums and num2words to the given
+    :class:`whoosh.filedb.structfile.StructFile` in a compact format that
+    can be read by :class:`SynonymFile` without loading it into memory.
+    Closes the file when it's done.
+    
+    The file contains a sorted table of the words (as UTF-8), an array of
+    synset numbers for each word, and an array of word numbers for each
+    synset. All the numbers are unsigned ints, so words can be looked up in
+    the table with a binary search directly on a memory map.
+    """
+    
+    def encode(word):
+        if isinstance(word, unicode):
+            return word.encode("utf8")
+        return word
+    
+    words = sorted(set(encode(w) for w in word2nums))
+    wordnums = dict((w, i) for i, w in enumerate(words))
+    synsets = sorted(num2words)
+    synsetnums = dict((n, i) for i, n in enumerate(synsets))
+    
+    # Offsets of each word's text in the string data, and of each word's
+    # list of synset numbers in the wordsyns array
+    wordoffsets = array("I", [0])
+    wordsynoffsets = array("I", [0])
+    wordsyns = array("I")
+    for word in words:
+        wordoffsets.append(wordoffsets[-1] + len(word))
+        nums = set()
+        for w in (word, word.decode("utf8")):
+            nums.update(synsetnums[n] for n in word2nums.get(w, ()))
+        wordsyns.extend(sorted(nums))
+        wordsynoffsets.append(len(wordsyns))
+    
+    # Offsets of each synset's list of word numbers in the synwords array
+    synoffsets = array("I", [0])
+    synwords = array("I")
+    for num in synsets:
+        synwords.extend(sorted(set(wordnums[encode(w)]
+                                   for w in num2words[num])))
+        synoffsets.append(len(synwords))
+    
+    dbfile.write(_SYNFILE_TAG)
+    dbfile.write_int(_SYNFILE_VERSION)
+    dbfile.write_uint(len(words))
+    dbfile.write_uint(len(synsets))
+    dbfile.write_uint(len(wordsyns))
+    dbfile.write_uint(len(synwords))
+    for arry in (wordoffsets, wordsynoffsets, wordsyns, synoffsets, synwords):
+        if arry:
+            dbfile.write_array(arry)
+    dbfile.write("".join(words))
+    dbfile.close()
+
+
+class SynonymFile(object):
+    """Looks up synonyms in a file written by :func:`write_synonym_file`.
+    Lookups read the file through its memory map (if it has one) with a
+    binary search on the word table, so opening the file is instant and the
+    synonyms are never loaded into memory. Many processes can open the same
+    file and share the operating system's cached copy.
+    """
+    
+    def __init__(self, dbfile):
+        """
+        :param dbfile: a :class:`whoosh.filedb.structfile.StructFile`
+            containing the synonym data.
+        """
+        
+        self.dbfile = dbfile
+        if dbfile.map[0:4] != _SYNFILE_TAG:
+            raise Exception("%r is not a synonym file" % dbfile)
+        version = dbfile.get_int(4)
+        if version != _SYNFILE_VERSION:
+            raise Exception("Can't read synonym file version %s" % version)
+        
+        self.wordcount = dbfile.get_uint(8)
+        self.synsetcount = dbfile.get_uint(12)
+        wordsyncount = dbfile.get_uint(16)
+        synwordcount = dbfile.get_uint(20)
+        
+        # Calculate the positions of the arrays in the file
+        self._wordoffsets = 24
+        self._wordsynoffsets = self._wordoffsets + (self.wordcount + 1) * _INT_SIZE
+        self._wordsyns = self._wordsynoffsets + (self.wordcount + 1) * _INT_SIZE
+        self._synoffsets = self._wordsyns + wordsyncount * _INT_SIZE
+        self._synwords = self._synoffsets + (self.synsetcount + 1) * _INT_SIZE
+        self._strings = self._synwords + synwordcount * _INT_SIZE
+    
+    def __len__(self):
+        return self.wordcount
+    
+    def __contains__(self, word):
+        return self._find(word) is not None
+    
+    def __iter__(self):
+        for i in xrange(self.wordcount):
+            yield self._word(i).decode("utf8")
+    
+    def close(self):
+        self.dbfile.close()
+    
+    def _word(self, i):
+        # Returns the UTF-8 text of the word with the given number
+        get_uint = self.dbfile.get_uint
+        pos = self._wordoffsets + i * _INT_SIZE
+        start = self._strings + get_uint(pos)
+        end = self._strings + get_uint(pos + _INT_SIZE)
+        return self.dbfile.map[start:end]
+    
+    def _find(self, word):
+        # Returns the number of the given word, or None if it's not in the
+        # file
+        if isinstance(word, unicode):
+            word = word.encode("utf8")
+        
+        lo, hi = 0, self.wordcount
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._word(mid) < word:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.wordcount and self._word(lo) == word:
+            return lo
+    
+    def _numbers(self, offsets, data, i):
+        # Returns the slice of the data array given by the offsets array at i
+        get_uint = self.dbfile.get_uint
+        pos = offsets + i * _INT_SIZE
+        start = get_uint(pos)
+        end = get_uint(pos + _INT_SIZE)
+        if start == end:
+            return ()
+        return self.dbfile.get_array(data + start * _INT_SIZE, "I",
+                                     end - start)
+    
+    def synonyms(self, word):
+        """Returns a sorted list of synonyms (as unicode strings) for the
+        given word, or an empty list if the word is not in the file.
+        """
+        
+        wordnum = self._find(word)
+        if wordnum is None:
+            return []
+        
+        wordnums = set()
+        for synset in self._numbers(self._wordsynoffsets, self._wordsyns,
+                                    wordnum):
+            wordnums.update(self._numbers(self._synoffsets, self._synwords,
+                                          synset))
+        wordnums.discard(wordnum)
+        # Word numbers are in sorted order, so the words will be too
+        return [self._word(i).decode("utf8") for i in sorted(wordnums)]
+
+
 class Thesaurus(object):
     """Represents the WordNet synonym database, either loaded into memory
     from the wn_s.pl Prolog file, or stored on disk in a Whoosh index.
@@ -138,12 +302,22 @@ class Thesaurus(object):
     
     Basically, if you can afford spending the memory necessary to parse the
     Thesaurus and then cache it, it's faster. Otherwise, use an on-disk index.
+    
+    A third option is to save the Thesaurus to a compact synonym file
+    (to_synonym_file) and open it with Thesaurus.from_synonym_file. This is
+    much faster to save than an index, opens instantly, and doesn't load the
+    synonyms into memory (see :class:`SynonymFile`), so it's the best choice
+    when many processes need a thesaurus.
+    
+    >>> t.to_synonym_file(fs)
+    >>> t = Thesaurus.from_synonym_file(fs)
     """
     
     def __init__(self):
         self.w2n = None
         self.n2w = None
         self.searcher = None
+        self.synfile = None
     
     @classmethod
     def from_file(cls, fileobj):
@@ -217,6 +391,45 @@ class Thesaurus(object):
             raise Exception("No synonyms loaded")
         make_index(storage, indexname, self.w2n, self.n2w)
 
+    @classmethod
+    def from_synonym_file(cls, storage, filename="THES.syn"):
+        """Creates a Thesaurus object from a synonym file in the given
+        storage object, created by Thesaurus.to_synonym_file().
+        
+        >>> from whoosh.filedb.filestore import FileStorage
+        >>> fs = FileStorage("index")
+        >>> t = Thesaurus.from_synonym_file(fs)
+        >>> t.synonyms("hail")
+        [u'acclaim', u'come', u'herald']
+        
+        :param storage: A :class:`whoosh.store.Storage` object from
+            which to open the file.
+        :param filename: The name of the synonym file in the storage.
+        """
+        
+        thes = cls()
+        thes.synfile = SynonymFile(storage.open_file(filename))
+        return thes
+    
+    def to_synonym_file(self, storage, filename="THES.syn"):
+        """Writes the synonyms loaded from a WordNet file to a compact
+        synonym file in the given storage object (see
+        :func:`write_synonym_file`).
+        
+        >>> from whoosh.filedb.filestore import FileStorage
+        >>> fs = FileStorage("index")
+        >>> t = Thesaurus.from_filename("wn_s.pl")
+        >>> t.to_synonym_file(fs)
+        
+        :param storage: A :class:`whoosh.store.Storage` object in
+            which to create the file.
+        :param filename: The name of the file to create in the storage.
+        """
+        
+        if not self.w2n or not self.n2w:
+            raise Exception("No synonyms loaded")
+        write_synonym_file(storage.create_file(filename), self.w2n, self.n2w)
+
     def synonyms(self, word):
         """Returns a list of synonyms for the given word.
         
@@ -225,7 +438,9 @@ class Thesaurus(object):
         """
         
         word = word.lower()
-        if self.searcher:
+        if self.synfile is not None:
+            return self.synfile.synonyms(word)
+        elif self.searcher:
             return self.searcher.document(word=word)["syns"]
         else:
             return synonyms(self.w2n, self.n2w, word)
@@ -413,6 +413,9 @@ class MultiPostingReader(PostingReader):
 
     def value(self):
         return self.readers[self.current].value()
+    
+    def value_as(self, astype):
+        return self.readers[self.current].value_as(astype)
 
 
 class Exclude(PostingReader):
@@ -433,6 +436,7 @@ class Exclude(PostingReader):
         self.excludes = excludes
         self._find_nonexcluded()
         self.value = postreader.value
+        self.value_as = postreader.value_as
     
     def reset(self):
         self.postreader.reset()
@@ -463,21 +467,27 @@ class CachedPostingReader(PostingReader):
     >>> creader = CachedPostingReader(preader.all_items())
     """
     
-    def __init__(self, items):
+    def __init__(self, items, format=None):
         """
         :param items: a sequence of (id, encodedvalue) pairs. If this is
             not a list or tuple, it is converted using tuple().
+        :param format: the :class:`whoosh.formats.Format` object of the
+            encoded values, used by the ``*_as`` methods.
         """
         
         if not isinstance(items, (list, tuple)):
             items = tuple(items)
         
         self._items = items
+        self.format = format
         self.reset()
     
     def reset(self):
         self.p = 0
-        self.id = self._items[0][0]
+        if self._items:
+            self.id = self._items[0][0]
+        else:
+            self.id = None
     
     def all_ids(self):
         return (item[0] for item in self._items)
@@ -498,7 +508,7 @@ class CachedPostingReader(PostingReader):
     def skip_to(self, target):
         if self.id is None:
             raise ReadTooFar
-        if target < self.id:
+        if target <= self.id:
             return
         
         items = self._items
@@ -509,7 +519,9 @@ class CachedPostingReader(PostingReader):
                 self.p = p
                 self.id = id
                 return
+            p += 1
         
+        self.p = p
         self.id = None
         
     def value(self):
@@ -621,72 +633,126 @@ class ListScorer(QueryScorer):
         return self.postings[self.i][1]
 
 
+class BitVectorScorer(QueryScorer):
+    """A QueryScorer that returns the documents whose bits are "on" in a
+    :class:`~whoosh.support.bitvector.BitVector`, and gives them all the same
+    score.
+    """
+    
+    def __init__(self, bitvector, docscore=1.0):
+        self.bitvector = bitvector
+        self.docscore = docscore
+        self.reset()
+    
+    def _find(self, start):
+        # Returns the first "on" bit at or after start, or None
+        bits = self.bitvector.bits
+        size = self.bitvector.size
+        i = start
+        while i < size:
+            byte = bits[i >> 3] >> (i & 7)
+            if not byte:
+                # Skip the rest of this byte
+                i = (i | 7) + 1
+            elif byte & 1:
+                return i
+            else:
+                i += 1
+        return None
+    
+    def reset(self):
+        self.id = self._find(0)
+    
+    def next(self):
+        if self.id is None:
+            raise ReadTooFar
+        self.id = self._find(self.id + 1)
+    
+    def skip_to(self, target):
+        if self.id is None:
+            raise ReadTooFar
+        if target > self.id:
+            self.id = self._find(target)
+    
+    def score(self):
+        if self.id is None:
+            return 0
+        return self.docscore
+
+
 class IntersectionScorer(QueryScorer):
-    """Acts like the intersection of items in a set of QueryScorers
+    """Acts like the intersection of items in a set of QueryScorers.
+    
+    The first scorer (after sorting by cost, if costs are given) drives the
+    iteration: each of its IDs is a candidate that the other scorers are
+    skipped forward to, and if one of them skips past it, the first scorer is
+    skipped forward to that ID instead. This is fastest when the first scorer
+    matches the fewest documents.
     """
     
-    def __init__(self, scorers, boost=1.0):
+    def __init__(self, scorers, boost=1.0, costs=None):
+        """
+        :param scorers: a list of QueryScorer objects.
+        :param boost: a factor by which to multiply the sum of the scores.
+        :param costs: an optional list containing the estimated number of
+            documents matched by each scorer. If this is None, the scorers are
+            assumed to already be in order from cheapest to most expensive.
+        """
+        
         self.scorers = scorers
-        self.state = list(scorers)
+        if costs is None:
+            self.state = list(scorers)
+        else:
+            order = sorted(xrange(len(scorers)), key=costs.__getitem__)
+            self.state = [scorers[i] for i in order]
         self.boost = boost
         self.id = -1
-        self._prep()
+        self._find()
 
     def __repr__(self):
         return "<%s %r: %r>" % (self.__class__.__name__, self.scorers, self.id)
 
-    def _prep(self):
+    def _find(self):
+        # Moves the scorers forward until they're all on the same ID
         state = self.state
-        state.sort()
-        id = state[0].id
-        if all(r.id == id for r in state[1:]):
-            self.id = id
-        else:
-            self.next()
+        lead = state[0]
+        others = state[1:]
+        while lead.id is not None:
+            target = lead.id
+            for r in others:
+                if r.id is not None and r.id < target:
+                    r.skip_to(target)
+                if r.id is None:
+                    self.id = None
+                    return
+                if r.id > target:
+                    lead.skip_to(r.id)
+                    break
+            else:
+                self.id = target
+                return
+        self.id = None
 
     def reset(self):
         for r in self.state:
             r.reset()
-        self.id = -1
-        self._prep()
+        self._find()
 
     def skip_to(self, target):
         if self.id is None:
             raise ReadTooFar
+        if target <= self.id:
+            return
         
-        state = self.state
-        for r in state:
-            r.skip_to(target)
-        self._prep()
+        self.state[0].skip_to(target)
+        self._find()
     
     def next(self):
         if self.id is None:
             raise ReadTooFar
         
-        id = self.id
-        state = self.state
-        for r in state:
-            if r.id == id: r.next()
-        state.sort()
-        
-        while True:
-            oldstate = tuple(s.id for s in state)
-            lowid = state[0].id
-            if lowid is None:
-                self.id = None
-                return
-            
-            if all(r.id == lowid for r in state[1:]):
-                self.id = lowid
-                return
-            else:
-                highid = state[-1].id
-                for r in state[:-1]:
-                    r.skip_to(highid)
-                if state[0].id is not None:
-                    state.sort()
-            if tuple(s.id for s in state) == oldstate:
-                raise Exception("Infinite loop")
+        self.state[0].next()
+        self._find()
                     
     def score(self):
         if self.id is None:
@@ -793,9 +859,9 @@ class AndNotScorer(QueryScorer):
     """Takes two QueryScorers and pulls items from the first, skipping items
     that also appear in the second.
     
-    THIS SCORER IS NOT ACTUALLY USED, since it turns out to be slightly faster
-    to simply create an "excluded_docs" filter from the "not" query and pass
-    that into the "positive" query.
+    :class:`whoosh.query.And` uses this to apply its ``Not`` sub-queries after
+    the intersection of the other sub-queries, so the negative scorer is only
+    skipped to documents that would otherwise match.
     """
     
     def __init__(self, positive, negative):
@@ -817,18 +883,13 @@ class AndNotScorer(QueryScorer):
     
     def _find_next(self):
         pos, neg = self.positive, self.negative
-        if pos.id is None:
-            self.id = None
-            return
-        elif neg.id is None:
-            self.id = pos.id
-            return
-        
-        if neg.id < pos.id:
-            neg.skip_to(pos.id)
-        while pos.id == neg.id:
-            pos.next()
-            neg.skip_to(pos.id)
+        while pos.id is not None and neg.id is not None:
+            if neg.id < pos.id:
+                neg.skip_to(pos.id)
+            elif neg.id == pos.id:
+                pos.next()
+            else:
+                break
         self.id = pos.id
     
     def next(self):
@@ -845,11 +906,7 @@ class AndNotScorer(QueryScorer):
             return
         
         self.positive.skip_to(target)
-        if self.negative.id is not None:
-            self.negative.skip_to(target)
-            self._find_next()
-        else:
-            self.id = self.positive.id
+        self._find_next()
         
     def score(self):
         if self.id is None:
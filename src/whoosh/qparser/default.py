@@ -1,9 +1,11 @@
 """
 This module contains the default search query parser.
 
-This uses the excellent Pyparsing module 
-(http://pyparsing.sourceforge.net/) to parse search query strings
-into nodes from the query module.
+The query language was originally defined using the excellent Pyparsing module
+(http://pyparsing.sourceforge.net/). The default grammar is now parsed by a
+hand-written recursive-descent parser that produces the same syntax trees much
+faster. Pyparsing is only imported if you build a grammar with it, see
+:func:`_make_default_parser`.
 
 This parser handles:
 
@@ -54,15 +56,27 @@ http://pyparsing.wikispaces.com/space/showimage/searchparser.py
 # - Rudolph Froger
 # - Paul McGuire
 
-from whoosh.support.pyparsing import (printables, alphanums, OneOrMore,
-                                      Group, Combine, Suppress, Optional,
-                                      FollowedBy, Literal, CharsNotIn, Word,
-                                      Keyword, Empty, White, Forward,
-                                      QuotedString, StringEnd)
+import copy
+import string
+
 from whoosh.query import *
+from whoosh.util import LRUCache
 
 
 def _make_default_parser():
+    """Builds the default grammar with pyparsing and returns its parseString
+    method. Parsing is done by the much faster hand-written
+    :func:`default_parser`, which produces the same syntax trees, so this is
+    only used as a starting point for custom grammars. It is the only place
+    pyparsing is imported.
+    """
+
+    from whoosh.support.pyparsing import (printables, alphanums, OneOrMore,
+                                          Group, Combine, Suppress, Optional,
+                                          FollowedBy, Literal, CharsNotIn, Word,
+                                          Keyword, Empty, White, Forward,
+                                          QuotedString, StringEnd)
+
     escapechar = "\\"
 
     #wordchars = printables
@@ -135,12 +149,317 @@ def _make_default_parser():
 
     return toplevel.parseString
 
-DEFAULT_PARSER = _make_default_parser()
+
+# Hand-written parser for the default grammar
+
+_whitespace = frozenset(" \n\t\r")
+_notwordchars = frozenset('\\*?^():"{}[] ')
+_wildchars = frozenset("*?")
+_escapable = frozenset(c for c in string.printable
+                       if c not in string.whitespace) | frozenset(" \t\r\n")
+_keywordchars = frozenset(string.ascii_letters + string.digits + "_$")
+_fieldchars = frozenset(string.ascii_letters + string.digits + "_")
+_digits = frozenset("0123456789")
+_boostchars = frozenset(".0123456789")
+
+
+class SyntaxNode(list):
+    """A node in the syntax tree produced by :func:`default_parser`. This is a
+    list of the node's children with a name, and supports the part of the
+    pyparsing ParseResults interface the parser's ``_<Name>`` methods use, so
+    the same methods work on trees from either parser.
+    """
+
+    def __init__(self, name, items=()):
+        list.__init__(self, items)
+        self.name = name
+
+    def __repr__(self):
+        return "%s(%s)" % (self.name, list.__repr__(self))
+
+    def getName(self):
+        return self.name
+
+
+class _DefaultSyntax(object):
+    """Recursive-descent implementation of the grammar built by
+    :func:`_make_default_parser`. Each method takes a position in the input
+    and returns a (result, newposition) tuple, or None if the production does
+    not match at that position. The productions are tried in the same order as
+    the pyparsing alternatives, so the trees (including the quirks, such as
+    "a OR b c" parsing as a single OR) are identical.
+    """
+
+    def __init__(self, text):
+        # pyparsing expands tabs before parsing, so do the same to match
+        self.text = text.expandtabs()
+        self.length = len(self.text)
+        self._units = {}
+        self._generalunits = {}
+
+    def parse(self):
+        items, pos = self.expression(self.skip(0))
+        pos = self.skip(pos)
+        if pos < self.length:
+            raise QueryError("Syntax error at position %d in %r"
+                             % (pos, self.text))
+        return SyntaxNode("Toplevel", items)
+
+    # Primitives
+
+    def skip(self, pos):
+        text, length = self.text, self.length
+        while pos < length and text[pos] in _whitespace:
+            pos += 1
+        return pos
+
+    def white(self, pos):
+        end = self.skip(pos)
+        if end > pos:
+            return end
+
+    def literal(self, pos, chars):
+        pos = self.skip(pos)
+        if pos < self.length and self.text[pos] in chars:
+            return self.text[pos], pos + 1
+
+    def keyword(self, pos, word, caseless=False):
+        text = self.text
+        pos = self.skip(pos)
+        end = pos + len(word)
+        found = text[pos:end]
+        before = text[pos - 1:pos]
+        after = text[end:end + 1]
+        if caseless:
+            found, before, after = found.upper(), before.upper(), after.upper()
+        if (found == word and after not in _keywordchars
+            and before not in _keywordchars):
+            return end
+
+    def chars(self, pos, firstchars, restchars):
+        text, length = self.text, self.length
+        pos = self.skip(pos)
+        if pos < length and text[pos] in firstchars:
+            end = pos + 1
+            while end < length and text[end] in restchars:
+                end += 1
+            return text[pos:end], end
+
+    def word(self, pos, wild=False):
+        # Reads a run of word characters and backslash escapes (and wildcard
+        # characters if wild is True), without skipping leading whitespace
+        text, length = self.text, self.length
+        chars = []
+        end = pos
+        while end < length:
+            c = text[end]
+            if c == "\\":
+                if end + 1 < length and text[end + 1] in _escapable:
+                    chars.append(text[end + 1])
+                    end += 2
+                else:
+                    break
+            elif c in _notwordchars and not (wild and c in _wildchars):
+                break
+            else:
+                chars.append(c)
+                end += 1
+        if end > pos:
+            return "".join(chars), end
+
+    def quoted(self, pos):
+        text, length = self.text, self.length
+        pos = self.skip(pos)
+        if pos < length and text[pos] == '"':
+            end = pos + 1
+            while end < length and text[end] not in '"\n\r':
+                end += 1
+            if end < length and text[end] == '"':
+                return text[pos + 1:end], end + 1
+
+    # Productions
+
+    def rangeitem(self, pos):
+        return self.quoted(pos) or self.word(pos)
+
+    def range(self, pos):
+        m = self.literal(pos, "[{")
+        if not m:
+            return
+        startchar, pos = m
+        pos = self.skip(pos)
+        start = end = None
+
+        # [start TO end]
+        m = self.rangeitem(pos)
+        p = m and self.white(m[1])
+        p = p and self.keyword(p, "TO")
+        p = p and self.white(p)
+        m2 = p and self.rangeitem(p)
+        if m2:
+            start, end, p = m[0], m2[0], m2[1]
+        else:
+            # [TO end]
+            p = self.keyword(pos, "TO")
+            p = p and self.white(p)
+            m2 = p and self.rangeitem(p)
+            if m2:
+                end, p = m2
+            else:
+                # [start TO]
+                p = m and self.white(m[1])
+                p = p and self.keyword(p, "TO")
+                if not p:
+                    return
+                start = m[0]
+
+        m = self.literal(p, "]}")
+        if m:
+            endchar, p = m
+            starts = [start] if start is not None else []
+            ends = [end] if end is not None else []
+            return SyntaxNode("Range", [startchar, starts, ends, endchar]), p
+
+    def wildcard(self, pos):
+        text, length = self.text, self.length
+        if pos >= length:
+            return
+        if text[pos] in _wildchars:
+            # Starts with wildcard characters: must be followed by word
+            # characters, whitespace or the end of the input
+            end = pos
+            while end < length and text[end] in _wildchars:
+                end += 1
+            if not self.word(end):
+                if end < length and text[end] not in _whitespace:
+                    return
+                return SyntaxNode("Wildcard", [text[pos:end]]), end
+        else:
+            # Starts with word characters: must have a wildcard character
+            # after them
+            m = self.word(pos)
+            if not m or m[1] >= length or text[m[1]] not in _wildchars:
+                return
+
+        value, end = self.word(pos, wild=True)
+        return SyntaxNode("Wildcard", [value]), end
+
+    def generalword(self, pos):
+        m = self.range(pos) or self.wildcard(pos)
+        if m:
+            return m
+        m = self.word(pos)
+        if m:
+            return SyntaxNode("Word", [m[0]]), m[1]
+
+    def boostableunit(self, pos):
+        m = self.generalword(pos)
+        if m:
+            return m
+        m = self.quoted(pos)
+        if m:
+            return SyntaxNode("Quotes", [m[0]]), m[1]
+
+    def parenthetical(self, pos):
+        m = self.literal(pos, "(")
+        if m:
+            items, pos = self.expression(self.skip(m[1]))
+            m = self.literal(pos, ")")
+            if m:
+                return SyntaxNode("Group", items), m[1]
+
+    def fieldableunit(self, pos):
+        m = self.parenthetical(pos)
+        if m:
+            return m
+        # pyparsing skips leading whitespace before a boosted unit but not
+        # before a bare word, so "f: a^2" parses but "f: a" doesn't
+        m = self.boostableunit(self.skip(pos))
+        caret = m and self.literal(m[1], "^")
+        boost = caret and self.chars(caret[1], _digits, _boostchars)
+        if boost:
+            return SyntaxNode("Boost", [m[0], boost[0]]), boost[1]
+        return self.boostableunit(pos)
+
+    def unit(self, pos):
+        units = self._units
+        if pos not in units:
+            m = self.chars(pos, _fieldchars, _fieldchars)
+            colon = m and self.literal(m[1], ":")
+            sub = colon and self.fieldableunit(colon[1])
+            if sub:
+                result = SyntaxNode("Field", [m[0], sub[0]]), sub[1]
+            else:
+                result = self.fieldableunit(pos)
+            units[pos] = result
+        return units[pos]
+
+    def generalunit(self, pos):
+        generalunits = self._generalunits
+        if pos not in generalunits:
+            p = self.keyword(pos, "NOT", caseless=True)
+            p = p and self.white(p)
+            m = p and self.unit(p)
+            if m:
+                result = SyntaxNode("Not", [m[0]]), m[1]
+            else:
+                result = self.unit(pos)
+            generalunits[pos] = result
+        return generalunits[pos]
+
+    def operator(self, pos, word, name):
+        m = self.generalunit(self.skip(pos))
+        p = m and self.white(m[1])
+        p = p and self.keyword(p, word)
+        p = p and self.white(p)
+        if p:
+            items, p = self.expression(p)
+            return SyntaxNode(name, [m[0]] + items), p
+
+    def andnot(self, pos):
+        m = self.unit(self.skip(pos))
+        p = m and self.white(m[1])
+        p = p and self.keyword(p, "ANDNOT")
+        p = p and self.white(p)
+        m2 = p and self.unit(p)
+        if m2:
+            return SyntaxNode("AndNot", [m[0], m2[0]]), m2[1]
+
+    def expression(self, pos):
+        items = []
+        while True:
+            m = (self.operator(pos, "AND", "And")
+                 or self.operator(pos, "OR", "Or")
+                 or self.andnot(pos)
+                 or self.generalunit(pos))
+            if m:
+                items.append(m[0])
+                pos = m[1]
+            else:
+                p = self.white(pos)
+                if not p:
+                    return items, pos
+                pos = p
+
+
+def default_parser(input):
+    """Parses the input string using the default query grammar and returns a
+    one-item list containing the syntax tree, like the parseString method of
+    the pyparsing grammar this replaces.
+    """
+
+    return [_DefaultSyntax(input).parse()]
+
+
+DEFAULT_PARSER = default_parser
 
 
 # Query parser objects
 
 class PyparsingBasedParser(object):
+    # The maximum number of parsed queries to cache, or 0 to not cache
+    cachesize = 0
+
     def _field(self, fieldname):
         if self.schema:
             return self.schema[fieldname]
@@ -159,12 +478,53 @@ class PyparsingBasedParser(object):
         :rtype: :class:`whoosh.query.Query`
         """
 
+        if self.cachesize:
+            return self._cached_parse(input, normalize)
+        return self._parse(input, normalize)
+
+    def _parse(self, input, normalize):
         ast = self.parser(input)[0]
         q = self._eval(ast, self.default_field)
         if q and normalize:
             q = q.normalize()
         return q
 
+    def _cache_key(self, input, normalize):
+        return (input, self.default_field, normalize)
+
+    def _cached_parse(self, input, normalize):
+        # The cache is thrown away if the schema is replaced or a field is
+        # added to it, since that can change how the input is analyzed
+        schema = self.schema
+        numfields = len(schema) if schema is not None else 0
+        cache = getattr(self, "_cache", None)
+        if (cache is None
+            or self._cacheschema is not schema
+            or self._cachefields != numfields):
+            cache = self._cache = LRUCache(self.cachesize)
+            self._cacheschema = schema
+            self._cachefields = numfields
+
+        # The parser may be shared between threads, so another thread can
+        # evict the key at any time: look it up only once
+        key = self._cache_key(input, normalize)
+        try:
+            q = cache[key]
+        except KeyError:
+            q = cache[key] = self._parse(input, normalize)
+
+        # Return a copy so the caller can't modify the cached query (for
+        # example by changing its boost)
+        if q is not None:
+            q = copy.deepcopy(q, {id(NullQuery): NullQuery})
+        return q
+
+    def clear_cache(self):
+        """Removes all queries from this parser's parsed-query cache.
+        """
+
+        self._cache = None
+
     # These methods are called by the parsing code to generate query
     # objects. They are useful for subclassing.
 
@@ -255,7 +615,7 @@ class QueryParser(PyparsingBasedParser):
                          termclass="whoosh.query.Query")
 
     def __init__(self, default_field, schema=None, conjunction=And,
-                 termclass=Term):
+                 termclass=Term, parser=None, cachesize=0):
         """
         :param default_field: Use this as the field for any terms without
             an explicit field. For example, if the query string is
@@ -272,16 +632,25 @@ class QueryParser(PyparsingBasedParser):
         :param schema: An optional fields.Schema object. If this argument is
             present, the appropriate field will be used to tokenize
             terms/phrases before they are turned into query objects.
+        :param parser: a callable that takes the query string and returns a
+            sequence whose first item is the syntax tree, such as the
+            parseString method of a custom pyparsing grammar. The default is
+            the built-in :func:`default_parser`.
+        :param cachesize: the maximum number of parsed queries to keep in an
+            LRU cache keyed on the query string, so parsing the same string
+            again doesn't re-parse and re-analyze it. Each call returns a copy
+            of the cached query. The default is 0 (no caching).
         """
 
         self.default_field = default_field
         self.conjunction = conjunction
         self.termclass = termclass
         self.schema = schema
-        self.parser = DEFAULT_PARSER
+        self.parser = parser or DEFAULT_PARSER
+        self.cachesize = cachesize
 
-    # These methods take the AST from pyparsing, extract the relevant data, and
-    # call the appropriate make_* methods to create query objects.
+    # These methods take the syntax tree, extract the relevant data, and call
+    # the appropriate make_* methods to create query objects.
 
     def _Toplevel(self, node, fieldname):
         return self.conjunction([self._eval(s, fieldname) for s in node])
@@ -345,12 +714,17 @@ class MultifieldParser(QueryParser):
                          termclass="whoosh.query.Query")
 
     def __init__(self, fieldnames, schema=None, conjunction=And,
-                 termclass=Term):
+                 termclass=Term, parser=None, cachesize=0):
         super(MultifieldParser, self).__init__(None, schema=schema,
                                                conjunction=conjunction,
-                                               termclass=termclass)
+                                               termclass=termclass,
+                                               parser=parser,
+                                               cachesize=cachesize)
         self.fieldnames = fieldnames
 
+    def _cache_key(self, input, normalize):
+        return (input, tuple(self.fieldnames), normalize)
+
     def _make(self, methodname, fieldname, *args):
         method = getattr(super(MultifieldParser, self), methodname)
         if fieldname is None:
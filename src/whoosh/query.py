@@ -21,19 +21,26 @@ objects are composable to form complex query trees.
 from __future__ import division
 
 __all__ = ("QueryError", "Term", "And", "Or", "Not", "DisjunctionMax",
-           "Prefix", "Wildcard", "FuzzyTerm", "TermRange", "Variations",
-           "Phrase", "NullQuery", "Require", "AndMaybe", "AndNot")
+           "Prefix", "Wildcard", "Regex", "FuzzyTerm", "TermRange",
+           "Variations", "Synonyms",
+           "Phrase", "NullQuery", "MoreLikeThis", "Require", "AndMaybe",
+           "AndNot")
 
 import copy
 from bisect import bisect_left, bisect_right
-import fnmatch, re
+from math import ceil
+import re
 
-from whoosh.lang.morph_en import variations
+from whoosh.classify import Bo1Model, Expander
+from whoosh.fields import REVERSE_MARK, bigram_term
 from whoosh.postings import QueryScorer, EmptyScorer
 from whoosh.postings import IntersectionScorer, UnionScorer
 from whoosh.postings import RequireScorer, AndMaybeScorer, InverseScorer
+from whoosh.postings import BitVectorScorer, AndNotScorer
 from whoosh.postings import ReadTooFar
 from whoosh.reading import TermNotFound
+from whoosh.support.automata import (glob_automaton, regex_automaton,
+                                     RangeAutomaton)
 from whoosh.support.bitvector import BitVector
 from whoosh.support.levenshtein import relative
 
@@ -57,6 +64,28 @@ def _not_vector(searcher, notqueries, sourcevector):
     return nvector
 
 
+def _estimate(query, ixreader):
+    # Returns the estimated number of documents matched by the query, or the
+    # number of documents in the index if the query can't estimate it
+    try:
+        return query.estimate_size(ixreader)
+    except NotImplementedError:
+        return ixreader.doc_count_all()
+
+
+def _no_score(docnum, weight):
+    return 0
+
+
+def _forward_terms(ixreader, fieldname, terms):
+    # Removes the reversed and word pair terms indexed by fields with
+    # reverse=True or bigrams=True from an iterator of terms
+    field = ixreader.schema[fieldname]
+    if field.reverse or field.bigrams:
+        return (t for t in terms if not t.startswith(REVERSE_MARK))
+    return terms
+
+
 # Exceptions
 
 class QueryError(Exception):
@@ -159,6 +188,25 @@ class Query(object):
         """
         raise NotImplementedError
 
+    def explain(self, ixreader):
+        """Returns a string describing how this query would be run on the
+        given reader, showing the estimated number of documents matched by
+        each part of the query, the order in which the parts of intersections
+        would be read, and where a part that can't match anything would cut
+        the query short. This is useful for finding out why a query is slow.
+        
+        >>> print q.explain(searcher.reader())
+        (content:render AND content:shade) ~2, rarest first:
+          content:shade ~2
+          content:render ~15
+        """
+
+        return u"\n".join(self._explain(ixreader, 0))
+
+    def _explain(self, ixreader, depth):
+        return [u"%s%s ~%d" % (u"  " * depth, unicode(self),
+                               _estimate(self, ixreader))]
+
     def scorer(self, searcher, exclude_docs=None):
         """Returns :class:`~whoosh.postings.QueryScorer` object you can use to
         retrieve documents and scores matching this query.
@@ -324,6 +372,12 @@ class CompoundQuery(Query):
 
         return self.__class__(subqs, boost=self.boost)
 
+    def _explain(self, ixreader, depth):
+        lines = Query._explain(self, ixreader, depth)
+        for q in self.subqueries:
+            lines.extend(q._explain(ixreader, depth + 1))
+        return lines
+
     def _split_queries(self):
         subs = [q for q in self.subqueries if not isinstance(q, Not)]
         nots = [q.query for q in self.subqueries if isinstance(q, Not)]
@@ -356,6 +410,14 @@ class MultiTerm(Query):
     same field.
     """
 
+    # When a query expands to more than this many terms, its scorer ORs the
+    # postings of the terms into a BitVector and gives every matching
+    # document the query's boost as its score, instead of merging and
+    # scoring a posting reader for every term. Set this to None (on the
+    # class or on an instance) to always score the individual terms, or to
+    # 0 to always use a constant score.
+    constantscore_limit = 256
+
     def _words(self, ixreader):
         raise NotImplementedError
 
@@ -382,8 +444,16 @@ class MultiTerm(Query):
 
     def scorer(self, searcher, exclude_docs=None):
         fn = self.fieldname
+        words = self._words(searcher.reader())
+
+        limit = self.constantscore_limit
+        if limit is not None:
+            words = list(words)
+            if len(words) > limit:
+                return self._constant_scorer(searcher, words, exclude_docs)
+
         scorers = []
-        for word in self._words(searcher.reader()):
+        for word in words:
             try:
                 q = Term(fn, word).scorer(searcher, exclude_docs=exclude_docs)
                 scorers.append(q)
@@ -395,6 +465,18 @@ class MultiTerm(Query):
         else:
             return EmptyScorer()
 
+    def _constant_scorer(self, searcher, words, exclude_docs):
+        fieldnum = searcher.fieldname_to_num(self.fieldname)
+        bits = BitVector(searcher.reader().doc_count_all())
+        for word in words:
+            try:
+                postreader = searcher.postings(fieldnum, word,
+                                               exclude_docs=exclude_docs)
+            except TermNotFound:
+                continue
+            bits.set_from(postreader.all_ids())
+        return BitVectorScorer(bits, docscore=self.boost)
+
 
 # Concrete classes
 
@@ -503,9 +585,59 @@ class And(CompoundQuery):
     def estimate_size(self, ixreader):
         return min(q.estimate_size(ixreader) for q in self.subqueries)
 
+    def _plan(self, ixreader):
+        # Returns a list of (estimated size, query) pairs for the sub-queries
+        # to intersect, from the rarest to the most common, and a list of
+        # queries whose matches are removed from the intersection afterwards
+        subs, nots = self._split_queries()
+        positives = []
+        for q in subs:
+            if isinstance(q, AndNot):
+                positives.append(q.positive)
+                nots.append(q.negative)
+            else:
+                positives.append(q)
+
+        plan = [(_estimate(q, ixreader), i, q)
+                for i, q in enumerate(positives)]
+        plan.sort()
+        return [(size, q) for size, _, q in plan], nots
+
+    def _explain(self, ixreader, depth):
+        indent = u"  " * depth
+        plan, nots = self._plan(ixreader)
+        size = min(size for size, _ in plan) if plan else 0
+        lines = [u"%s%s ~%d, rarest first:" % (indent, unicode(self), size)]
+        for size, q in plan:
+            lines.extend(q._explain(ixreader, depth + 1))
+            if not size:
+                lines.append(u"%s  (matches nothing, so the rest is skipped)"
+                             % indent)
+                return lines
+        for q in nots:
+            lines.append(u"%s  then excluding:" % indent)
+            lines.extend(q._explain(ixreader, depth + 2))
+        return lines
+
     def scorer(self, searcher, exclude_docs=None):
-        return IntersectionScorer(self._subscorers(searcher, exclude_docs),
-                                  boost=self.boost)
+        plan, nots = self._plan(searcher.reader())
+        if not plan or not plan[0][0]:
+            # At least one of the sub-queries can't match anything
+            return EmptyScorer()
+
+        scorers = [q.scorer(searcher, exclude_docs=exclude_docs)
+                   for _, q in plan]
+        scorer = IntersectionScorer(scorers, boost=self.boost)
+        if nots:
+            # Only check the excluded documents against the intersection's
+            # matches, instead of finding all of them up front
+            negatives = [q.scorer(searcher) for q in nots]
+            if len(negatives) == 1:
+                negative = negatives[0]
+            else:
+                negative = UnionScorer(negatives)
+            scorer = AndNotScorer(scorer, negative)
+        return scorer
 
 
 class Or(CompoundQuery):
@@ -659,6 +791,10 @@ class Not(Query):
     def estimate_size(self, ixreader):
         return ixreader.doc_count()
 
+    def _explain(self, ixreader, depth):
+        return ([u"%sNOT" % (u"  " * depth)]
+                + self.query._explain(ixreader, depth + 1))
+
     def scorer(self, searcher, exclude_docs=None):
         reader = searcher.reader()
         scorer = self.query.scorer(searcher)
@@ -712,9 +848,11 @@ class Wildcard(MultiTerm):
         """
         :param fieldname: The field to search in.
         :param text: A glob to search for. May contain ? and/or * wildcard
-            characters. Note that matching a wildcard expression that starts
-            with a wildcard is very inefficent, since the query must test every
-            term in the field.
+            characters. Matching terms are found by seeking through the term
+            index with an automaton for the glob, so a literal prefix before
+            the first wildcard keeps the query fast. A glob that starts with
+            a wildcard has to be tested against most terms in the field,
+            unless the field was created with ``reverse=True``.
         :param boost: A boost factor that should be applied to the raw score of
             results matched by this query.
         """
@@ -723,20 +861,6 @@ class Wildcard(MultiTerm):
         self.text = text
         self.boost = boost
 
-        self.expression = re.compile(fnmatch.translate(text))
-
-        # Get the "prefix" -- the substring before the first wildcard.
-        qm = text.find("?")
-        st = text.find("*")
-        if qm < 0 and st < 0:
-            self.prefix = ""
-        elif qm < 0:
-            self.prefix = text[:st]
-        elif st < 0:
-            self.prefix = text[:qm]
-        else:
-            self.prefix = text[:min(st, qm)]
-
     def __eq__(self, other):
         return other and self.__class__ is other.__class__ and\
         self.fieldname == other.fieldname and self.text == other.text and\
@@ -753,15 +877,20 @@ class Wildcard(MultiTerm):
         return "%s:%s" % (self.fieldname, self.text)
 
     def _words(self, ixreader):
-        if self.prefix:
-            candidates = ixreader.expand_prefix(self.fieldname, self.prefix)
-        else:
-            candidates = ixreader.lexicon(self.fieldname)
+        fieldname = self.fieldname
+        text = self.text
+
+        if (text and text[0] in "*?[" and text[-1] not in "*?]"
+            and ixreader.schema[fieldname].reverse):
+            # The glob starts with a wildcard but ends with a literal, so
+            # match the reversed glob against the reversed terms instead
+            nfa = glob_automaton(text, reverse=True, leading=REVERSE_MARK)
+            words = ixreader.expand_automaton(fieldname, nfa.to_dfa())
+            return sorted(w[:0:-1] for w in words)
 
-        exp = self.expression
-        for text in candidates:
-            if exp.match(text):
-                yield text
+        words = ixreader.expand_automaton(fieldname,
+                                          glob_automaton(text).to_dfa())
+        return _forward_terms(ixreader, fieldname, words)
 
     def normalize(self):
         # If there are no wildcard characters in this "wildcard", turn it into
@@ -783,15 +912,73 @@ class Wildcard(MultiTerm):
             return self
 
 
+class Regex(MultiTerm):
+    """Matches documents that contain any terms that match a regular
+    expression. The expression must match the entire term.
+    
+    >>> Regex("content", u"r[aeiou]+n(ing)?")
+    """
+
+    __inittypes__ = dict(fieldname=str, text=unicode, boost=float)
+
+    def __init__(self, fieldname, text, boost=1.0):
+        """
+        :param fieldname: The field to search in.
+        :param text: A regular expression to search for. If the expression
+            only uses the syntax supported by
+            :func:`whoosh.support.automata.regex_automaton`, the matching
+            terms are found by seeking through the term index with an
+            automaton. Otherwise every term in the field is tested with the
+            ``re`` module, which is much slower.
+        :param boost: A boost factor that should be applied to the raw score of
+            results matched by this query.
+        """
+
+        self.fieldname = fieldname
+        self.text = text
+        self.boost = boost
+
+    def __eq__(self, other):
+        return other and self.__class__ is other.__class__ and\
+        self.fieldname == other.fieldname and self.text == other.text and\
+        self.boost == other.boost
+
+    def __repr__(self):
+        r = "%s(%r, %r" % (self.__class__.__name__, self.fieldname, self.text)
+        if self.boost != 1:
+            r += ", boost=%s" % self.boost
+        r += ")"
+        return r
+
+    def __unicode__(self):
+        return u"%s:/%s/" % (self.fieldname, self.text)
+
+    def _words(self, ixreader):
+        fieldname = self.fieldname
+        try:
+            nfa = regex_automaton(self.text)
+        except ValueError:
+            exp = re.compile(u"(?:%s)\\Z" % self.text)
+            words = (t for t in ixreader.lexicon(fieldname) if exp.match(t))
+        else:
+            words = ixreader.expand_automaton(fieldname, nfa.to_dfa())
+        return _forward_terms(ixreader, fieldname, words)
+
+
 class FuzzyTerm(MultiTerm):
     """Matches documents containing words similar to the given term.
     """
 
     __inittypes__ = dict(fieldname=str, text=unicode, boost=float,
-                         minsimilarity=float, prefixlength=int)
+                         minsimilarity=float, prefixlength=int, maxdist=int)
+
+    # When minsimilarity limits the matching terms to this many edits or
+    # fewer, candidates are found with a Levenshtein automaton instead of
+    # checking every term that shares the prefix
+    automaton_limit = 2
 
     def __init__(self, fieldname, text, boost=1.0, minsimilarity=0.5,
-                 prefixlength=1):
+                 prefixlength=1, maxdist=None):
         """
         :param fieldname: The name of the field to search.
         :param text: The text to search for.
@@ -803,6 +990,11 @@ class FuzzyTerm(MultiTerm):
             characters with 'text'. For example, if text is "light" and
             prefixlength is 2, then only terms starting with "li" are checked
             for similarity.
+        :param maxdist: If this is not None, the query matches terms within
+            this many insertions, deletions or substitutions of 'text' instead
+            of using 'minsimilarity'. The matching terms are found by
+            intersecting a Levenshtein automaton with the term index, so the
+            cost doesn't depend on the number of terms in the field.
         """
 
         if not text:
@@ -813,6 +1005,7 @@ class FuzzyTerm(MultiTerm):
         self.boost = boost
         self.minsimilarity = minsimilarity
         self.prefixlength = prefixlength
+        self.maxdist = maxdist
 
     def __eq__(self, other):
         return (other
@@ -821,12 +1014,17 @@ class FuzzyTerm(MultiTerm):
                 and self.text == other.text
                 and self.minsimilarity == other.minsimilarity
                 and self.prefixlength == other.prefixlength
+                and self.maxdist == other.maxdist
                 and self.boost == other.boost)
 
     def __repr__(self):
-        return "%s(%r, %r, ratio=%f)" % (self.__class__.__name__,
-                                         self.fieldname, self.text,
-                                         self.ratio)
+        r = "%s(%r, %r" % (self.__class__.__name__, self.fieldname, self.text)
+        if self.maxdist is not None:
+            r += ", maxdist=%s" % self.maxdist
+        else:
+            r += ", minsimilarity=%f" % self.minsimilarity
+        r += ")"
+        return r
 
     def __unicode__(self):
         return u"~" + self.text
@@ -834,15 +1032,37 @@ class FuzzyTerm(MultiTerm):
     def _all_terms(self, termset, phrases=True):
         termset.add((self.fieldname, self.text))
 
+    def _similarity_maxdist(self):
+        # Returns the largest edit distance a term can have from the text and
+        # still have a relative similarity above minsimilarity, or None if
+        # there is no useful bound.
+        #
+        # relative() <= (longer - d) / longer, and longer <= len(text) + d, so
+        # a match requires d * minsim < len(text) * (1 - minsim).
+        minsim = self.minsimilarity
+        if minsim <= 0:
+            return None
+        bound = len(self.text) * (1.0 - minsim) / minsim
+        return max(0, int(ceil(bound)) - 1)
+
     def _words(self, ixreader):
         text = self.text
+        prefixlength = self.prefixlength
+
+        if self.maxdist is not None:
+            return ixreader.terms_within(self.fieldname, text, self.maxdist,
+                                         prefix=prefixlength)
+
         minsim = self.minsimilarity
-        for term in ixreader.expand_prefix(self.fieldname,
-                                           text[:self.prefixlength]):
-            if text == term:
-                yield term
-            elif relative(text, term) > minsim:
-                yield term
+        maxdist = self._similarity_maxdist()
+        if maxdist is not None and maxdist <= self.automaton_limit:
+            candidates = ixreader.terms_within(self.fieldname, text, maxdist,
+                                               prefix=prefixlength)
+        else:
+            candidates = ixreader.expand_prefix(self.fieldname,
+                                                text[:prefixlength])
+        return (term for term in candidates
+                if text == term or relative(text, term) > minsim)
 
 
 class TermRange(MultiTerm):
@@ -917,22 +1137,10 @@ class TermRange(MultiTerm):
             return self
 
     def _words(self, ixreader):
-        fieldnum = ixreader.fieldname_to_num(self.fieldname)
-        start = self.start
-        end = self.end
-        startexcl = self.startexcl
-        endexcl = self.endexcl
-
-        for fnum, t, _, _ in ixreader.iter_from(fieldnum, self.start):
-            if fnum != fieldnum:
-                break
-            if t == start and startexcl:
-                continue
-            if t == end and endexcl:
-                break
-            if t > end:
-                break
-            yield t
+        automaton = RangeAutomaton(self.start, self.end,
+                                   self.startexcl, self.endexcl)
+        words = ixreader.expand_automaton(self.fieldname, automaton)
+        return _forward_terms(ixreader, self.fieldname, words)
 
 
 class Variations(MultiTerm):
@@ -944,6 +1152,8 @@ class Variations(MultiTerm):
         self.fieldname = fieldname
         self.text = text
         self.boost = boost
+        
+        from whoosh.lang.morph_en import variations
         self.words = variations(self.text)
 
     def __repr__(self):
@@ -975,6 +1185,61 @@ class Variations(MultiTerm):
             return self
 
 
+class Synonyms(MultiTerm):
+    """Query that searches for the given word and its synonyms in the same
+    field, using a thesaurus such as a
+    :class:`whoosh.lang.wordnet.Thesaurus` or
+    :class:`whoosh.lang.wordnet.SynonymFile`.
+    
+    >>> thes = Thesaurus.from_synonym_file(storage)
+    >>> q = Synonyms("content", u"hail", thes)
+    """
+
+    def __init__(self, fieldname, text, thesaurus, boost=1.0):
+        """
+        :param fieldname: the field to search in.
+        :param text: the word to search for.
+        :param thesaurus: an object with a ``synonyms(word)`` method that
+            returns a list of synonyms for the word.
+        :param boost: a boost factor to apply to the scores of all the terms.
+        """
+
+        self.fieldname = fieldname
+        self.text = text
+        self.thesaurus = thesaurus
+        self.boost = boost
+        self.words = [text] + [unicode(w) for w in thesaurus.synonyms(text)]
+
+    def __repr__(self):
+        r = "%s(%r, %r" % (self.__class__.__name__, self.fieldname, self.text)
+        if self.boost != 1:
+            r += ", boost=%s" % self.boost
+        r += ")"
+        return r
+
+    def __eq__(self, other):
+        return other and self.__class__ is other.__class__ and\
+        self.fieldname == other.fieldname and self.text == other.text and\
+        self.thesaurus is other.thesaurus and self.boost == other.boost
+
+    def _all_terms(self, termset, phrases=True):
+        termset.add((self.fieldname, self.text))
+
+    def _words(self, ixreader):
+        fieldname = self.fieldname
+        return [word for word in self.words if (fieldname, word) in ixreader]
+
+    def __unicode__(self):
+        return u"%s:syn(%s)" % (self.fieldname, self.text)
+
+    def replace(self, oldtext, newtext):
+        if oldtext == self.text:
+            return Synonyms(self.fieldname, newtext, self.thesaurus,
+                            boost=self.boost)
+        else:
+            return self
+
+
 class Phrase(MultiTerm):
     """Matches documents containing a given phrase."""
 
@@ -1040,18 +1305,20 @@ class Phrase(MultiTerm):
     class PostingPhraseScorer(PhraseScorer):
         "Scorer for PhraseQuery that uses Position postings."
 
-        def __init__(self, intersection, slop=1, boost=1.0):
+        def __init__(self, intersection, slop=1, boost=1.0, wordcount=None):
             self.intersection = intersection
             self.slop = slop
             self.boost = boost
+            self.wordcount = wordcount
             self._find()
 
         def _poses(self):
-            # Each sub-scorer of the intersection represents a word in the
-            # phrase. The positions of each word is therefore the value of the
-            # current posting for each sub-scorer.
+            # The first sub-scorers of the intersection represent the words
+            # in the phrase (any others are word pair filters). The positions
+            # of each word is therefore the value of the current posting for
+            # each of these sub-scorers.
             return [scorer.value_as("positions")
-                    for scorer in self.intersection.scorers]
+                    for scorer in self.intersection.scorers[:self.wordcount]]
 
     class VectorPhraseScorer(PhraseScorer):
         "Scorer for PhraseQuery that uses Position term vectors."
@@ -1159,27 +1426,76 @@ class Phrase(MultiTerm):
         fn = self.fieldname
         return And([Term(fn, word) for word in self.words])
 
+    def _bigrams(self, ixreader):
+        # Returns the word pair terms to use to find candidate documents for
+        # this phrase, or None if they can't be used
+        words = self.words
+        pairs = zip(words, words[1:])
+        if (self.slop == 1 and pairs
+            and ixreader.schema[self.fieldname].bigrams
+            # A single occurrence of a word matches a repeated word (see
+            # PhraseScorer._find), which the pairs can't represent
+            and all(first != second for first, second in pairs)):
+            return [bigram_term(first, second) for first, second in pairs]
+        return None
+
     def estimate_size(self, ixreader):
+        bigrams = self._bigrams(ixreader)
+        if bigrams:
+            fieldnum = ixreader.fieldname_to_num(self.fieldname)
+            return min(ixreader.doc_frequency(fieldnum, bigram)
+                       for bigram in bigrams)
         return self._and_query().estimate_size(ixreader)
 
+    def _explain(self, ixreader, depth):
+        # The words (and word pairs) are read in the same order as an And
+        bigrams = self._bigrams(ixreader) or []
+        terms = list(self.words) + bigrams
+        lines = And([Term(self.fieldname, t) for t in terms])._explain(ixreader,
+                                                                       depth)
+        lines[0] = u"%s%s ~%d, rarest first:" % (u"  " * depth, unicode(self),
+                                                 _estimate(self, ixreader))
+        return lines
+
     def scorer(self, searcher, exclude_docs=None):
         fieldnum = searcher.fieldname_to_num(self.fieldname)
+        ixreader = searcher.reader()
+        costs = [ixreader.doc_frequency(fieldnum, word) for word in self.words]
 
         # Shortcut the query if one of the words doesn't exist.
-        ixreader = searcher.reader()
-        for word in self.words:
-            if (fieldnum, word) not in ixreader: return EmptyScorer()
+        if not all(costs):
+            return EmptyScorer()
         
+        # The sub-scorers stay in phrase order so the positions can be
+        # compared, but the intersection is driven by the rarest word
         wordscorers = [Term(self.fieldname, word).scorer(searcher, exclude_docs=exclude_docs)
                        for word in self.words]
-        intersection = IntersectionScorer(wordscorers, boost=self.boost)
+
+        bigrams = self._bigrams(ixreader)
+        if bigrams:
+            # Add the postings of the adjacent word pairs to the intersection
+            # (without scoring them), so the positions only have to be
+            # checked in documents that contain every pair
+            bicosts = [ixreader.doc_frequency(fieldnum, bigram)
+                       for bigram in bigrams]
+            if not all(bicosts):
+                return EmptyScorer()
+            for bigram in bigrams:
+                postreader = searcher.postings(fieldnum, bigram,
+                                               exclude_docs=exclude_docs)
+                wordscorers.append(Term.TermScorer(postreader, _no_score))
+            costs += bicosts
+
+        intersection = IntersectionScorer(wordscorers, boost=self.boost,
+                                          costs=costs)
         if intersection.id is None:
             return EmptyScorer()
 
         field = searcher.field(fieldnum)
         if field.format and field.format.supports("positions"):
             return Phrase.PostingPhraseScorer(intersection, slop=self.slop,
-                                              boost=self.boost)
+                                              boost=self.boost,
+                                              wordcount=len(self.words))
         elif field.vector and field.vector.supports("positions"):
             return Phrase.VectorPhraseScorer(ixreader, fieldnum, self.words,
                                              intersection, slop=self.slop,
@@ -1276,6 +1592,179 @@ class NullQuery(Query):
 NullQuery = NullQuery()
 
 
+class MoreLikeThis(Query):
+    """Matches documents similar to the given documents or text. The query
+    extracts the most important terms in a field of the source documents (terms
+    that occur often in the source but relatively rarely in the collection as a
+    whole, according to a :class:`whoosh.classify.ExpansionModel`) and matches
+    documents containing any of them, with each term boosted by its
+    importance.
+    
+    >>> docnum = searcher.document_number(path=u"/a/b")
+    >>> results = searcher.search(MoreLikeThis("content", docnums=[docnum]))
+    
+    The cost of the query is bounded by ``maxterms``: only the postings of
+    that many terms are ever read, no matter how long the source documents
+    are. The key terms are worked out once per reader and reused by
+    ``estimate_size()``, ``explain()`` and ``scorer()``.
+    
+    To get terms from the source documents, the field should store term
+    vectors. If it doesn't, the stored text of the field (if any) is
+    re-analyzed.
+    """
+
+    def __init__(self, fieldname, docnums=None, text=None, maxterms=25,
+                 model=Bo1Model, normalize=True, minmatch=0,
+                 include_source=False, boost=1.0):
+        """
+        :param fieldname: the field to take terms from and search in.
+        :param docnums: a sequence of document numbers of the source
+            documents.
+        :param text: a unicode string to use as the source instead of (or as
+            well as) documents in the index.
+        :param maxterms: the maximum number of terms to search for.
+        :param model: the :class:`whoosh.classify.ExpansionModel` class to use
+            to rank the terms.
+        :param normalize: whether to normalize the term weights.
+        :param minmatch: only match documents containing at least this number
+            of the terms.
+        :param include_source: if False (the default), the source documents
+            are excluded from the matches.
+        """
+
+        if docnums is None and text is None:
+            raise QueryError("MoreLikeThis needs docnums or text")
+
+        self.fieldname = fieldname
+        self.docnums = tuple(docnums or ())
+        self.text = text
+        self.maxterms = maxterms
+        self.model = model
+        self.normalize_weights = normalize
+        self.minmatch = minmatch
+        self.include_source = include_source
+        self.boost = boost
+        self._cache = None
+
+    def __getstate__(self):
+        # Don't copy or pickle the cached terms (and the reader they belong to)
+        state = self.__dict__.copy()
+        state["_cache"] = None
+        return state
+
+    def __eq__(self, other):
+        return (other and self.__class__ is other.__class__
+                and self.fieldname == other.fieldname
+                and self.docnums == other.docnums
+                and self.text == other.text
+                and self.maxterms == other.maxterms
+                and self.model == other.model
+                and self.normalize_weights == other.normalize_weights
+                and self.minmatch == other.minmatch
+                and self.include_source == other.include_source
+                and self.boost == other.boost)
+
+    def __repr__(self):
+        r = "%s(%r" % (self.__class__.__name__, self.fieldname)
+        if self.docnums:
+            r += ", docnums=%r" % (list(self.docnums), )
+        if self.text is not None:
+            r += ", text=%r" % self.text
+        if self.boost != 1:
+            r += ", boost=%s" % self.boost
+        r += ")"
+        return r
+
+    def __unicode__(self):
+        source = [unicode(docnum) for docnum in self.docnums]
+        if self.text is not None:
+            source.append(u'"%s"' % self.text)
+        return u"%s:like(%s)" % (self.fieldname, u", ".join(source))
+
+    def _source_vectors(self, ixreader):
+        # Yields a sequence of (text, weight) pairs for each source
+        fieldname = self.fieldname
+        field = ixreader.schema[fieldname]
+        fieldnum = ixreader.fieldname_to_num(fieldname)
+        format = field.vector or field.format
+
+        def analyze(value):
+            # Ignores words that aren't in the index, since they can't match
+            # anything and have no collection frequency
+            return [(w, float(freq)) for w, freq, _
+                    in format.word_values(value, mode="index")
+                    if (fieldnum, w) in ixreader]
+
+        for docnum in self.docnums:
+            if field.vector and ixreader.has_vector(docnum, fieldnum):
+                yield ixreader.vector_as("weight", docnum, fieldnum)
+            else:
+                value = ixreader.stored_fields(docnum).get(fieldname)
+                if value:
+                    yield analyze(value)
+
+        if self.text:
+            yield analyze(self.text)
+
+    def key_terms(self, ixreader):
+        """Returns a list of up to ``maxterms`` (text, weight) pairs for the
+        most important terms in the source, best first.
+        """
+
+        cache = self._cache
+        if cache is not None and cache[0] is ixreader:
+            return cache[1]
+
+        expander = Expander(ixreader, self.fieldname, model=self.model)
+        for vector in self._source_vectors(ixreader):
+            expander.add(vector)
+        terms = expander.expanded_terms(self.maxterms,
+                                        normalize=self.normalize_weights)
+
+        self._cache = (ixreader, terms)
+        return terms
+
+    def _existing_terms(self, ixreader, termset, reverse=False, phrases=True):
+        if not reverse:
+            for text, _ in self.key_terms(ixreader):
+                termset.add((self.fieldname, text))
+
+    def estimate_size(self, ixreader):
+        fieldnum = ixreader.fieldname_to_num(self.fieldname)
+        return sum(ixreader.doc_frequency(fieldnum, text)
+                   for text, _ in self.key_terms(ixreader))
+
+    def simplify(self, ixreader):
+        """Returns an :class:`Or` query of the key terms, boosted by their
+        weights.
+        """
+
+        fieldname = self.fieldname
+        boost = self.boost
+        return Or([Term(fieldname, text, boost=weight * boost)
+                   for text, weight in self.key_terms(ixreader)],
+                  minmatch=self.minmatch)
+
+    def scorer(self, searcher, exclude_docs=None):
+        ixreader = searcher.reader()
+        terms = self.key_terms(ixreader)
+        if not terms:
+            return EmptyScorer()
+
+        if self.docnums and not self.include_source:
+            if exclude_docs is None:
+                exclude_docs = BitVector(ixreader.doc_count_all())
+            else:
+                exclude_docs = exclude_docs.copy()
+            exclude_docs.set_from(self.docnums)
+
+        return self.simplify(ixreader).scorer(searcher,
+                                              exclude_docs=exclude_docs)
+
+    def docs(self, searcher, exclude_docs=None):
+        return self.scorer(searcher, exclude_docs=exclude_docs).all_ids()
+
+
 # ===========================================================================================
 #
 # Binary classes
@@ -1305,6 +1794,9 @@ class Require(CompoundQuery):
         self.subqueries = (scoredquery, requiredquery)
         self.boost = boost
 
+    def estimate_size(self, ixreader):
+        return min(q.estimate_size(ixreader) for q in self.subqueries)
+
     def scorer(self, searcher, exclude_docs=None):
         scored, required = self.subqueries
         scorer = RequireScorer(scored.scorer(searcher, exclude_docs=exclude_docs),
@@ -1342,6 +1834,9 @@ class AndMaybe(CompoundQuery):
         self.subqueries = (requiredquery, optionalquery)
         self.boost = boost
 
+    def estimate_size(self, ixreader):
+        return self.subqueries[0].estimate_size(ixreader)
+
     def scorer(self, searcher, exclude_docs=None):
         required, optional = self.subqueries
         scorer = AndMaybeScorer(required.scorer(searcher, exclude_docs=exclude_docs),
@@ -1389,7 +1884,7 @@ class AndNot(Query):
                                self.positive, self.negative)
 
     def __unicode__(self):
-        return u"%s ANDNOT %s" % (self.postive, self.negative)
+        return u"%s ANDNOT %s" % (self.positive, self.negative)
 
     def normalize(self):
         pos = self.positive.normalize()
@@ -1414,6 +1909,16 @@ class AndNot(Query):
         self.positive.existing_terms(ixreader, termset, reverse=reverse,
                                      phrases=phrases)
 
+    def estimate_size(self, ixreader):
+        return self.positive.estimate_size(ixreader)
+
+    def _explain(self, ixreader, depth):
+        indent = u"  " * depth
+        return ([u"%sANDNOT ~%d:" % (indent, _estimate(self, ixreader))]
+                + self.positive._explain(ixreader, depth + 1)
+                + [u"%s  excluding:" % indent]
+                + self.negative._explain(ixreader, depth + 2))
+
     def scorer(self, searcher, exclude_docs=None):
         notvector = _not_vector(searcher, [self.negative], exclude_docs)
         return self.positive.scorer(searcher, exclude_docs=notvector)
@@ -14,30 +14,42 @@
 # limitations under the License.
 #===============================================================================
 
-from bisect import insort
+from array import array
 from collections import defaultdict
+from itertools import repeat
 from threading import Lock
 
-from whoosh.fields import UnknownFieldError
+from whoosh.fields import UnknownFieldError, reverse_term
 from whoosh.index import Index
 from whoosh.ramdb.ramreading import RamIndexReader
 from whoosh.writing import IndexWriter
 
 
 class RamIndex(Index):
+    """An index kept entirely in memory.
+    
+    The postings for each term are stored as an array of document numbers, an
+    array of frequencies and a list of encoded values. The terms of each field
+    are kept in a sorted list, but terms added since the list was last sorted
+    are collected separately and only sorted into the list when a reader needs
+    the terms in order, so adding a document doesn't get slower as the
+    vocabulary grows.
+    """
+    
     def __init__(self, schema):
         self.schema = schema
         self.maxdoc = 0
         self._sync_lock = Lock()
         
-        self.termlists = defaultdict(list)
-        self.invertedindex = {}
-        for fieldnum in xrange(len(schema)):
-            self.invertedindex[fieldnum] = defaultdict(list)
+        numfields = len(schema)
+        self.termlists = dict((fnum, []) for fnum in xrange(numfields))
+        self._newterms = dict((fnum, []) for fnum in xrange(numfields))
+        self.invertedindex = dict((fnum, {}) for fnum in xrange(numfields))
         self.indexfreqs = defaultdict(int)
         
-        self.storedfields = {}
-        self.fieldlengths = defaultdict(int)
+        self.storedfields = []
+        self.fieldlengths = dict((fnum, array("I"))
+                                 for fnum in xrange(numfields))
         self.fieldlength_totals = defaultdict(int)
         self.vectors = {}
         self.deleted = set()
@@ -56,9 +68,141 @@ class RamIndex(Index):
     def writer(self):
         return RamIndexWriter(self)
     
+    def sorted_terms(self, fieldnum):
+        """Returns a sorted list of the terms in the given field. Terms added
+        since the last call are sorted into the list first. The returned list
+        is never modified afterwards, so it's safe to iterate over it while
+        documents are being added.
+        """
+        
+        if self._newterms[fieldnum]:
+            self._sync_lock.acquire()
+            try:
+                newterms = self._newterms[fieldnum]
+                if newterms:
+                    # The list is two sorted runs, which sort() merges in
+                    # linear time
+                    newterms.sort()
+                    terms = self.termlists[fieldnum] + newterms
+                    terms.sort()
+                    self.termlists[fieldnum] = terms
+                    self._newterms[fieldnum] = []
+            finally:
+                self._sync_lock.release()
+        return self.termlists[fieldnum]
+    
     def optimize(self):
-        # TODO: Write this
-        pass
+        """Removes deleted documents from the index and renumbers the remaining
+        documents to fill the gaps. This builds new structures instead of
+        changing the existing ones, so readers created before calling this
+        method keep seeing the index as it was.
+        """
+        
+        deleted = self.deleted
+        if not deleted:
+            return
+        
+        self._sync_lock.acquire()
+        try:
+            # Map each old document number to its new number, or -1 if the
+            # document is deleted
+            docmap = array("i")
+            newdoc = 0
+            for docnum in xrange(self.maxdoc):
+                if docnum in deleted:
+                    docmap.append(-1)
+                else:
+                    docmap.append(newdoc)
+                    newdoc += 1
+            
+            invertedindex = {}
+            termlists = {}
+            indexfreqs = defaultdict(int)
+            for fieldnum, fielddict in self.invertedindex.iteritems():
+                newdict = {}
+                for text, (ids, freqs, values) in fielddict.iteritems():
+                    newids, newfreqs, newvalues = array("I"), array("I"), []
+                    for i, docnum in enumerate(ids):
+                        newnum = docmap[docnum]
+                        if newnum >= 0:
+                            newids.append(newnum)
+                            newfreqs.append(freqs[i])
+                            newvalues.append(values[i])
+                    if newids:
+                        newdict[text] = (newids, newfreqs, newvalues)
+                        indexfreqs[(fieldnum, text)] = sum(newfreqs)
+                invertedindex[fieldnum] = newdict
+                termlists[fieldnum] = sorted(newdict)
+            
+            fieldlengths = {}
+            fieldlength_totals = defaultdict(int)
+            for fieldnum, lengths in self.fieldlengths.iteritems():
+                newlengths = array("I", (length for docnum, length
+                                         in enumerate(lengths)
+                                         if docmap[docnum] >= 0))
+                fieldlengths[fieldnum] = newlengths
+                fieldlength_totals[fieldnum] = sum(newlengths)
+            
+            self.vectors = dict(((docmap[docnum], fieldnum), vlist)
+                                for (docnum, fieldnum), vlist
+                                in self.vectors.iteritems()
+                                if docmap[docnum] >= 0)
+            self.storedfields = [values for docnum, values
+                                 in enumerate(self.storedfields)
+                                 if docmap[docnum] >= 0]
+            self.invertedindex = invertedindex
+            self.termlists = termlists
+            self._newterms = dict((fnum, []) for fnum in termlists)
+            self.indexfreqs = indexfreqs
+            self.fieldlengths = fieldlengths
+            self.fieldlength_totals = fieldlength_totals
+            self.deleted = set()
+            self.maxdoc = newdoc
+        finally:
+            self._sync_lock.release()
+    
+    # Methods for adding the analyzed contents of a document. These are used
+    # by RamIndexWriter, and by SegmentWriter to keep a searchable in-memory
+    # copy of the documents it has buffered (see FileIndexWriter's nrt
+    # argument).
+    
+    def add_posting(self, fieldnum, text, docnum, freq, valuestring):
+        fielddict = self.invertedindex[fieldnum]
+        if text in fielddict:
+            ids, freqs, values = fielddict[text]
+            ids.append(docnum)
+            freqs.append(freq)
+            values.append(valuestring)
+        else:
+            # Readers on other threads may look at the inverted index while
+            # documents are added, so only publish a new term once its first
+            # posting is in place
+            fielddict[text] = (array("I", (docnum, )), array("I", (freq, )),
+                               [valuestring])
+            self._sync_lock.acquire()
+            try:
+                self._newterms[fieldnum].append(text)
+            finally:
+                self._sync_lock.release()
+        self.indexfreqs[(fieldnum, text)] += freq
+    
+    def add_field_length(self, docnum, fieldnum, length):
+        self.fieldlength_totals[fieldnum] += length
+        lengths = self.fieldlengths[fieldnum]
+        if len(lengths) < docnum:
+            lengths.extend(repeat(0, docnum - len(lengths)))
+        lengths.append(length)
+    
+    def add_vector(self, docnum, fieldnum, vlist):
+        self.vectors[(docnum, fieldnum)] = vlist
+    
+    def finish_document(self, storedvalues):
+        """Stores the given list of stored field values for the current
+        document and moves on to the next document number.
+        """
+        
+        self.storedfields.append(storedvalues)
+        self.maxdoc += 1
 
 
 class RamIndexWriter(IndexWriter):
@@ -68,13 +212,9 @@ class RamIndexWriter(IndexWriter):
         self._stored_to_pos = dict((fnum, i) for i, fnum in enumerate(self.schema.stored_fields()))
         
     def add_document(self, **fields):
-        schema = self.ix.schema
-        invertedindex = self.ix.invertedindex
-        indexfreqs = self.ix.indexfreqs
-        fieldlengths = self.ix.fieldlengths
-        fieldlength_totals = self.ix.fieldlength_totals
-        termlists = self.ix.termlists
-        maxdoc = self.ix.maxdoc
+        ix = self.ix
+        schema = ix.schema
+        maxdoc = ix.maxdoc
         
         fieldnames = [name for name in fields.keys() if not name.startswith("_")]
         fieldnames.sort(key = schema.name_to_number)
@@ -96,41 +236,40 @@ class RamIndexWriter(IndexWriter):
                 if format.analyzer:
                     if format.textual and not isinstance(value, unicode):
                         raise ValueError("%r in field %s is not unicode" % (value, name))
-                    
-                count = 0
-                unique = 0
                 
-                fieldlist = termlists[fieldnum]
-                fielddict = invertedindex[fieldnum]
-                for w, freq, valuestring in field.index(value):
-                    if w not in fielddict:
-                        insort(fieldlist, w)
-                    fielddict[w].append((maxdoc, valuestring))
-                    indexfreqs[(fieldnum, w)] += freq
-                    count += freq
-                    unique += 1
-                
-                if field.scorable:
-                    fieldlength_totals[fieldnum] += count
-                    fieldlengths[(maxdoc, fieldnum)] = count
+                if field.indexed:
+                    count = 0
+                    for w, freq, valuestring in field.index(value):
+                        ix.add_posting(fieldnum, w, maxdoc, freq, valuestring)
+                        if field.reverse:
+                            ix.add_posting(fieldnum, reverse_term(w), maxdoc,
+                                           freq, valuestring)
+                        count += freq
                     
-            vector = field.vector
-            if vector:
-                vlist = sorted((w, valuestring) for w, freq, valuestring
-                               in vector.word_values(value))
-                self.ix.vectors[(maxdoc, fieldnum)] = vlist
-            
-            if field.stored:
-                storedname = "_stored_" + name
-                if storedname in fields:
-                    stored_value = fields[storedname]
-                else :
-                    stored_value = value
+                    if field.bigrams:
+                        for w, freq, valuestring in field.index_bigrams(value):
+                            ix.add_posting(fieldnum, w, maxdoc, freq,
+                                           valuestring)
+                    
+                    if field.scorable:
+                        ix.add_field_length(maxdoc, fieldnum, count)
+                    
+                vector = field.vector
+                if vector:
+                    vlist = sorted((w, valuestring) for w, freq, valuestring
+                                   in vector.word_values(value, mode="index"))
+                    ix.add_vector(maxdoc, fieldnum, vlist)
                 
-                storedvalues[stored_to_pos[fieldnum]] = stored_value
+                if field.stored:
+                    storedname = "_stored_" + name
+                    if storedname in fields:
+                        stored_value = fields[storedname]
+                    else :
+                        stored_value = value
+                    
+                    storedvalues[stored_to_pos[fieldnum]] = stored_value
         
-        self.ix.storedfields[maxdoc] = storedvalues
-        self.ix.maxdoc += 1
+        ix.finish_document(storedvalues)
     
     def delete_document(self, docnum, delete=True):
         if delete:
@@ -145,9 +284,3 @@ class RamIndexWriter(IndexWriter):
     def cancel(self):
         # No op
         pass
-
-
-
-
-
-    
\ No newline at end of file
@@ -15,195 +15,254 @@
 #===============================================================================
 
 from bisect import bisect_left
-from time import clock as now
+from itertools import islice, izip
 
-from whoosh.postings import PostingReader, ReadTooFar
-from whoosh.reading import IndexReader
+from whoosh.fields import REVERSE_MARK
+from whoosh.postings import PostingReader, CachedPostingReader, ReadTooFar
+from whoosh.reading import IndexReader, TermNotFound
 
 
 class RamIndexReader(IndexReader):
+    """Reads from a :class:`whoosh.ramdb.ramindex.RamIndex`. The reader only
+    sees the documents that were in the index when it was created, so a
+    reader stays consistent while more documents are added to the index or
+    the index is optimized.
+    """
+    
     def __init__(self, ix):
         self.ix = ix
         self.schema = ix.schema
+        self.maxdoc = ix.maxdoc
         self._stored_field_names = ix.schema.stored_field_names()
         self._scorable_fields = ix.schema.scorable_fields()
         
+        # RamIndex.optimize() replaces these instead of modifying them, so
+        # keep references to the current ones
+        self.invertedindex = ix.invertedindex
+        self.indexfreqs = ix.indexfreqs
+        self.storedfields = ix.storedfields
+        self.fieldlengths = ix.fieldlengths
+        self.fieldlength_totals = ix.fieldlength_totals
+        self.vectors = ix.vectors
+        self.deleted = ix.deleted
+        self._termlists = {}
+        
     def __contains__(self, term):
         fieldid, text = term
-        fieldnum = self.ix.schema.to_number(fieldid)
-        inv = self.ix.invertedindex
-        return fieldnum in inv and text in inv[fieldnum]
+        fieldnum = self.schema.to_number(fieldid)
+        inv = self.invertedindex
+        return (fieldnum in inv and text in inv[fieldnum]
+                and inv[fieldnum][text][0][0] < self.maxdoc)
     
     def close(self):
         pass
     
     def has_deletions(self):
-        return len(self.ix.deleted) > 0
+        return len(self.deleted) > 0
     
     def is_deleted(self, docnum):
-        return docnum in self.ix.deleted
+        return docnum in self.deleted
     
     def stored_fields(self, docnum):
-        return dict(zip(self._stored_field_names, self.ix.storedfields[docnum]))
+        if docnum >= self.maxdoc:
+            raise IndexError(docnum)
+        return dict(zip(self._stored_field_names, self.storedfields[docnum]))
     
     def all_stored_fields(self):
-        sfn = self._stored_field_names
-        for sfs in self.ix.storedfields:
-            yield dict(zip(sfn, sfs))
+        for docnum in xrange(self.maxdoc):
+            if docnum not in self.deleted:
+                yield self.stored_fields(docnum)
             
     def doc_count_all(self):
-        return self.ix.doc_count_all()
+        return self.maxdoc
     
     def doc_count(self):
-        return self.ix.doc_count()
+        deleted = self.deleted
+        return self.maxdoc - len([d for d in deleted if d < self.maxdoc])
     
     def field_length(self, fieldid):
-        fieldnum = self.ix.schema.to_number(fieldid)
-        return self.ix.fieldlength_totals[fieldnum]
+        fieldnum = self.schema.to_number(fieldid)
+        return self.fieldlength_totals[fieldnum]
     
     def doc_field_length(self, docnum, fieldid):
-        fieldnum = self.ix.schema.to_number(fieldid)
-        return self.ix.fieldlengths[(docnum, fieldnum)]
+        fieldnum = self.schema.to_number(fieldid)
+        lengths = self.fieldlengths[fieldnum]
+        if docnum < len(lengths) and docnum < self.maxdoc:
+            return lengths[docnum]
+        return 0
     
     def doc_field_lengths(self, docnum):
         dfl = self.doc_field_length
         return [dfl(docnum, fnum) for fnum in self._scorable_fields]
     
-    def has_vector(self, docnum, fieldnum):
-        return (docnum, fieldnum) in self.ix.vectors
+    def has_vector(self, docnum, fieldid):
+        fieldnum = self.schema.to_number(fieldid)
+        return docnum < self.maxdoc and (docnum, fieldnum) in self.vectors
+    
+    def vector(self, docnum, fieldid):
+        fieldnum = self.schema.to_number(fieldid)
+        vformat = self.schema[fieldnum].vector
+        return CachedPostingReader(self.vectors[(docnum, fieldnum)],
+                                   format=vformat)
+    
+    def _postings(self, fieldnum, text):
+        # Returns the (ids, freqs, values) postings for the given term and the
+        # number of postings this reader can see
+        ids, freqs, values = self.invertedindex[fieldnum][text]
+        count = len(ids)
+        if count and ids[-1] >= self.maxdoc:
+            count = bisect_left(ids, self.maxdoc)
+        return ids, freqs, values, count
+    
+    def sorted_terms(self, fieldnum):
+        """Returns a sorted list of the terms in the given field number. The
+        list may include terms that only occur in documents added after this
+        reader was created.
+        """
+        
+        if self.invertedindex is self.ix.invertedindex:
+            return self.ix.sorted_terms(fieldnum)
+        
+        # The index was optimized after this reader was created, so sort the
+        # terms of the old inverted index (which no longer changes)
+        if fieldnum not in self._termlists:
+            self._termlists[fieldnum] = sorted(self.invertedindex[fieldnum])
+        return self._termlists[fieldnum]
+    
+    def _terms(self, fieldnum, start=None):
+        ixf = self.indexfreqs
+        fieldtexts = self.sorted_terms(fieldnum)
+        if start:
+            fieldtexts = islice(fieldtexts, bisect_left(fieldtexts, start), None)
+        fielddict = self.invertedindex[fieldnum]
+        maxdoc = self.maxdoc
+        for text in fieldtexts:
+            ids, freqs, _ = fielddict[text]
+            if ids[-1] < maxdoc:
+                yield (fieldnum, text, len(ids), ixf[(fieldnum, text)])
+            elif ids[0] < maxdoc:
+                count = bisect_left(ids, maxdoc)
+                yield (fieldnum, text, count, sum(islice(freqs, count)))
     
     def __iter__(self):
-        tls = self.ix.termlists
-        inv = self.ix.invertedindex
-        ixf = self.ix.indexfreqs
-        for fieldnum in sorted(tls.keys()):
-            for text in tls[fieldnum]:
-                docfreq = len(inv[fieldnum][text])
-                indexfreq = ixf[(fieldnum, text)]
-                yield (fieldnum, text, docfreq, indexfreq)
+        for fieldnum in sorted(self.invertedindex.keys()):
+            for item in self._terms(fieldnum):
+                yield item
                 
     def doc_frequency(self, fieldid, text):
-        fieldnum = self.ix.schema.to_number(fieldid)
-        return len(self.ix.invertedindex[fieldnum][text])
+        fieldnum = self.schema.to_number(fieldid)
+        if (fieldnum, text) not in self:
+            return 0
+        return self._postings(fieldnum, text)[3]
     
     def frequency(self, fieldid, text):
-        fieldnum = self.ix.schema.to_number(fieldid)
-        return self.ix.indexfreq[(fieldnum, text)]
+        fieldnum = self.schema.to_number(fieldid)
+        if (fieldnum, text) not in self:
+            return 0
+        ids, freqs, _, count = self._postings(fieldnum, text)
+        if count == len(ids):
+            return self.indexfreqs[(fieldnum, text)]
+        return sum(islice(freqs, count))
     
     def iter_from(self, fieldid, text):
-        tls = self.ix.termlists
-        inv = self.ix.invertedindex
-        ixf = self.ix.indexfreqs
-        for fieldnum in sorted(tls.keys()):
-            fieldtexts = tls[fieldnum]
-            start = bisect_left(fieldtexts, text)
-            for text in fieldtexts[start:]:
-                docfreq = len(inv[fieldnum][text])
-                indexfreq = ixf[(fieldnum, text)]
-                yield (fieldnum, text, docfreq, indexfreq)
+        fieldnum = self.schema.to_number(fieldid)
+        for fn in sorted(self.invertedindex.keys()):
+            if fn < fieldnum:
+                continue
+            elif fn == fieldnum:
+                start = text
+            else:
+                start = None
+            for item in self._terms(fn, start):
+                yield item
     
     def lexicon(self, fieldid):
-        fieldnum = self.ix.schema.to_number(fieldid)
-        return self.ix.termlists[fieldnum]
+        fieldnum = self.schema.to_number(fieldid)
+        return [text for _, text, _, _ in self._terms(fieldnum)
+                if not text.startswith(REVERSE_MARK)]
     
     def expand_prefix(self, fieldid, prefix):
-        fieldnum = self.ix.schema.to_number(fieldid)
-        fieldtexts = self.ix.termlists[fieldnum]
-        start = bisect_left(fieldtexts, prefix)
-        for text in fieldtexts[start:]:
-            if text.startswith(prefix):
+        fieldnum = self.schema.to_number(fieldid)
+        for _, text, _, _ in self._terms(fieldnum, prefix):
+            if text.startswith(prefix) and not text.startswith(REVERSE_MARK):
                 yield text
             else:
                 break
             
     def postings(self, fieldid, text, exclude_docs = None):
-        fieldnum = self.ix.schema.to_number(fieldid)
-        if not exclude_docs:
-            exclude_docs = frozenset()
-        excludeset = self.ix.deleted | exclude_docs
-        inv = self.ix.invertedindex
+        fieldnum = self.schema.to_number(fieldid)
+        if (fieldnum, text) not in self:
+            raise TermNotFound(fieldnum, text)
+        
+        deleted = self.deleted
         format = self.schema[fieldnum].format
-        postings = inv[fieldnum][text]
-        if excludeset:
-            postings = [(docnum, stringvalue) for docnum, stringvalue
-                        in postings if docnum not in excludeset]
-        return RamPostingReader(format, postings)
+        ids, _, values, count = self._postings(fieldnum, text)
+        if deleted or exclude_docs:
+            if not exclude_docs:
+                exclude_docs = frozenset()
+            keep = [i for i in xrange(count)
+                    if ids[i] not in deleted and ids[i] not in exclude_docs]
+            ids = [ids[i] for i in keep]
+            values = [values[i] for i in keep]
+            count = len(keep)
+        return RamPostingReader(format, ids, values, count)
 
 
 class RamPostingReader(PostingReader):
-    def __init__(self, format, postings):
+    """Reads postings from parallel sequences of document numbers and encoded
+    values. Only the first ``count`` postings are read, so the sequences can be
+    shared with an index that's still adding documents.
+    """
+    
+    def __init__(self, format, ids, values, count=None):
         self.format = format
-        self.postings = postings
+        self.ids = ids
+        self.values = values
+        if count is None:
+            count = len(ids)
+        self.count = count
         self.reset()
     
     def reset(self):
         self.i = 0
-        self.id = self.postings[0][0]
+        if self.count:
+            self.id = self.ids[0]
+        else:
+            self.id = None
     
     def all_items(self):
-        print "all_items"
-        return self.postings
+        count = self.count
+        return izip(islice(self.ids, count), islice(self.values, count))
     
     def all_ids(self):
-        return (id for id, _ in self.postings)
+        return islice(self.ids, self.count)
     
     def next(self):
         if self.id is None:
             raise ReadTooFar
         
-        postings = self.postings
-        i = self.i
-        
-        i += 1
-        if i < len(postings):
-            self.id = postings[i][0]
+        i = self.i + 1
+        if i < self.count:
+            self.id = self.ids[i]
         else:
             self.id = None
         self.i = i
     
     def skip_to(self, target):
-        if target <= self.id:
-            return
         if self.id is None:
             raise ReadTooFar
+        if target <= self.id:
+            return
         
-        postings = self.postings
-        i = self.i
-        
-        while i < len(postings):
-            i += 1
-            if i == len(postings):
-                self.id = None
-                break
-            elif postings[i][0] >= target:
-                self.id = postings[i][0]
-                break
-            
+        i = bisect_left(self.ids, target, self.i + 1, self.count)
+        if i < self.count:
+            self.id = self.ids[i]
+        else:
+            self.id = None
         self.i = i
     
     def value(self):
         if self.id is None:
             raise ReadTooFar
         
-        return self.postings[self.i][1]
-    
-    
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-    
-    
+        return self.values[self.i]
@@ -18,9 +18,10 @@
 """
 
 from bisect import bisect_right
+from collections import defaultdict
 from heapq import heapify, heapreplace, heappop, nlargest
 
-from whoosh.fields import UnknownFieldError
+from whoosh.fields import UnknownFieldError, REVERSE_MARK
 from whoosh.util import ClosableMixin
 from whoosh.postings import MultiPostingReader
 
@@ -63,6 +64,28 @@ class IndexReader(ClosableMixin):
         """
         raise NotImplementedError
 
+    def stored_fields_many(self, docnums, fields=None):
+        """Returns a list of the stored fields of the given document numbers,
+        in the same order as the document numbers. Backends may read the
+        documents in sorted order and only decode the requested fields, so
+        this is faster than calling stored_fields() for each document, for
+        example to display a page of search results.
+        
+        :param docnums: a sequence of document numbers.
+        :param fields: an optional list of the names of the stored fields to
+            return. If this is None, all stored fields are returned.
+        :rtype: list of dicts
+        """
+
+        result = []
+        for docnum in docnums:
+            storedfields = self.stored_fields(docnum)
+            if fields is not None:
+                storedfields = dict((name, storedfields[name])
+                                    for name in fields if name in storedfields)
+            result.append(storedfields)
+        return result
+
     def all_stored_fields(self):
         """Yields the stored fields for all documents.
         """
@@ -205,10 +228,60 @@ class IndexReader(ClosableMixin):
 
         fieldid = self.schema.to_number(fieldid)
         for fn, t, _, _ in self.iter_from(fieldid, prefix):
-            if fn != fieldid or not t.startswith(prefix):
+            if (fn != fieldid or not t.startswith(prefix)
+                or t.startswith(REVERSE_MARK)):
+                return
+            yield t
+
+    def terms_from(self, fieldid, text):
+        """Yields the terms in the given field that are greater than or equal
+        to the given text, in order.
+        
+        Unlike the other methods that list terms, this includes the internal
+        reversed and word pair terms indexed by fields with ``reverse=True``
+        or ``bigrams=True`` (see :func:`whoosh.fields.reverse_term` and
+        :func:`whoosh.fields.bigram_term`), which sort at the end of the
+        field.
+        """
+
+        fieldid = self.schema.to_number(fieldid)
+        for fn, t, _, _ in self.iter_from(fieldid, text):
+            if fn != fieldid:
                 return
             yield t
 
+    def expand_automaton(self, fieldid, automaton):
+        """Yields the terms in the given field that are accepted by the given
+        automaton (see :mod:`whoosh.support.automata`).
+        
+        This method uses the automaton's ``next_valid_string()`` method to
+        jump forward in the term index past terms that can't match, so it
+        doesn't look at every term in the field.
+        """
+
+        from whoosh.support.automata import find_all_matches
+
+        fieldid = self.schema.to_number(fieldid)
+
+        def terms_from(s):
+            return self.terms_from(fieldid, s)
+        return find_all_matches(automaton, terms_from)
+
+    def terms_within(self, fieldid, text, maxdist, prefix=0):
+        """Yields terms in the given field that are within ``maxdist`` edits
+        (insertions, deletions or substitutions) of the given text, using
+        :meth:`IndexReader.expand_automaton`.
+        
+        :param prefix: the number of initial characters of the text that must
+            match exactly.
+        """
+
+        from whoosh.support.automata import levenshtein_automaton
+
+        dfa = levenshtein_automaton(text, maxdist, prefix=prefix).to_dfa()
+        return (t for t in self.expand_automaton(fieldid, dfa)
+                if not t.startswith(REVERSE_MARK))
+
     def all_terms(self):
         """Yields (fieldname, text) tuples for every term in the index.
         """
@@ -232,7 +305,7 @@ class IndexReader(ClosableMixin):
 
         fieldid = self.schema.to_number(fieldid)
         for fn, t, docfreq, freq in self.iter_from(fieldid, prefix):
-            if fn != fieldid:
+            if fn != fieldid or t.startswith(REVERSE_MARK):
                 return
             yield t, docfreq, freq
 
@@ -243,7 +316,8 @@ class IndexReader(ClosableMixin):
 
         fieldid = self.schema.to_number(fieldid)
         for fn, t, docfreq, colfreq in self.iter_from(fieldid, prefix):
-            if fn != fieldid or not t.startswith(prefix):
+            if (fn != fieldid or not t.startswith(prefix)
+                or t.startswith(REVERSE_MARK)):
                 return
             yield (t, docfreq, colfreq)
 
@@ -304,6 +378,23 @@ class MultiReader(IndexReader):
         segmentnum, segmentdoc = self._segment_and_docnum(docnum)
         return self.readers[segmentnum].stored_fields(segmentdoc)
 
+    def stored_fields_many(self, docnums, fields=None):
+        # Group the document numbers by segment so each sub-reader can read
+        # its documents in one batch
+        bysegment = defaultdict(list)
+        for docnum in docnums:
+            segmentnum, segmentdoc = self._segment_and_docnum(docnum)
+            bysegment[segmentnum].append(segmentdoc)
+
+        found = {}
+        for segmentnum, segmentdocs in bysegment.iteritems():
+            offset = self.doc_offsets[segmentnum]
+            reader = self.readers[segmentnum]
+            for segmentdoc, storedfields in zip(segmentdocs,
+                                                reader.stored_fields_many(segmentdocs, fields)):
+                found[offset + segmentdoc] = storedfields
+        return [found[docnum] for docnum in docnums]
+
     def all_stored_fields(self):
         for reader in self.readers:
             for result in reader.all_stored_fields():
@@ -390,7 +481,10 @@ class MultiReader(IndexReader):
 
         current = []
         for it in iterlist:
-            fnum, text, docfreq, termcount = it.next()
+            try:
+                fnum, text, docfreq, termcount = it.next()
+            except StopIteration:
+                continue
             current.append((fnum, text, docfreq, termcount, it))
         heapify(current)
 
@@ -26,6 +26,7 @@ import sys, time
 from whoosh import classify, query, scoring
 from whoosh.scoring import Sorter, FieldSorter
 from whoosh.support.bitvector import BitVector
+from whoosh.util import LRUCache
 
 if sys.platform == 'win32':
     now = time.clock
@@ -40,12 +41,15 @@ class Searcher(object):
     methods for searching the index.
     """
 
-    def __init__(self, ixreader, weighting=scoring.BM25F):
+    def __init__(self, ixreader, weighting=scoring.BM25F, doccache_size=0):
         """
         :param ixreader: An :class:`~whoosh.reading.IndexReader` object for
             the index to search.
         :param weighting: A :class:`whoosh.scoring.Weighting` object to use to
             score found documents.
+        :param doccache_size: the number of documents to keep in a
+            least-recently-used cache for :meth:`Searcher.stored_fields_many`.
+            The default is 0 (no cache).
         """
 
         self.ixreader = ixreader
@@ -62,6 +66,9 @@ class Searcher(object):
 
         self.is_closed = False
         self._idf_cache = {}
+        self._doc_cache = None
+        if doccache_size:
+            self._doc_cache = LRUCache(doccache_size)
 
     #def __del__(self):
     #    if hasattr(self, "is_closed") and not self.is_closed:
@@ -90,6 +97,46 @@ class Searcher(object):
         cache[term] = idf
         return idf
 
+    def stored_fields_many(self, docnums, fields=None):
+        """Returns a list of the stored fields of the given document numbers,
+        in the same order as the document numbers. This is faster than
+        calling stored_fields() for each document, for example to display a
+        page of search results.
+        
+        >>> searcher.stored_fields_many(results.scored_list[:10],
+        ...                             fields=["title", "url"])
+        
+        :param docnums: a sequence of document numbers.
+        :param fields: an optional list of the names of the stored fields to
+            return. If this is None, all stored fields are returned.
+        :rtype: list of dicts
+        """
+
+        cache = self._doc_cache
+        if cache is None:
+            return self.ixreader.stored_fields_many(docnums, fields)
+
+        if fields is not None:
+            fields = tuple(fields)
+
+        found = {}
+        missing = []
+        for docnum in docnums:
+            storedfields = cache.get((docnum, fields))
+            if storedfields is None:
+                missing.append(docnum)
+            else:
+                found[docnum] = storedfields
+
+        if missing:
+            for docnum, storedfields in zip(missing,
+                                            self.ixreader.stored_fields_many(missing, fields)):
+                cache[(docnum, fields)] = storedfields
+                found[docnum] = storedfields
+
+        # Return copies so the caller can't change the cached dictionaries
+        return [dict(found[docnum]) for docnum in docnums]
+
     def document(self, **kw):
         """Convenience method returns the stored fields of a document
         matching the given keyword arguments, where the keyword keys are
@@ -160,6 +207,28 @@ class Searcher(object):
         if q:
             return q.docs(self)
 
+    def suggest(self, fieldname, text, number=3, maxdist=2, prefix=0):
+        """Returns a list of suggested alternative spellings of 'text' from
+        the terms in the given field of this searcher's index, ordered by
+        edit distance and then by document frequency. See
+        :class:`whoosh.spelling.ReaderSpellChecker`.
+        
+        >>> searcher.suggest("content", u"woosh")
+        [u"whoosh"]
+        
+        :param number: The maximum number of suggestions to return.
+        :param maxdist: The maximum edit distance between the text and the
+            suggestions.
+        :param prefix: The number of initial characters of the text that the
+            suggestions must match exactly.
+        """
+
+        from whoosh.spelling import ReaderSpellChecker
+
+        sp = ReaderSpellChecker(self.ixreader, fieldname, maxdist=maxdist,
+                                prefix=prefix)
+        return sp.suggest(text, number=number)
+
     def key_terms(self, docnums, fieldname, numterms=5,
                   model=classify.Bo1Model, normalize=True):
         """Returns the 'numterms' most important terms from the documents
@@ -185,9 +254,9 @@ class Searcher(object):
         ixreader = self.ixreader
         fieldnum = self.fieldname_to_num(fieldname)
 
-        expander = classify.Expander(self, fieldname, model=model)
+        expander = classify.Expander(ixreader, fieldname, model=model)
         for docnum in docnums:
-            expander.add(ixreader.vector_as(docnum, fieldnum, "weight"))
+            expander.add(ixreader.vector_as("weight", docnum, fieldnum))
         return expander.expanded_terms(numterms, normalize=normalize)
 
     def search_page(self, query, pagenum, pagelen=10, **kwargs):
@@ -413,11 +482,11 @@ class Results(object):
         return self.docs.count()
 
     def __getitem__(self, n):
-        stored_fields = self.searcher.stored_fields
         if isinstance(n, slice):
-            return [stored_fields(i) for i in self.scored_list.__getitem__(n)]
+            docnums = self.scored_list.__getitem__(n)
+            return self.searcher.stored_fields_many(docnums)
         else:
-            return stored_fields(self.scored_list[n])
+            return self.searcher.stored_fields(self.scored_list[n])
 
     def __iter__(self):
         """Yields the stored fields of each result document in ranked order.
@@ -426,10 +495,17 @@ class Results(object):
         for docnum in self.scored_list:
             yield stored_fields(docnum)
 
-    def iterslice(self, start, stop, step=1):
-        stored_fields = self.searcher.stored_fields
-        for docnum in self.scored_list[start:stop:step]:
-            yield stored_fields(docnum)
+    def iterslice(self, start, stop, step=1, fields=None):
+        """Yields the stored fields of the hits in the given slice of the
+        results, reading them all at once with
+        :meth:`Searcher.stored_fields_many`.
+        
+        :param fields: an optional list of the names of the stored fields to
+            return. If this is None, all stored fields are returned.
+        """
+        docnums = self.scored_list[start:stop:step]
+        for storedfields in self.searcher.stored_fields_many(docnums, fields):
+            yield storedfields
 
     @property
     def total(self):
@@ -507,6 +583,59 @@ class Results(object):
 
         return expander.expanded_terms(numterms, normalize=normalize)
 
+    def highlights(self, n, fieldname, start=0, top=3, fragmenter=None,
+                   formatter=None):
+        """Returns a list of highlighted excerpts from the stored text of the
+        given field for the ``n`` hits starting at position ``start``, with
+        the terms of the query highlighted.
+        
+        If the field's term vectors or postings store character offsets (for
+        example ``TEXT(chars=True)``), this method gets the offsets of the
+        matched terms for all the hits at once from the index and only slices
+        the stored text around the best fragments. Otherwise it falls back to
+        re-analyzing the stored text of each hit.
+        
+        :param n: the number of hits to highlight.
+        :param fieldname: the name of the field to highlight. This field must
+            be stored.
+        :param start: the position of the first hit to highlight.
+        :param top: the maximum number of fragments to use for each hit.
+        :param fragmenter: the fragmenter to use. The default is
+            :class:`whoosh.highlight.OffsetFragmenter`.
+        :param formatter: the formatter to use. The default is
+            :class:`whoosh.highlight.HtmlFormatter`.
+        :returns: list of strings.
+        """
+
+        from whoosh import highlight
+        
+        fragmenter = fragmenter or highlight.OffsetFragmenter()
+        formatter = formatter or highlight.HtmlFormatter()
+
+        reader = self.searcher.reader()
+        docnums = self.scored_list[start:start + n]
+        terms = frozenset(text for fname, text
+                          in self.query.existing_terms(reader)
+                          if fname == fieldname)
+
+        offsets = highlight.term_offsets(reader, fieldname, docnums, terms)
+        if offsets is None:
+            analyzer = self.searcher.field(fieldname).format.analyzer
+
+        stored_fields = self.searcher.stored_fields
+        excerpts = []
+        for docnum in docnums:
+            text = stored_fields(docnum).get(fieldname, u"")
+            if offsets is None:
+                excerpt = highlight.highlight(text, terms, analyzer,
+                                              fragmenter, formatter, top=top)
+            else:
+                excerpt = highlight.highlight_offsets(text, offsets[docnum],
+                                                      fragmenter, formatter,
+                                                      top=top)
+            excerpts.append(excerpt)
+        return excerpts
+
     def extend(self, results):
         """Appends hits from 'results' (that are not already in this
         results object) to the end of these results.
@@ -653,6 +782,13 @@ class ResultsPage(object):
         """
         return self.results.scored_list[n + self.offset]
 
+    def highlights(self, fieldname, **kwargs):
+        """Returns a list of highlighted excerpts for the hits on this page.
+        See :meth:`Results.highlights` for the keyword arguments.
+        """
+        return self.results.highlights(self.pagelen, fieldname,
+                                       start=self.offset, **kwargs)
+
 
 if __name__ == '__main__':
     pass
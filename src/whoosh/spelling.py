@@ -22,6 +22,7 @@ from collections import defaultdict
 
 from whoosh import analysis, fields, query
 from whoosh.scoring import TF_IDF
+from whoosh.searching import Searcher
 from whoosh.support.levenshtein import relative, distance
 
 
@@ -66,6 +67,7 @@ class SpellChecker(object):
         self.indexname = indexname
 
         self._index = None
+        self._reader = None
 
         self.booststart = booststart
         self.boostend = boostend
@@ -78,6 +80,8 @@ class SpellChecker(object):
         """
 
         import index
+        if create:
+            self._close_reader()
         if create or not self._index:
             create = create or not index.exists(self.storage, indexname=self.indexname)
             if create:
@@ -103,6 +107,18 @@ class SpellChecker(object):
 
         return Schema(**dict(fls))
 
+    def _searcher(self, weighting):
+        # Keeps a reader open between calls to suggestions_and_scores() instead
+        # of opening the dictionary index each time
+        if self._reader is None:
+            self._reader = self.index().reader()
+        return Searcher(self._reader, weighting=weighting)
+
+    def _close_reader(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
     def suggestions_and_scores(self, text, weighting=None):
         """Returns a list of possible alternative spellings of 'text', as
         ('word', score, weight) triples, where 'word' is the suggested
@@ -145,15 +161,11 @@ class SpellChecker(object):
                 queries.append(query.Term(key, gram))
 
         q = query.Or(queries)
-        ix = self.index()
-        s = ix.searcher(weighting=weighting)
-        try:
-            result = s.search(q)
-            return [(fs["word"], fs["score"], result.score(i))
-                    for i, fs in enumerate(result)
-                    if fs["word"] != text]
-        finally:
-            s.close()
+        s = self._searcher(weighting)
+        result = s.search(q)
+        return [(fs["word"], fs["score"], result.score(i))
+                for i, fs in enumerate(result)
+                if fs["word"] != text]
 
     def suggest(self, text, number=3, usescores=False):
         """Returns a list of suggested alternative spellings of 'text'. You
@@ -226,6 +238,254 @@ class SpellChecker(object):
                     fields["gram%s" % size] = " ".join(gramlist)
             writer.add_document(**fields)
         writer.commit()
+        self._close_reader()
+
+
+class ReaderSpellChecker(object):
+    """Suggests spellings using the terms in a field of an existing index,
+    instead of a separate dictionary. Because the suggestions come straight
+    from the index's term table, they are always consistent with the index
+    and there is nothing to build or update. Suggestions are ranked by edit
+    distance and then by how many documents contain the suggested word.
+    
+    >>> r = ix.reader()
+    >>> sp = ReaderSpellChecker(r, "content")
+    >>> sp.suggest(u"woosh")
+    [u"whoosh"]
+    
+    This uses :meth:`whoosh.reading.IndexReader.terms_within`, which walks a
+    Levenshtein automaton over the sorted term index, so it only looks at a
+    small part of the field's terms. You can also call
+    :meth:`whoosh.searching.Searcher.suggest`.
+    """
+
+    def __init__(self, reader, fieldname, maxdist=2, prefix=0, minfreq=1):
+        """
+        :param reader: The :class:`whoosh.reading.IndexReader` to get words
+            from. You are responsible for closing it.
+        :param fieldname: The field name (or number) to get words from.
+        :param maxdist: The maximum edit distance between a word and its
+            suggestions.
+        :param prefix: The number of initial characters of the word that the
+            suggestions must match exactly. Requiring even one matching
+            character makes finding suggestions much faster.
+        :param minfreq: Only suggest words that appear in at least this many
+            documents. Raising this keeps rare misspellings in the index
+            from being suggested.
+        """
+
+        self.reader = reader
+        self.fieldnum = reader.schema.to_number(fieldname)
+        self.maxdist = maxdist
+        self.prefix = prefix
+        self.minfreq = minfreq
+
+    def suggestions_and_scores(self, text):
+        """Returns a list of possible alternative spellings of 'text', as
+        ('word', docfreq, distance) triples, where 'docfreq' is the number of
+        documents containing the suggested word and 'distance' is the edit
+        distance between the word and the original word. The list is sorted
+        by distance and then by document frequency, highest first.
+        
+        :param text: The word to check.
+        :rtype: list
+        """
+
+        reader = self.reader
+        fieldnum = self.fieldnum
+        maxdist = self.maxdist
+        minfreq = self.minfreq
+
+        suggestions = []
+        for word in reader.terms_within(fieldnum, text, maxdist,
+                                        prefix=self.prefix):
+            # Never suggest the internal reversed or word pair terms (the
+            # word pair prefix starts with REVERSE_MARK)
+            if word == text or word.startswith(fields.REVERSE_MARK):
+                continue
+            docfreq = reader.doc_frequency(fieldnum, word)
+            if docfreq >= minfreq:
+                suggestions.append((word, docfreq,
+                                    distance(text, word, limit=maxdist)))
+        suggestions.sort(key=lambda x: (x[2], 0 - x[1], x[0]))
+        return suggestions
+
+    def suggest(self, text, number=3, usescores=True):
+        """Returns a list of suggested alternative spellings of 'text'.
+        
+        :param text: The word to check.
+        :param number: The maximum number of suggestions to return.
+        :param usescores: Use the document frequency of the suggestions to
+            order suggestions with the same edit distance. If this is False
+            they are ordered alphabetically.
+        :rtype: list
+        """
+
+        suggestions = self.suggestions_and_scores(text)
+        if not usescores:
+            suggestions.sort(key=lambda x: (x[2], x[0]))
+        return [word for word, _, _ in suggestions[:number]]
+
+
+class SymmetricSpellChecker(object):
+    """Implements an in-memory spell-checking engine using the "symmetric
+    delete" algorithm. Instead of searching an index of n-grams, this object
+    keeps a dictionary mapping every string that can be made by deleting up
+    to ``maxdist`` characters from the start of a word to the words it came
+    from. To check a word, it generates the same deletions of the word, looks
+    them up to get a small set of candidates, and then verifies the candidates
+    using the Levenshtein distance. This is much faster than
+    :class:`SpellChecker` (typically well under a millisecond per word) at
+    the cost of memory, and it doesn't need a storage object.
+    
+    The interface is the same as :class:`SpellChecker`::
+    
+        sp = SymmetricSpellChecker()
+        
+        sp.add_words([u"aardvark", u"manticore", u"zebra", ...])
+        # or
+        ix = index.open_dir("index")
+        sp.add_field(ix, "content")
+        
+        suggestions = sp.suggest(u"ardvark", number = 2)
+    
+    Because the dictionary is in memory, you need to re-add the words each
+    time you create the object (or pickle it).
+    """
+
+    def __init__(self, maxdist=2, prefixlen=7):
+        """
+        :param maxdist: The maximum edit distance between a word and its
+            suggestions. Memory use and lookup time grow quickly with this
+            number.
+        :param prefixlen: Only generate deletions from this many characters at
+            the start of each word. Longer words are still compared in full
+            when the candidates are verified. Smaller numbers use less memory
+            but give more candidates to verify.
+        """
+
+        self.maxdist = maxdist
+        self.prefixlen = prefixlen
+
+        # Maps words to their scores
+        self.scores = {}
+        # Maps deletion strings to a list of the words they came from
+        self.deletes = {}
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __contains__(self, word):
+        return word in self.scores
+
+    def _deletions(self, word):
+        # Returns a set of all the strings made by deleting up to maxdist
+        # characters from the given string, including the string itself
+        edits = set([word])
+        last = edits
+        for _ in xrange(self.maxdist):
+            new = set()
+            for w in last:
+                for i in xrange(len(w)):
+                    new.add(w[:i] + w[i + 1:])
+            new -= edits
+            if not new:
+                break
+            edits |= new
+            last = new
+        return edits
+
+    def suggestions_and_scores(self, text):
+        """Returns a list of possible alternative spellings of 'text', as
+        ('word', score, distance) triples, where 'word' is the suggested word,
+        'score' is the score that was assigned to the word using
+        :meth:`SymmetricSpellChecker.add_field` or
+        :meth:`SymmetricSpellChecker.add_scored_words`, and 'distance' is the
+        edit distance between the word and the original word. The list is
+        sorted by distance and then by score, highest first.
+        
+        :param text: The word to check.
+        :rtype: list
+        """
+
+        maxdist = self.maxdist
+        deletes = self.deletes
+        scores = self.scores
+
+        candidates = set()
+        for d in self._deletions(text[:self.prefixlen]):
+            if d in deletes:
+                candidates.update(deletes[d])
+        candidates.discard(text)
+
+        suggestions = []
+        for word in candidates:
+            dist = distance(text, word, limit=maxdist)
+            if dist <= maxdist:
+                suggestions.append((word, scores[word], dist))
+        suggestions.sort(key=lambda x: (x[2], 0 - x[1], x[0]))
+        return suggestions
+
+    def suggest(self, text, number=3, usescores=False):
+        """Returns a list of suggested alternative spellings of 'text'. You
+        must add words to the dictionary (using add_field, add_words, and/or
+        add_scored_words) before you can use this.
+        
+        :param text: The word to check.
+        :param number: The maximum number of suggestions to return.
+        :param usescores: Use the per-word score to order suggestions with the
+            same edit distance. Otherwise they are ordered alphabetically.
+        :rtype: list
+        """
+
+        suggestions = self.suggestions_and_scores(text)
+        if not usescores:
+            suggestions.sort(key=lambda x: (x[2], x[0]))
+        return [word for word, _, _ in suggestions[:number]]
+
+    def add_field(self, ix, fieldname):
+        """Adds the terms in a field from another index to the dictionary,
+        using each term's frequency as the score. See
+        :meth:`SpellChecker.add_field`.
+        
+        :param ix: The index.Index object from which to add terms.
+        :param fieldname: The field name (or number) of a field in the source
+            index.
+        """
+
+        r = ix.reader()
+        try:
+            self.add_scored_words((w, freq)
+                                  for w, _, freq in r.iter_field(fieldname))
+        finally:
+            r.close()
+
+    def add_words(self, ws, score=1):
+        """Adds a list of words to the dictionary.
+        
+        :param ws: A sequence of words (strings) to add to the dictionary.
+        :param score: An optional score to use for ALL the words in 'ws'.
+        """
+        self.add_scored_words((w, score) for w in ws)
+
+    def add_scored_words(self, ws):
+        """Adds a list of ("word", score) tuples to the dictionary. Adding a
+        word that is already in the dictionary replaces its score.
+        
+        :param ws: A sequence of ("word", score) tuples.
+        """
+
+        scores = self.scores
+        deletes = self.deletes
+        prefixlen = self.prefixlen
+        for text, score in ws:
+            if text not in scores:
+                for d in self._deletions(text[:prefixlen]):
+                    if d in deletes:
+                        deletes[d].append(text)
+                    else:
+                        deletes[d] = [text]
+            scores[text] = score
 
 
 
@@ -0,0 +1,731 @@
+#===============================================================================
+# Copyright 2010 Matt Chaput
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#===============================================================================
+
+"""
+Contains classes for building finite automata that accept sets of unicode
+strings (from edit distances, glob patterns, regular expressions or ranges),
+and a function for intersecting an automaton with a sorted term dictionary
+without looking at every term.
+
+The intersection works by asking the automaton for the smallest string it
+accepts that is greater than or equal to the current position in the
+dictionary (:meth:`DFA.next_valid_string`), then moving the dictionary to the
+first term greater than or equal to that string, and so on, so whole ranges
+of non-matching terms are skipped.
+"""
+
+import sys
+from bisect import bisect_left
+
+
+class _Label(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+# Special transition labels
+EPSILON = _Label("EPSILON")
+ANY = _Label("ANY")
+
+
+class AnyBut(object):
+    """Transition label that matches any character except the given
+    characters.
+    """
+
+    def __init__(self, chars):
+        self.chars = frozenset(chars)
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, "".join(sorted(self.chars)))
+
+
+_MAXCHAR = sys.maxunicode
+
+
+class NFA(object):
+    """A non-deterministic finite automaton. Transitions are labeled with
+    single unicode characters, :data:`ANY` (matches any character),
+    :class:`AnyBut` objects or :data:`EPSILON` (consumes no input).
+    """
+
+    def __init__(self, start_state):
+        self.transitions = {}
+        self.excepts = {}
+        self.final_states = set()
+        self._start_state = start_state
+
+    @property
+    def start_state(self):
+        return self._expand(set([self._start_state]))
+
+    def add_transition(self, src, label, dest):
+        if isinstance(label, AnyBut):
+            self.excepts.setdefault(src, []).append((label.chars, dest))
+        else:
+            trans = self.transitions.setdefault(src, {})
+            trans.setdefault(label, set()).add(dest)
+
+    def add_final_state(self, state):
+        self.final_states.add(state)
+
+    def is_final(self, states):
+        return bool(self.final_states.intersection(states))
+
+    def _expand(self, states):
+        # Adds the states reachable by epsilon transitions
+        transitions = self.transitions
+        frontier = list(states)
+        while frontier:
+            state = frontier.pop()
+            for dest in transitions.get(state, {}).get(EPSILON, ()):
+                if dest not in states:
+                    states.add(dest)
+                    frontier.append(dest)
+        return frozenset(states)
+
+    def next_state(self, states, label):
+        """Returns the set of states reached from the given set of states on
+        the given character. If the label is :data:`ANY`, returns the states
+        reached on a character that has no explicit transition.
+        """
+
+        transitions = self.transitions
+        excepts = self.excepts
+        dest = set()
+        for state in states:
+            trans = transitions.get(state)
+            if trans:
+                if label is not ANY:
+                    dest.update(trans.get(label, ()))
+                dest.update(trans.get(ANY, ()))
+            if state in excepts:
+                for chars, d in excepts[state]:
+                    if label is ANY or label not in chars:
+                        dest.add(d)
+        return self._expand(dest)
+
+    def labels(self, states):
+        """Returns a tuple of (chars, has_default) for the given set of
+        states, where chars is the set of characters with explicit transitions
+        and has_default is True if any other character also leads somewhere.
+        """
+
+        transitions = self.transitions
+        excepts = self.excepts
+        chars = set()
+        has_default = False
+        for state in states:
+            for label in transitions.get(state, ()):
+                if label is ANY:
+                    has_default = True
+                elif label is not EPSILON:
+                    chars.add(label)
+            if state in excepts:
+                has_default = True
+                for excluded, _ in excepts[state]:
+                    chars.update(excluded)
+        return chars, has_default
+
+    def to_dfa(self):
+        """Returns a :class:`DFA` accepting the same strings as this automaton
+        (using the powerset construction).
+        """
+
+        start = self.start_state
+        dfa = DFA(start)
+        if self.is_final(start):
+            dfa.add_final_state(start)
+
+        frontier = [start]
+        seen = set(frontier)
+
+        def add_state(state):
+            if state not in seen:
+                seen.add(state)
+                frontier.append(state)
+                if self.is_final(state):
+                    dfa.add_final_state(state)
+
+        while frontier:
+            current = frontier.pop()
+            chars, has_default = self.labels(current)
+            if has_default:
+                default = self.next_state(current, ANY)
+                add_state(default)
+                dfa.set_default_transition(current, default)
+
+            for label in chars:
+                newstate = self.next_state(current, label)
+                if newstate:
+                    add_state(newstate)
+                    dfa.add_transition(current, label, newstate)
+                elif has_default:
+                    # Stop the default transition from applying to this char
+                    dfa.add_transition(current, label, None)
+        return dfa
+
+
+class DFA(object):
+    """A deterministic finite automaton. Each state may have a "default"
+    transition that is followed for any character that doesn't have an
+    explicit transition.
+    """
+
+    def __init__(self, start_state):
+        self.start_state = start_state
+        self.transitions = {}
+        self.defaults = {}
+        self.final_states = set()
+        self._labelcache = {}
+
+    def add_transition(self, src, label, dest):
+        self.transitions.setdefault(src, {})[label] = dest
+
+    def set_default_transition(self, src, dest):
+        self.defaults[src] = dest
+
+    def add_final_state(self, state):
+        self.final_states.add(state)
+
+    def is_final(self, state):
+        return state in self.final_states
+
+    def next_state(self, src, label):
+        trans = self.transitions.get(src)
+        if trans and label in trans:
+            return trans[label]
+        return self.defaults.get(src)
+
+    def accept(self, text):
+        """Returns True if this automaton accepts the given string.
+        """
+
+        state = self.start_state
+        for c in text:
+            state = self.next_state(state, c)
+            if state is None:
+                return False
+        return self.is_final(state)
+
+    def _labels(self, state):
+        try:
+            return self._labelcache[state]
+        except KeyError:
+            labels = sorted(self.transitions.get(state, ()))
+            self._labelcache[state] = labels
+            return labels
+
+    def _next_label(self, state, label):
+        # Returns the smallest character greater than the given character (or
+        # the smallest character at all if label is None) that leads to a
+        # state from the given state.
+
+        if label is None:
+            x = u"\x00"
+        elif ord(label) >= _MAXCHAR:
+            return None
+        else:
+            x = unichr(ord(label) + 1)
+
+        if state in self.defaults:
+            return x
+        labels = self._labels(state)
+        i = bisect_left(labels, x)
+        if i < len(labels):
+            return labels[i]
+        return None
+
+    def next_valid_string(self, text):
+        """Returns the smallest string accepted by this automaton that is
+        greater than or equal to the given string, or None if there is no
+        such string.
+        
+        If finding the smallest string would mean following a loop in the
+        automaton (for example, there is no smallest string matching ``*b``
+        that is greater than ``a``, since ``a\\x00b``, ``a\\x00\\x00b``, ...
+        are all accepted), this method instead returns the string up to the
+        start of the loop. That string is not accepted, but it is still a
+        lower bound that can be used to seek forward in a term index.
+        """
+
+        state = self.start_state
+        stack = []
+
+        # Follow the text through the automaton as far as possible
+        for i, c in enumerate(text):
+            stack.append((text[:i], state, c))
+            state = self.next_state(state, c)
+            if state is None:
+                break
+        else:
+            if self.is_final(state):
+                # The text itself is accepted
+                return text
+            stack.append((text, state, None))
+
+        # Search for the smallest accepted string by backing up to the
+        # longest prefix that has a larger outgoing edge, then following the
+        # smallest edges until reaching a final state
+        visited = set()
+        while stack:
+            path, state, label = stack.pop()
+            label = self._next_label(state, label)
+            if label is not None:
+                newstate = self.next_state(state, label)
+                if newstate is None:
+                    # A dead transition, so try the next label instead
+                    stack.append((path, state, label))
+                    continue
+                path += label
+                if self.is_final(newstate) or newstate in visited:
+                    return path
+                visited.add(newstate)
+                stack.append((path, newstate, None))
+        return None
+
+
+def levenshtein_automaton(text, maxdist, prefix=0):
+    """Returns an :class:`NFA` that accepts all strings within ``maxdist``
+    insertions, deletions or substitutions of the given text.
+
+    :param text: the unicode string to match.
+    :param maxdist: the maximum edit distance.
+    :param prefix: the number of initial characters of the text that must
+        match exactly.
+    """
+
+    nfa = NFA((0, 0))
+    for i, c in enumerate(text):
+        for e in xrange(maxdist + 1):
+            # Correct character
+            nfa.add_transition((i, e), c, (i + 1, e))
+            if e < maxdist and i >= prefix:
+                # Insertion
+                nfa.add_transition((i, e), ANY, (i, e + 1))
+                # Deletion
+                nfa.add_transition((i, e), EPSILON, (i + 1, e + 1))
+                # Substitution
+                nfa.add_transition((i, e), ANY, (i + 1, e + 1))
+
+    end = len(text)
+    for e in xrange(maxdist + 1):
+        if e < maxdist and end >= prefix:
+            # Insertions at the end
+            nfa.add_transition((end, e), ANY, (end, e + 1))
+        nfa.add_final_state((end, e))
+    return nfa
+
+
+class RangeAutomaton(object):
+    """An object with the same ``accept()`` and ``next_valid_string()``
+    methods as :class:`DFA` that accepts the strings in a lexical range.
+    """
+
+    def __init__(self, start, end, startexcl=False, endexcl=False):
+        self.start = start
+        self.end = end
+        self.startexcl = startexcl
+        self.endexcl = endexcl
+
+    def accept(self, text):
+        start, end = self.start, self.end
+        if text < start or (self.startexcl and text == start):
+            return False
+        if text > end or (self.endexcl and text == end):
+            return False
+        return True
+
+    def next_valid_string(self, text):
+        start = self.start
+        if text < start:
+            text = start
+        if self.startexcl and text == start:
+            text = start + u"\x00"
+        if self.accept(text):
+            return text
+        return None
+
+
+# Parsing patterns into automata
+
+# Patterns are parsed into a simple tree of tuples, which is then turned into
+# an NFA using Thompson's construction:
+#   ("char", c), ("any",), ("set", chars, negated), ("cat", [nodes]),
+#   ("alt", [nodes]), ("rep", node, min, max) where max may be None
+
+_CLASS_LIMIT = 4096
+_ESCAPE_CLASSES = {"d": (u"0123456789", False),
+                   "D": (u"0123456789", True),
+                   "s": (u" \t\n\r\f\v", False),
+                   "S": (u" \t\n\r\f\v", True),
+                   "w": (u"abcdefghijklmnopqrstuvwxyz"
+                         u"ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_", False),
+                   "W": (u"abcdefghijklmnopqrstuvwxyz"
+                         u"ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_", True),
+                   }
+
+
+def _char_range(first, last):
+    if ord(last) < ord(first):
+        raise ValueError("Bad character range %s-%s" % (first, last))
+    if ord(last) - ord(first) > _CLASS_LIMIT:
+        raise ValueError("Character range %s-%s is too large" % (first, last))
+    return [unichr(i) for i in xrange(ord(first), ord(last) + 1)]
+
+
+def _glob_nodes(pattern):
+    # Parses a glob pattern with the same syntax as the fnmatch module
+    nodes = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == "*":
+            nodes.append(("rep", ("any",), 0, None))
+        elif c == "?":
+            nodes.append(("any",))
+        elif c == "[":
+            j = i
+            if j < n and pattern[j] == "!":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            while j < n and pattern[j] != "]":
+                j += 1
+            if j >= n:
+                nodes.append(("char", c))
+            else:
+                body = pattern[i:j]
+                i = j + 1
+                negated = body.startswith("!")
+                if negated:
+                    body = body[1:]
+                chars = []
+                k = 0
+                while k < len(body):
+                    if k + 2 < len(body) and body[k + 1] == "-":
+                        chars.extend(_char_range(body[k], body[k + 2]))
+                        k += 3
+                    else:
+                        chars.append(body[k])
+                        k += 1
+                nodes.append(("set", frozenset(chars), negated))
+        else:
+            nodes.append(("char", c))
+    return nodes
+
+
+class _RegexParser(object):
+    # Recursive descent parser for the supported regular expression syntax
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.pos = 0
+
+    def error(self, msg):
+        raise ValueError("%s at %d in %r" % (msg, self.pos, self.pattern))
+
+    def peek(self):
+        if self.pos < len(self.pattern):
+            return self.pattern[self.pos]
+        return None
+
+    def take(self):
+        c = self.peek()
+        if c is None:
+            self.error("Unexpected end of expression")
+        self.pos += 1
+        return c
+
+    def parse(self):
+        node = self.parse_alt()
+        if self.peek() is not None:
+            self.error("Unexpected %r" % self.peek())
+        return node
+
+    def parse_alt(self):
+        branches = [self.parse_cat()]
+        while self.peek() == "|":
+            self.pos += 1
+            branches.append(self.parse_cat())
+        if len(branches) == 1:
+            return branches[0]
+        return ("alt", branches)
+
+    def parse_cat(self):
+        nodes = []
+        while self.peek() not in (None, "|", ")"):
+            node = self.parse_repeat()
+            if node is not None:
+                nodes.append(node)
+        return ("cat", nodes)
+
+    def parse_repeat(self):
+        c = self.peek()
+        if c == "^" and self.pos == 0:
+            self.pos += 1
+            return None
+        if c == "$" and self.pos == len(self.pattern) - 1:
+            self.pos += 1
+            return None
+
+        node = self.parse_atom()
+        while True:
+            c = self.peek()
+            if c == "*":
+                node = ("rep", node, 0, None)
+            elif c == "+":
+                node = ("rep", node, 1, None)
+            elif c == "?":
+                node = ("rep", node, 0, 1)
+            elif c == "{":
+                self.pos += 1
+                node = ("rep", node) + self.parse_bounds()
+                continue
+            else:
+                return node
+            self.pos += 1
+            if self.peek() in ("?", "+"):
+                self.error("Lazy and possessive repeats are not supported")
+
+    def parse_bounds(self):
+        end = self.pattern.find("}", self.pos)
+        if end < 0:
+            self.error("Unterminated repeat")
+        spec = self.pattern[self.pos:end]
+        self.pos = end + 1
+        try:
+            if "," in spec:
+                lo, hi = spec.split(",", 1)
+                lo = int(lo or 0)
+                hi = int(hi) if hi else None
+            else:
+                lo = hi = int(spec)
+        except ValueError:
+            self.error("Bad repeat %r" % spec)
+        if hi is not None and hi < lo:
+            self.error("Bad repeat %r" % spec)
+        return (lo, hi)
+
+    def parse_atom(self):
+        c = self.take()
+        if c == "(":
+            if self.peek() == "?":
+                if self.pattern[self.pos:self.pos + 2] == "?:":
+                    self.pos += 2
+                else:
+                    self.error("Group extensions are not supported")
+            node = self.parse_alt()
+            if self.take() != ")":
+                self.error("Unbalanced parenthesis")
+            return node
+        elif c == "[":
+            return self.parse_class()
+        elif c == ".":
+            return ("any",)
+        elif c == "\\":
+            e = self.take()
+            if e in _ESCAPE_CLASSES:
+                chars, negated = _ESCAPE_CLASSES[e]
+                return ("set", frozenset(chars), negated)
+            elif e.isalnum():
+                self.error("Unsupported escape \\%s" % e)
+            return ("char", e)
+        elif c in "*+?{":
+            self.error("Nothing to repeat")
+        elif c in "^$":
+            self.error("Anchors are only supported at the ends")
+        return ("char", c)
+
+    def parse_class(self):
+        negated = False
+        if self.peek() == "^":
+            negated = True
+            self.pos += 1
+        chars = set()
+        first = True
+        while True:
+            c = self.take()
+            if c == "]" and not first:
+                break
+            first = False
+            if c == "\\":
+                e = self.take()
+                if e in _ESCAPE_CLASSES:
+                    escchars, escneg = _ESCAPE_CLASSES[e]
+                    if escneg:
+                        self.error("Negated escapes in classes are not supported")
+                    chars.update(escchars)
+                    continue
+                c = e
+            if (self.peek() == "-"
+                and self.pos + 1 < len(self.pattern)
+                and self.pattern[self.pos + 1] != "]"):
+                self.pos += 1
+                last = self.take()
+                if last == "\\":
+                    last = self.take()
+                try:
+                    chars.update(_char_range(c, last))
+                except ValueError, e:
+                    self.error(str(e))
+            else:
+                chars.add(c)
+            if len(chars) > _CLASS_LIMIT:
+                self.error("Character class is too large")
+        return ("set", frozenset(chars), negated)
+
+
+class _Builder(object):
+    # Builds an NFA from a parsed pattern tree using Thompson's construction
+
+    def __init__(self):
+        self.nfa = NFA(0)
+        self.count = 1
+
+    def new_state(self):
+        n = self.count
+        self.count += 1
+        return n
+
+    def build(self, node):
+        # Returns a (start, end) tuple for the fragment matching the node
+        nfa = self.nfa
+        kind = node[0]
+        start = self.new_state()
+        if kind == "char":
+            end = self.new_state()
+            nfa.add_transition(start, node[1], end)
+        elif kind == "any":
+            end = self.new_state()
+            nfa.add_transition(start, ANY, end)
+        elif kind == "set":
+            end = self.new_state()
+            chars, negated = node[1], node[2]
+            if negated:
+                nfa.add_transition(start, AnyBut(chars), end)
+            else:
+                for c in chars:
+                    nfa.add_transition(start, c, end)
+        elif kind == "cat":
+            end = start
+            for sub in node[1]:
+                s, e = self.build(sub)
+                nfa.add_transition(end, EPSILON, s)
+                end = e
+        elif kind == "alt":
+            end = self.new_state()
+            for sub in node[1]:
+                s, e = self.build(sub)
+                nfa.add_transition(start, EPSILON, s)
+                nfa.add_transition(e, EPSILON, end)
+        elif kind == "rep":
+            sub, lo, hi = node[1], node[2], node[3]
+            end = start
+            for _ in xrange(lo):
+                s, e = self.build(sub)
+                nfa.add_transition(end, EPSILON, s)
+                end = e
+            if hi is None:
+                # Kleene star
+                s, e = self.build(sub)
+                loopend = self.new_state()
+                nfa.add_transition(end, EPSILON, s)
+                nfa.add_transition(end, EPSILON, loopend)
+                nfa.add_transition(e, EPSILON, s)
+                nfa.add_transition(e, EPSILON, loopend)
+                end = loopend
+            else:
+                optend = self.new_state()
+                for _ in xrange(hi - lo):
+                    s, e = self.build(sub)
+                    nfa.add_transition(end, EPSILON, s)
+                    nfa.add_transition(end, EPSILON, optend)
+                    end = e
+                nfa.add_transition(end, EPSILON, optend)
+                end = optend
+        else:
+            raise ValueError("Unknown node %r" % (node, ))
+        return start, end
+
+    def finish(self, node):
+        start, end = self.build(node)
+        self.nfa.add_transition(0, EPSILON, start)
+        self.nfa.add_final_state(end)
+        return self.nfa
+
+
+def glob_automaton(pattern, reverse=False, leading=u""):
+    """Returns an :class:`NFA` that accepts the strings matching the given
+    glob pattern, using the same syntax as the ``fnmatch`` module (``*``,
+    ``?``, ``[seq]`` and ``[!seq]``).
+
+    :param reverse: if True, the automaton accepts the matching strings
+        reversed.
+    :param leading: a literal string that must appear before the (possibly
+        reversed) pattern.
+    """
+
+    nodes = _glob_nodes(pattern)
+    if reverse:
+        nodes.reverse()
+    nodes = [("char", c) for c in leading] + nodes
+    return _Builder().finish(("cat", nodes))
+
+
+def regex_automaton(pattern):
+    """Returns an :class:`NFA` that accepts the strings that entirely match
+    the given regular expression. This supports a subset of the syntax of the
+    ``re`` module: literal and escaped characters, ``.``, character classes
+    (including ranges, negation, ``\\d``, ``\\s`` and ``\\w``), grouping with
+    ``(...)`` and ``(?:...)``, alternation with ``|``, the repeats ``*``,
+    ``+``, ``?`` and ``{m,n}``, and ``^`` and ``$`` at the ends of the
+    expression. Raises ValueError if the expression uses anything else.
+    """
+
+    return _Builder().finish(_RegexParser(pattern).parse())
+
+
+def find_all_matches(automaton, terms_from):
+    """Yields the strings in a sorted dictionary that are accepted by the
+    given automaton.
+
+    :param automaton: a :class:`DFA` or any object with the same ``accept()``
+        and ``next_valid_string()`` methods, such as :class:`RangeAutomaton`.
+    :param terms_from: a function that takes a string and returns an iterator
+        of the strings in the dictionary that are greater than or equal to
+        it, in order.
+    """
+
+    accept = automaton.accept
+    next_valid_string = automaton.next_valid_string
+
+    match = next_valid_string(u"")
+    while match is not None:
+        for word in terms_from(match):
+            if accept(word):
+                # Keep reading sequentially while the terms match
+                yield word
+            else:
+                # Seek to the next string the automaton could accept
+                match = next_valid_string(word)
+                break
+        else:
+            return
@@ -169,9 +169,13 @@ class BitVector(object):
         on the bits at those positions.
         """
         
-        set = self.set
+        bits = self.bits
+        size = self.size
         for index in iterable:
-            set(index)
+            if index >= size:
+                raise IndexError("Position %s greater than the size of the vector" % index)
+            bits[index >> 3] |= 1 << (index & 7)
+        self.bcount = None
     
     def copy(self):
         """Returns a copy of this BitArray."""
@@ -12,8 +12,17 @@ def relative(a, b):
     r = ((longer - d) / longer) * (shorter / longer)
     return r
 
-def distance(s, t):
-    """Returns the Levenshtein edit distance between two strings."""
+def distance(s, t, limit=None):
+    """Returns the Levenshtein edit distance between two strings.
+    
+    :param limit: if given, stop as soon as the distance is known to be greater
+        than this number and return ``limit + 1``. This is much faster when
+        you only need to know whether two strings are within a certain
+        distance of each other.
+    """
+    
+    if limit is not None:
+        return _bounded_distance(s, t, limit)
     
     m, n = len(s), len(t)
     d = [range(n+1)]
@@ -28,3 +37,21 @@ def distance(s, t):
                          )
     return d[m][n]
 
+def _bounded_distance(s, t, limit):
+    # Computes the distance one row at a time, giving up when every cell in a
+    # row is over the limit (the distance can only grow from there)
+    m, n = len(s), len(t)
+    if abs(m - n) > limit:
+        return limit + 1
+    
+    prev = range(n + 1)
+    for i in xrange(m):
+        c = s[i]
+        row = [i + 1]
+        for j in xrange(n):
+            cost = 0 if c == t[j] else 1
+            row.append(min(prev[j + 1] + 1, row[j] + 1, prev[j] + cost))
+        if min(row) > limit:
+            return limit + 1
+        prev = row
+    return min(prev[n], limit + 1)
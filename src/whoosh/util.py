@@ -23,6 +23,7 @@ import codecs, re
 from collections import deque, defaultdict
 from functools import wraps
 from struct import pack, unpack
+from threading import Lock
 from time import time, clock
 
 
@@ -146,11 +147,11 @@ def first_diff(a, b):
     byte.
     """
 
-    i = -1
-    for i in xrange(0, len(a)):
-        if a[i] != b[1]:
-            return i
-        if i == 255: return i
+    i = 0
+    limit = min(len(a), len(b), 255)
+    while i < limit and a[i] == b[i]:
+        i += 1
+    return i
 
 
 def prefix_encode(a, b):
@@ -276,6 +277,103 @@ def protected(func):
     return wrapper
 
 
+class LRUCache(object):
+    """A dictionary-like object that keeps at most ``size`` items, discarding
+    the least recently accessed items when it grows beyond that size. The
+    methods are synchronized on a lock, so a cache can be shared between
+    threads.
+    
+    >>> cache = LRUCache(100)
+    >>> cache["a"] = 1
+    >>> cache.get("a")
+    1
+    """
+
+    def __init__(self, size):
+        """
+        :param size: the maximum number of items to keep in the cache.
+        """
+
+        self.size = size
+        self._lock = Lock()
+        self.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __getitem__(self, key):
+        self._lock.acquire()
+        try:
+            value = self._data[key]
+            self._touch(key)
+            return value
+        finally:
+            self._lock.release()
+
+    def __setitem__(self, key, value):
+        self._lock.acquire()
+        try:
+            self._data[key] = value
+            self._touch(key)
+
+            # Purge least recently accessed items
+            data = self._data
+            queue = self._queue
+            refcount = self._refcount
+            while len(data) > self.size:
+                k = queue.popleft()
+                refcount[k] -= 1
+                if not refcount[k]:
+                    del data[k]
+                    del refcount[k]
+        finally:
+            self._lock.release()
+
+    def _touch(self, key):
+        # Record that this key was recently accessed. The caller must hold the
+        # lock.
+        queue = self._queue
+        refcount = self._refcount
+        queue.append(key)
+        refcount[key] += 1
+
+        # Periodically compact the queue by removing duplicate keys
+        if len(queue) > self.size * 4:
+            qpend = queue.append
+            qpop = queue.popleft
+            for _ in xrange(len(queue)):
+                k = qpop()
+                if refcount[k] == 1:
+                    qpend(k)
+                else:
+                    refcount[k] -= 1
+
+    def get(self, key, default=None):
+        """Returns the value for the given key, or ``default`` if the key is
+        not in the cache.
+        """
+
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def clear(self):
+        """Removes all items from the cache.
+        """
+
+        self._lock.acquire()
+        try:
+            self._data = {}
+            self._queue = deque()
+            self._refcount = defaultdict(int)
+        finally:
+            self._lock.release()
+
+
 def lru_cache(size):
     """Decorator that adds a least-recently-accessed cache to a method.
     
@@ -283,53 +381,21 @@ def lru_cache(size):
     """
 
     def decorate_function(func):
-        prefix = "_%s_" % func.__name__
+        cachename = "_%s_cache" % func.__name__
 
         @wraps(func)
         def wrapper(self, *args):
-            if not hasattr(self, prefix + "cache"):
-                cache = {}
-                queue = deque()
-                refcount = defaultdict(int)
-                setattr(self, prefix + "cache", cache)
-                setattr(self, prefix + "queue", queue)
-                setattr(self, prefix + "refcount", refcount)
-            else:
-                cache = getattr(self, prefix + "cache")
-                queue = getattr(self, prefix + "queue")
-                refcount = getattr(self, prefix + "refcount")
-            qpend = queue.append
-            qpop = queue.popleft
+            cache = getattr(self, cachename, None)
+            if cache is None:
+                cache = LRUCache(size)
+                setattr(self, cachename, cache)
 
             # Get cache entry or compute if not found
             try:
-                result = cache[args]
+                return cache[args]
             except KeyError:
                 result = cache[args] = func(self, *args)
-
-            # Record that this key was recently accessed
-            qpend(args)
-            refcount[args] += 1
-
-            # Purge least recently accessed cache contents
-            while len(cache) > size:
-                k = qpop()
-                refcount[k] -= 1
-                if not refcount[k]:
-                    del cache[k]
-                    del refcount[k]
-
-            # Periodically compact the queue by removing duplicate keys
-            if len(queue) > size * 4:
-                for _ in xrange(len(queue)):
-                    k = qpop()
-                    if refcount[k] == 1:
-                        qpend(k)
-                    else:
-                        refcount[k] -= 1
-                #assert len(queue) == len(cache) == len(refcount) == sum(refcount.itervalues())
-
-            return result
+                return result
         return wrapper
     return decorate_function
 
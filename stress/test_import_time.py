@@ -0,0 +1,35 @@
+import unittest
+
+import os, subprocess, sys, time
+
+
+class TestImportTime(unittest.TestCase):
+    """Measures how long it takes a new interpreter to import the modules a
+    short-lived script needs to open and search an index, since processes that
+    only read a few stored fields pay this cost every time they start.
+    """
+    
+    def import_time(self, modulename, runs=10):
+        code = ("import time\n"
+                "t = time.time()\n"
+                "import %s\n"
+                "print time.time() - t\n" % modulename)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        times = []
+        for _ in xrange(runs):
+            p = subprocess.Popen([sys.executable, "-c", code], env=env,
+                                 stdout=subprocess.PIPE)
+            times.append(float(p.communicate()[0]))
+        times.sort()
+        return times[len(times) // 2]
+    
+    def test_import_time(self):
+        for modulename in ("whoosh.index", "whoosh.filedb.filestore",
+                           "whoosh.qparser", "whoosh.searching"):
+            t = self.import_time(modulename)
+            print "import %s: %0.1f ms" % (modulename, t * 1000)
+            self.assertTrue(t < 0.25, (modulename, t))
+
+
+if __name__ == '__main__':
+    unittest.main()
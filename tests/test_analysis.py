@@ -74,7 +74,78 @@ class TestAnalysis(unittest.TestCase):
                                                 (2, "SuperDuperXL"), (3, "500"), (4, "42"),
                                                 (4, "50042"), (5, "Auto"), (6, "Coder"),
                                                 (6, "AutoCoder")])
+    
+    def test_analyze_batch(self):
+        from whoosh import formats
+        
+        values = [u"The Running DOGS ran to the 3.14 running-dogs",
+                  u"", u"is a the", u"Under_score willows WILLOW the end"]
+        analyzers = [StandardAnalyzer(), StemmingAnalyzer(), SimpleAnalyzer(),
+                     RegexTokenizer(), StandardAnalyzer(stoplist=None),
+                     StemmingAnalyzer(ignore=["willows"]),
+                     RegexTokenizer() | StopFilter() | LowercaseFilter(),
+                     StandardAnalyzer(expression=r"[^ ]+"),
+                     KeywordAnalyzer()]
+        for ana in analyzers:
+            for positions in (False, True):
+                expected = []
+                for value in values:
+                    tokens = unstopped(ana(value, positions=positions,
+                                           start_pos=2))
+                    if positions:
+                        expected.append([(t.text, t.pos) for t in tokens])
+                    else:
+                        expected.append([t.text for t in tokens])
+                self.assertEqual(ana.analyze_batch(values, positions=positions,
+                                                   start_pos=2), expected)
+        
+        ana = StemmingAnalyzer()
+        for fmt in (formats.Existence(ana), formats.Frequency(ana),
+                    formats.DocBoosts(ana), formats.Positions(ana),
+                    formats.Characters(ana)):
+            batch = fmt.word_values_batch(values, mode="index")
+            self.assertEqual(len(batch), len(values))
+            for value, wvs in zip(values, batch):
+                old = [t.text for t in unstopped(ana(value))]
+                self.assertEqual(sorted(w for w, _, _ in wvs), sorted(set(old)))
+                self.assertEqual(sorted(wvs), sorted(fmt.word_values(value)))
+        
+    def test_stem_cache(self):
+        from cPickle import dumps, loads
         
+        def stemfn(word):
+            return word[:3]
+        
+        cache = StemCache(stemfn, size=10)
+        words = [u"word%d" % i for i in xrange(25)]
+        self.assertEqual(cache.stem_words(words), [u"wor"] * 25)
+        self.assertEqual(cache.misses, 25)
+        self.assertTrue(len(cache) <= 10)
+        self.assertEqual(cache.stem(u"word24"), u"wor")
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.hit_rate(), 1 / 26.0)
+        cache.clear()
+        cache.prewarm(words)
+        self.assertEqual(len(cache), 5)
+        
+        # Filters using the same stemming function share one cache
+        f1 = StemFilter(stemfn=stemfn, cachesize=10)
+        f2 = StemFilter(stemfn=stemfn, cachesize=100)
+        self.assertTrue(f1.cache is f2.cache)
+        self.assertEqual(f1.cache.size, 100)
+        ana = RegexTokenizer() | f1
+        self.assertEqual([t.text for t in ana(u"alfa bravo alfa")],
+                         [u"alf", u"bra", u"alf"])
+        self.assertEqual(f2.cache.hits, 1)
+        self.assertEqual(ana.analyze_batch([u"alfa charlie"]), [[u"alf", u"cha"]])
+        
+        # The cache isn't pickled with the filter
+        f3 = StemFilter()
+        f3.prewarm([u"rendering"])
+        self.assertTrue(u"rendering" in f3.cache)
+        self.assertFalse("rendering" in dumps(f3, -1))
+        self.assertEqual(loads(dumps(f3, -1)), f3)
+
 
 if __name__ == '__main__':
     unittest.main()
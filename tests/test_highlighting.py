@@ -2,6 +2,8 @@ import unittest
 
 import whoosh.analysis as analysis
 import whoosh.highlight as highlight
+from whoosh import fields, formats, query
+from whoosh.filedb.filestore import RamStorage
 
 
 class TestHighlighting(unittest.TestCase):
@@ -57,5 +59,46 @@ class TestHighlighting(unittest.TestCase):
         self.assertEqual(htext, '<b class="match t0">alfa</b> <b class="match t1">bravo</b> <b class="match t0">charlie</b>...<b class="match t1">delta</b> <b class="match t0">echo</b> foxtrot')
 
 
+    def test_offset_fragment(self):
+        termchars = {"bravo": [(5, 10)], "india": [(49, 54)]}
+        of = highlight.OffsetFragmenter(maxchars=20, surround=8)
+        uc = highlight.UppercaseFormatter()
+        htext = highlight.highlight_offsets(self._doc, termchars, of, uc)
+        self.assertEqual(htext, "alfa BRAVO charlie...hotel INDIA juliet")
+        
+        # The same fragmenter works on an analyzed token stream
+        sa = analysis.StandardAnalyzer()
+        htext = highlight.highlight(self._doc, ("bravo", "india"), sa, of, uc)
+        self.assertEqual(htext, "alfa BRAVO charlie...hotel INDIA juliet")
+
+    def test_results_highlights(self):
+        docs = (u"alfa bravo charlie delta echo foxtrot golf hotel",
+                u"india juliet bravo kilo lima mike november",
+                u"oscar papa quebec romeo sierra tango bravo")
+        for field in (fields.TEXT(stored=True, chars=True),
+                      fields.TEXT(stored=True, vector=formats.Characters(analysis.StandardAnalyzer())),
+                      fields.TEXT(stored=True)):
+            schema = fields.Schema(title=fields.ID(stored=True), text=field)
+            ix = RamStorage().create_index(schema)
+            w = ix.writer()
+            for i, doc in enumerate(docs):
+                w.add_document(title=unicode(i), text=doc)
+            w.commit()
+            
+            s = ix.searcher()
+            r = s.search(query.Or([query.Term("text", u"bravo"),
+                                   query.Prefix("text", u"rom")]))
+            uc = highlight.UppercaseFormatter()
+            excerpts = dict(zip((hit["title"] for hit in r),
+                                r.highlights(3, "text", formatter=uc)))
+            self.assertEqual(excerpts, {u"0": u"alfa BRAVO charlie delta echo",
+                                        u"1": u"india juliet BRAVO kilo lima mike",
+                                        u"2": u"oscar papa quebec ROMEO sierra tango BRAVO"})
+            
+            page = s.search_page(query.Term("text", u"bravo"), 2, pagelen=2)
+            self.assertEqual(len(page.highlights("text", formatter=uc)), 1)
+            s.close()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -335,6 +335,56 @@ class TestIndexing(unittest.TestCase):
             self.assertEqual(reader.doc_field_length(0, 0), DOCLENGTH_LIMIT)
         finally:
             self.destroy_index("testindex")
+    
+    def test_toc_segments(self):
+        s = fields.Schema(key=fields.ID(stored=True), value=fields.TEXT)
+        st = RamStorage()
+        ix = st.create_index(s)
+        
+        for keys in (u"abc", u"de"):
+            w = ix.writer()
+            for key in keys:
+                w.add_document(key=key, value=u"alfa bravo charlie")
+            w.commit(NO_MERGE)
+        ix.delete_by_term("key", u"b")
+        ix.commit()
+        
+        ix2 = st.open_index()
+        self.assertEqual([seg.name for seg in ix2.segments],
+                         [seg.name for seg in ix.segments])
+        self.assertEqual(ix2.doc_count_all(), 5)
+        self.assertEqual(ix2.doc_count(), 4)
+        self.assertTrue(ix2.is_deleted(1))
+        self.assertEqual(ix2.field_length("value"), 15)
+        self.assertEqual(ix2.segment_counter, ix.segment_counter)
+        
+        # Each index unpickles its own copy of the schema
+        ix3 = st.open_index()
+        self.assertEqual(ix2.schema, s)
+        self.assertEqual(ix3.schema, s)
+        self.assertFalse(ix3.schema is ix2.schema)
+    
+    def test_unstorable_value(self):
+        from datetime import datetime
+        
+        s = fields.Schema(key=fields.ID(stored=True), value=fields.TEXT,
+                          extra=fields.STORED)
+        ix = RamStorage().create_index(s)
+        w = ix.writer()
+        w.add_document(key=u"a", value=u"alfa", extra=datetime(2010, 1, 1))
+        self.assertRaises(Exception, w.add_document, key=u"b",
+                          value=u"alfa bravo", extra=lambda: None)
+        w.add_document(key=u"c", value=u"alfa charlie")
+        w.commit()
+        
+        # The failed document didn't leave any postings behind
+        r = ix.reader()
+        self.assertEqual(r.doc_count_all(), 2)
+        self.assertEqual(r.doc_frequency("value", u"alfa"), 2)
+        self.assertFalse(("value", u"bravo") in r)
+        self.assertEqual(list(r.postings("value", u"alfa").all_ids()), [0, 1])
+        self.assertEqual(r.stored_fields(0)["extra"], datetime(2010, 1, 1))
+        self.assertEqual(r.stored_fields(1)["key"], u"c")
 
 
 if __name__ == '__main__':
@@ -1,9 +1,10 @@
 import unittest
 
-import os, os.path, threading, time
+import os, os.path, subprocess, sys, threading, time
 
 from whoosh.filedb.filestore import FileStorage
 from whoosh.support.filelock import try_for
+from whoosh.util import LRUCache
 
 
 class TestMisc(unittest.TestCase):
@@ -73,6 +74,87 @@ class TestMisc(unittest.TestCase):
         self.clean_file("testindex/testlock")
         self.destroy_dir("testindex")
 
+    def test_lru_cache(self):
+        cache = LRUCache(3)
+        for i in xrange(3):
+            cache[i] = str(i)
+        # Access 0 so that 1 is the least recently used
+        self.assertEqual(cache[0], "0")
+        cache[3] = "3"
+        self.assertEqual(len(cache), 3)
+        self.assertFalse(1 in cache)
+        self.assertEqual(cache.get(1), None)
+        self.assertEqual(sorted(cache._data.keys()), [0, 2, 3])
+        
+        for i in xrange(100):
+            cache[i % 5] = i
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(sorted(cache._data.keys()), [2, 3, 4])
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        
+        # Hammer a shared cache from several threads
+        import threading
+        cache = LRUCache(50)
+        errors = []
+        def worker(n):
+            try:
+                for i in xrange(2000):
+                    key = (i * 7 + n) % 80
+                    cache[key] = key
+                    v = cache.get((i * 3) % 80)
+                    if v is not None and v != (i * 3) % 80:
+                        errors.append(v)
+            except Exception, e:
+                errors.append(e)
+        threads = [threading.Thread(target=worker, args=(n,))
+                   for n in xrange(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(cache), 50)
+    
+    def test_lru_cache_decorator(self):
+        from whoosh.util import lru_cache
+        
+        class Squarer(object):
+            def __init__(self):
+                self.calls = 0
+            
+            @lru_cache(2)
+            def square(self, n):
+                self.calls += 1
+                return n * n
+        
+        sq = Squarer()
+        self.assertEqual([sq.square(n) for n in (2, 3, 2, 4, 3)],
+                         [4, 9, 4, 16, 9])
+        # 3 was pushed out by 4, so it was computed twice
+        self.assertEqual(sq.calls, 4)
+        self.assertEqual(len(sq._square_cache), 2)
+    
+    def test_lazy_imports(self):
+        # Importing the modules needed to open and search an index shouldn't
+        # load the heavy optional modules. Run in a new interpreter since this
+        # process has probably imported them already.
+        code = ("import sys\n"
+                "import whoosh.index, whoosh.qparser, whoosh.searching\n"
+                "import whoosh.filedb.filestore\n"
+                "from whoosh import analysis\n"
+                "print [m for m in sys.modules if m.startswith('whoosh.')]\n"
+                "print analysis._unicode_class_strings is None\n")
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        p = subprocess.Popen([sys.executable, "-c", code], env=env,
+                             stdout=subprocess.PIPE)
+        output = p.communicate()[0].splitlines()
+        modules = eval(output[0])
+        for name in ("whoosh.support.pyparsing", "whoosh.lang.porter",
+                     "whoosh.lang.morph_en", "whoosh.support.charset",
+                     "whoosh.highlight", "whoosh.spelling"):
+            self.assertFalse(name in modules, name)
+        self.assertEqual(output[1], "True")
 
 if __name__ == '__main__':
     unittest.main()
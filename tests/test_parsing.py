@@ -262,6 +262,92 @@ class TestQueryParser(unittest.TestCase):
         q = qp.parse(u"Indexed!")
         self.assertEqual(q.__class__.__name__, "Term")
         self.assertEqual(q.text, "index")
+    
+    def test_pyparsing_equivalence(self):
+        from whoosh.qparser.default import _make_default_parser
+        
+        schema = fields.Schema(content=fields.TEXT, title=fields.ID)
+        hand = qparser.QueryParser("content", schema=schema)
+        pp = qparser.QueryParser("content", schema=schema,
+                                 parser=_make_default_parser())
+        tests = [u"alfa", u"  alfa  bravo ", u"alfa AND bravo charlie",
+                 u"alfa OR bravo charlie", u"alfa ANDNOT bravo charlie",
+                 u"NOT alfa bravo", u"not alfa", u"notalfa", u"alfa AND",
+                 u'"alfa bravo" title:"charlie"', u"title:alfa^2.5 bravo ^ 3",
+                 u"(alfa OR (bravo charlie))", u"title:(alfa bravo)",
+                 u"title: alfa^2", u"title :alfa",
+                 u"[alfa TO bravo]", u"{alfa TO}", u"[TO bravo}",
+                 u'[ "alfa" TO bravo]', u"al*fa ?bravo * charlie*",
+                 u"alfa\\ bravo \\(charlie\\)", u"alfa\tbravo\ncharlie"]
+        for text in tests:
+            self.assertEqual(repr(hand.parse(text, normalize=False)),
+                             repr(pp.parse(text, normalize=False)), text)
+        
+        self.assertRaises(query.QueryError, hand.parse, u"alfa (bravo")
+        self.assertRaises(query.QueryError, hand.parse, u"(alfa)^2")
+        self.assertRaises(query.QueryError, hand.parse, u"title: alfa")
+
+    
+    def test_cache(self):
+        schema = fields.Schema(content=fields.TEXT, title=fields.ID)
+        qp = qparser.QueryParser("content", schema=schema, cachesize=2)
+        q1 = qp.parse(u"Alfa title:bravo^2")
+        self.assertEqual(len(qp._cache), 1)
+        q1[1].boost = 5.0
+        q2 = qp.parse(u"Alfa title:bravo^2")
+        self.assertEqual(q1[0], q2[0])
+        self.assertEqual(q2[1].boost, 2.0)
+        self.assertEqual(len(qp._cache), 1)
+        self.assertEqual(qp.parse(u"the"), query.NullQuery)
+        self.assertTrue(qp.parse(u"the") is query.NullQuery)
+        
+        qp.parse(u"charlie", normalize=False)
+        self.assertEqual(len(qp._cache), 2)
+        self.assertFalse((u"Alfa title:bravo^2", "content", True) in qp._cache)
+        
+        # Adding a field invalidates the cache
+        schema.add("other", fields.KEYWORD)
+        self.assertEqual(qp.parse(u"other:Delta").text, "Delta")
+        self.assertEqual(len(qp._cache), 1)
+        
+        qp.clear_cache()
+        self.assertEqual(qp.parse(u"charlie").text, "charlie")
+        
+        mp = qparser.MultifieldParser(("title", "content"), schema=schema,
+                                      cachesize=10)
+        self.assertEqual(len(mp.parse(u"echo").subqueries), 2)
+        mp.fieldnames = ("title", )
+        self.assertEqual(mp.parse(u"echo").__class__, query.Term)
+    
+    def test_cache_threads(self):
+        import sys, threading
+        
+        schema = fields.Schema(content=fields.TEXT)
+        qp = qparser.QueryParser("content", schema=schema, cachesize=2)
+        words = [u"alfa", u"bravo", u"charlie", u"delta"]
+        
+        # With a small full cache, other threads keep evicting the entries
+        # each thread is looking up
+        errors = []
+        def parse():
+            try:
+                for _ in xrange(500):
+                    for w in words:
+                        self.assertEqual(qp.parse(w).text, w)
+            except Exception, e:
+                errors.append(e)
+        
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        threads = [threading.Thread(target=parse) for _ in xrange(4)]
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            sys.setcheckinterval(interval)
+        self.assertEqual(errors, [])
 
 
 if __name__ == '__main__':
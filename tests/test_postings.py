@@ -18,6 +18,10 @@ class TestMultireaders(unittest.TestCase):
     def test_intersect(self):
         isect = IntersectionScorer(self.make_readers())
         self.assertEqual(list(isect.all_ids()), [20, 30, 50])
+        isect = IntersectionScorer(self.make_readers(), costs=[7, 7, 8])
+        self.assertEqual(list(isect.all_ids()), [20, 30, 50])
+        isect = IntersectionScorer(self.make_readers(), costs=[9, 1, 5])
+        self.assertEqual(list(isect.all_ids()), [20, 30, 50])
 
     def test_union(self):
         c1, c2, c3 = self.make_readers()
@@ -223,5 +227,81 @@ class TestReadWrite(unittest.TestCase):
         as_freq = [(docnum, len(posns)) for docnum, posns in as_posns]
         self.assertEqual(as_freq, self.roundtrip(postings, CharacterBoosts(None), "frequency"))
 
+    def test_mapped_reads(self):
+        format = Frequency(None)
+        postings = self.make_postings()
+        
+        postfile = self.make_file("mapped")
+        try:
+            fpw = FilePostingWriter(postfile, blocklimit=8)
+            fpw.start(format)
+            for id, freq in postings:
+                fpw.write(id, format.encode(freq))
+            fpw.close()
+            
+            for mapped in (True, False):
+                postfile = self.fs.open_file("mapped_test.pst", mapped=mapped)
+                fpr = FilePostingReader(postfile, 0, format)
+                self.assertEqual(list(fpr.all_as("frequency")), postings)
+                fpr.reset()
+                fpr.skip_to(400)
+                self.assertEqual(fpr.id, 412)
+                self.assertEqual(fpr.value_as("frequency"), 39)
+                fpr.close()
+        finally:
+            self.delete_file("mapped")
+    
+    def test_split_positions(self):
+        format = PositionBoosts(None)
+        postings = []
+        docnum = 0
+        for _ in xrange(0, 20):
+            docnum += randint(1, 10)
+            posns = []
+            pos = 0
+            for __ in xrange(0, randint(1, 10)):
+                pos += randint(1, 10)
+                boost = byte_to_float(float_to_byte(random() * 2))
+                posns.append((pos, boost))
+            postings.append((docnum, posns))
+        
+        postfile = self.make_file("split")
+        posfile = self.fs.create_file("split_test.pos")
+        try:
+            fpw = FilePostingWriter(postfile, blocklimit=8, posfile=posfile)
+            fpw.start(format)
+            for id, value in postings:
+                fpw.write(id, format.encode(value))
+            fpw.close()
+            
+            postfile = self.open_file("split")
+            posfile = self.fs.open_file("split_test.pos")
+            fpr = FilePostingReader(postfile, 0, format, posfile=posfile)
+            
+            # Reading the frequencies should only use the value heads
+            freqs = []
+            while fpr.id is not None:
+                freqs.append((fpr.id, fpr.value_as("frequency")))
+                self.assertEqual(fpr.values, None)
+                fpr.next()
+            self.assertEqual(freqs, [(docnum, len(posns))
+                                     for docnum, posns in postings])
+            
+            fpr.reset()
+            fpr.skip_to(postings[10][0])
+            self.assertEqual(fpr.value_as("positions"),
+                             [pos for pos, boost in postings[10][1]])
+            self.assertEqual(postings, list(fpr.all_as("position_boosts")))
+            self.assertEqual(postings,
+                             [(id, format.decode_position_boosts(v))
+                              for id, v in fpr.all_items()])
+            fpr.close()
+        finally:
+            self.delete_file("split")
+            try:
+                self.fs.delete_file("split_test.pos")
+            except OSError:
+                pass
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,6 +2,8 @@ import unittest
 
 from whoosh import analysis, fields, formats, index, qparser, query, searching, scoring
 from whoosh.filedb.filestore import RamStorage
+from whoosh.filedb.filewriting import NO_MERGE
+from whoosh.postings import EmptyScorer
 from whoosh.query import *
 from whoosh.searching import Searcher
 from whoosh.scoring import FieldSorter
@@ -128,6 +130,50 @@ class TestSearching(unittest.TestCase):
     def test_variations(self):
         self._run_query(Variations("value", u"render"), [u"A", u"C", u"E"])
     
+    def test_synonyms(self):
+        from cStringIO import StringIO
+        from whoosh.lang.wordnet import Thesaurus
+        
+        wn = StringIO("""s(100001,1,'render',v,1,0).
+s(100001,2,'deliver',v,1,0).
+s(100002,1,'render',v,2,0).
+s(100002,2,'interpret',v,1,0).
+s(100003,1,'Blue',a,1,0).
+s(100003,2,'gamy',a,1,0).
+s(100004,1,'red',a,1,0).
+s(100004,2,'ruby',a,1,0).
+s(100004,3,'carmine',a,1,0).
+s(100005,1,'bad_debt',n,1,0).
+""")
+        thes = Thesaurus.from_file(wn)
+        st = RamStorage()
+        thes.to_synonym_file(st)
+        thes2 = Thesaurus.from_synonym_file(st)
+        synfile = thes2.synfile
+        
+        self.assertEqual(len(synfile), 8)
+        self.assertEqual(list(synfile)[:3], [u"blue", u"carmine", u"deliver"])
+        for word in ("render", "deliver", "red", "carmine", "blue", "gamy"):
+            self.assertEqual(thes2.synonyms(word), thes.synonyms(word))
+        self.assertEqual(thes2.synonyms(u"Render"),
+                         [u"deliver", u"interpret"])
+        self.assertEqual(thes2.synonyms(u"ruby"), [u"carmine", u"red"])
+        self.assertEqual(thes2.synonyms(u"bad_debt"), [])
+        self.assertEqual(thes2.synonyms(u"aaa"), [])
+        self.assertEqual(thes2.synonyms(u"zzz"), [])
+        self.assertFalse(u"gam" in synfile)
+        
+        self._run_query(Synonyms("value", u"ruby", thes2), [u"A", u"D"])
+        self._run_query(Synonyms("value", u"gamy", synfile), [u"A"])
+        q = Synonyms("value", u"deliver", thes2)
+        self.assertEqual(q.words, [u"deliver", u"render"])
+        self.assertEqual(q.all_terms(), set([("value", u"deliver")]))
+        self.assertEqual(And([q, Term("name", u"red")]).all_terms(),
+                         set([("value", u"deliver"), ("name", u"red")]))
+        self.assertEqual(q.replace(u"deliver", u"red").words,
+                         [u"red", u"carmine", u"ruby"])
+        synfile.close()
+    
     def test_topnot(self):
         self._run_query(Not(Term("name", "yellow")), [u"B", u"C", u"D"])
     
@@ -135,6 +181,138 @@ class TestSearching(unittest.TestCase):
         self._run_query(Or([Wildcard('value', u'*red*'), Wildcard('name', u'*yellow*')]),
                         [u"A", u"C", u"D", u"E"])
     
+    def test_fuzzy(self):
+        self._run_query(FuzzyTerm("value", u"rendr", maxdist=1, prefixlength=0),
+                        [u"A"])
+        self._run_query(FuzzyTerm("value", u"rendred", maxdist=1), [u"C"])
+        self._run_query(FuzzyTerm("value", u"grene", maxdist=2), [u"A"])
+        self._run_query(FuzzyTerm("value", u"xrender", maxdist=1,
+                                  prefixlength=1), [])
+        self._run_query(FuzzyTerm("value", u"rendering"), [u"C", u"E"])
+    
+    def test_terms_within(self):
+        schema = fields.Schema(t=fields.ID)
+        ix = RamStorage().create_index(schema)
+        words = [u"aa", u"ab", u"abc", u"abcd", u"bac", u"bbc", u"cab", u"zz"]
+        for word in words:
+            w = ix.writer()
+            w.add_document(t=word)
+            w.commit(NO_MERGE)
+        
+        from whoosh.support.levenshtein import distance
+        r = ix.reader()
+        for text in (u"abc", u"b", u"zzz"):
+            for maxdist in (0, 1, 2):
+                target = [word for word in words
+                          if distance(text, word) <= maxdist]
+                self.assertEqual(list(r.terms_within("t", text, maxdist)),
+                                 target)
+        self.assertEqual(list(r.terms_within("t", u"abc", 1, prefix=2)),
+                         [u"ab", u"abc", u"abcd"])
+
+    def test_and_plan(self):
+        ix = self.make_index()
+        s = ix.searcher()
+        r = s.reader()
+        
+        q = And([Term("value", u"red"), Term("name", u"quick")])
+        self.assertEqual(self._docs(q, s), [u"D"])
+        self.assertEqual(q.explain(r).splitlines(),
+                         [u"(value:red AND name:quick) ~1, rarest first:",
+                          u"  name:quick ~1", u"  value:red ~2"])
+        
+        q = And([Term("value", u"red"), Not(Term("value", u"town"))])
+        self.assertEqual(self._docs(q, s), [u"A"])
+        q = And([Term("name", u"yellow"),
+                 AndNot(Term("value", u"red"), Term("value", u"purple"))])
+        self.assertEqual(self._docs(q, s), [])
+        q = And([Term("value", u"red"), Or([Term("value", u"town"),
+                                            Term("value", u"purple")])])
+        self.assertEqual(self._docs(q, s), [u"A", u"D"])
+        
+        q = And([Term("value", u"red"), Term("value", u"zeta")])
+        self.assertEqual(q.scorer(s).__class__, EmptyScorer)
+        self.assertEqual(q.explain(r).splitlines()[-1],
+                         u"  (matches nothing, so the rest is skipped)")
+        self.assertEqual(self._docs(Phrase("value", [u"red", u"zeta"]), s), [])
+
+    def test_constant_score(self):
+        ix = self.make_index()
+        s = ix.searcher()
+        for q in (Prefix("value", u"re"), Wildcard("value", u"*e*"),
+                  TermRange("value", u"a", u"p"),
+                  FuzzyTerm("value", u"render", maxdist=2)):
+            target = self._docs(q, s)
+            q.constantscore_limit = 0
+            q.boost = 2.5
+            self.assertEqual(self._docs(q, s), target)
+            scores = [score for _, score in q.doc_scores(s)]
+            self.assertEqual(scores, [2.5] * len(target))
+        
+        q = Prefix("value", u"zz")
+        q.constantscore_limit = 0
+        self.assertEqual(list(q.docs(s)), [])
+
+    def test_regex(self):
+        self._run_query(Regex("value", u"re(d|nder(ed|ing)?)"),
+                        [u"A", u"C", u"D", u"E"])
+        self._run_query(Regex("value", u"[a-f][^e]+"), [u"B", u"C"])
+        self._run_query(Regex("value", u"\\w{4}"), [u"A", u"C", u"D"])
+        # Lookahead isn't supported by the automaton, so this falls back to
+        # testing every term with the re module
+        self._run_query(Regex("value", u"(?=r).*ing"), [u"E"])
+
+    def test_reverse_wildcard(self):
+        schema = fields.Schema(key=fields.ID(stored=True),
+                               value=fields.TEXT(reverse=True))
+        ix = RamStorage().create_index(schema)
+        w = ix.writer()
+        w.add_document(key=u"A", value=u"rendering render")
+        w.add_document(key=u"B", value=u"singing gnir")
+        w.add_document(key=u"C", value=u"thing rendered")
+        w.commit()
+
+        s = ix.searcher()
+        self.assertEqual(self._docs(Wildcard("value", u"*ing"), s),
+                         [u"A", u"B", u"C"])
+        self.assertEqual(self._docs(Wildcard("value", u"*n?er*"), s),
+                         [u"A", u"C"])
+        self.assertEqual(self._docs(Wildcard("value", u"?ing"), s), [])
+        self.assertEqual(self._docs(Wildcard("value", u"g*"), s), [u"B"])
+        self.assertEqual(sorted(Wildcard("value", u"*ing")._words(s.reader())),
+                         [u"rendering", u"singing", u"thing"])
+        # The reversed terms don't count toward the field length
+        self.assertEqual(s.reader().doc_field_length(0, "value"), 2)
+
+    def test_reverse_terms_hidden(self):
+        from whoosh.ramdb.ramindex import RamIndex
+        
+        schema = fields.Schema(key=fields.ID(stored=True),
+                               k=fields.KEYWORD(reverse=True))
+        ix = RamStorage().create_index(schema)
+        ram = RamIndex(schema)
+        for writer in (ix.writer(), ram.writer()):
+            writer.add_document(key=u"A", k=u"abd")
+            writer.add_document(key=u"B", k=u"cba")
+            writer.commit()
+        
+        for s in (ix.searcher(), ram.searcher()):
+            r = s.reader()
+            self.assertEqual(list(r.lexicon("k")), [u"abd", u"cba"])
+            self.assertEqual(list(r.expand_prefix("k", u"")), [u"abd", u"cba"])
+            self.assertEqual([t for t, _, _ in r.iter_field("k")],
+                             [u"abd", u"cba"])
+            self.assertEqual(list(r.terms_within("k", u"abc", 1)), [u"abd"])
+            
+            q = FuzzyTerm("k", u"abc", maxdist=1, prefixlength=0)
+            self.assertEqual(list(q._words(r)), [u"abd"])
+            self.assertEqual(self._docs(q, s), [u"A"])
+            self.assertEqual(self._docs(FuzzyTerm("k", u"abc",
+                                                  prefixlength=0), s), [u"A"])
+            self.assertEqual(self._docs(Prefix("k", u""), s), [u"A", u"B"])
+            q = TermRange("k", u"b", u"\uffff\uffff")
+            self.assertEqual(self._docs(q, s), [u"B"])
+
 #        for wcls in dir(scoring):
 #            if wcls is scoring.Weighting: continue
 #            if isinstance(wcls, scoring.Weighting):
@@ -417,6 +595,50 @@ class TestSearching(unittest.TestCase):
         q = query.Phrase("value", [u"blah"] * 3)
         self.assertEqual(names(searcher.search(q)), ["E"])
         
+    def test_bigram_phrase(self):
+        schema = fields.Schema(name=fields.ID(stored=True),
+                               value=fields.TEXT(bigrams=True))
+        ix = RamStorage().create_index(schema)
+        w = ix.writer()
+        w.add_document(name=u"A", value=u"alfa bravo charlie delta echo")
+        w.add_document(name=u"B", value=u"bravo alfa charlie delta alfa")
+        w.add_document(name=u"C", value=u"echo delta charlie bravo alfa")
+        w.commit()
+        w = ix.writer()
+        w.add_document(name=u"D", value=u"delta alfa bravo charlie bravo")
+        w.commit()
+        
+        s = ix.searcher()
+        r = s.reader()
+        fieldnum = r.fieldname_to_num("value")
+        self.assertEqual(r.doc_frequency(fieldnum,
+                                         fields.bigram_term(u"alfa", u"bravo")),
+                         2)
+        self.assertEqual(r.doc_field_length(0, "value"), 5)
+        
+        def names(q):
+            return sorted(d["name"] for d in s.search(q))
+        
+        self.assertEqual(names(Phrase("value", [u"alfa", u"bravo"])),
+                         [u"A", u"D"])
+        self.assertEqual(names(Phrase("value", [u"alfa", u"bravo", u"charlie"])),
+                         [u"A", u"D"])
+        self.assertEqual(names(Phrase("value", [u"charlie", u"delta"])),
+                         [u"A", u"B"])
+        self.assertEqual(names(Phrase("value", [u"alfa", u"echo"])), [])
+        self.assertEqual(names(Phrase("value", [u"bravo", u"alfa", u"charlie"],
+                                      slop=2)), [u"B"])
+        # The word pair terms aren't matched by wildcards, fuzzy terms, or
+        # ranges, or listed in the lexicon
+        self.assertEqual(list(Wildcard("value", u"*")._words(r))[-1], u"echo")
+        self.assertEqual(list(r.lexicon("value")),
+                         [u"alfa", u"bravo", u"charlie", u"delta", u"echo"])
+        q = FuzzyTerm("value", u"alfa bravo", maxdist=3, prefixlength=0)
+        self.assertEqual(list(q._words(r)), [])
+        self.assertEqual(names(q), [])
+        self.assertEqual(names(TermRange("value", u"f", u"\uffff\uffffz")), [])
+        self.assertEqual(s.suggest("value", u"alfa bravo", maxdist=3), [])
+    
     def test_phrase_score(self):
         schema = fields.Schema(name=fields.ID(stored=True), value=fields.TEXT)
         storage = RamStorage()
@@ -685,6 +907,73 @@ class TestSearching(unittest.TestCase):
         self.assertEqual(r.pagenum, 2)
         self.assertEqual(r.pagelen, 2)
         
+    def test_stored_fields_many(self):
+        schema = fields.Schema(id=fields.ID(stored=True),
+                               title=fields.TEXT(stored=True),
+                               body=fields.TEXT(stored=True))
+        st = RamStorage()
+        ix = st.create_index(schema)
+        for start in (0, 3):
+            w = ix.writer()
+            for i in xrange(start, start + 3):
+                w.add_document(id=unicode(i), title=u"title %d" % i,
+                               body=u"body %d" % i)
+            w.commit(NO_MERGE)
+        
+        for cachesize in (0, 10):
+            s = ix.searcher(doccache_size=cachesize)
+            self.assertEqual(len(s.reader().readers), 2)
+            docnums = [4, 0, 5, 2, 4]
+            for _ in xrange(2):
+                docs = s.stored_fields_many(docnums)
+                self.assertEqual(docs, [s.stored_fields(d) for d in docnums])
+                
+                docs = s.stored_fields_many(docnums, fields=["id", "body"])
+                self.assertEqual(docs, [{"id": u"%d" % d, "body": u"body %d" % d}
+                                        for d in docnums])
+            
+            docs = s.stored_fields_many([3], fields=["title", "nothere"])
+            self.assertEqual(docs, [{"title": u"title 3"}])
+            docs[0]["title"] = u"changed"
+            self.assertEqual(s.stored_fields_many([3], fields=["title"]),
+                             [{"title": u"title 3"}])
+            
+            r = s.search(query.Term("body", u"body"))
+            self.assertEqual(r[:], list(r))
+            s.close()
+    
+    def test_more_like_this(self):
+        a = analysis.StandardAnalyzer()
+        for vector in (formats.Frequency(analyzer=a), None):
+            schema = fields.Schema(k=fields.STORED,
+                                   v=fields.TEXT(stored=True, vector=vector))
+            ix = RamStorage().create_index(schema)
+            w = ix.writer()
+            w.add_document(k=1, v=u"alfa bravo charlie delta bravo")
+            w.add_document(k=2, v=u"bravo charlie echo foxtrot")
+            w.add_document(k=3, v=u"golf hotel india juliet")
+            w.add_document(k=4, v=u"delta golf kilo lima")
+            w.add_document(k=5, v=u"mike november oscar papa")
+            w.commit()
+            
+            s = ix.searcher()
+            q = MoreLikeThis("v", docnums=[0], maxterms=2)
+            r = s.search(q)
+            self.assertEqual([d["k"] for d in r], [2])
+            self.assertEqual(len(q.key_terms(s.reader())), 2)
+            
+            q = MoreLikeThis("v", docnums=[0], include_source=True)
+            r = s.search(q)
+            self.assertEqual(r[0]["k"], 1)
+            self.assertEqual(sorted(d["k"] for d in r), [1, 2, 4])
+            
+            q = MoreLikeThis("v", text=u"november zulu")
+            self.assertEqual([d["k"] for d in s.search(q)], [5])
+            self.assertEqual(q.existing_terms(s.reader()),
+                             set([("v", u"november")]))
+            s.close()
+        
+
 
 
 if __name__ == '__main__':
@@ -40,6 +40,122 @@ class TestSpelling(unittest.TestCase):
         from whoosh.scoring import Frequency
         sugs = sp.suggestions_and_scores(u"alpha", weighting=Frequency())
         self.assertEqual(sugs, [(u"alfa", 10, 3.0), (u"charlie", 8, 1.0)])
+        
+    def test_symmetric(self):
+        sp = spelling.SymmetricSpellChecker()
+        wordlist = ["render", "animation", "animate", "shader", "shading",
+                    "reaction", "reduction", "preaction", "blunder", "red",
+                    "ready", "read", "internationalization"]
+        sp.add_words([unicode(w) for w in wordlist])
+        
+        self.assertEqual(sp.suggest(u"reoction"),
+                         [u"reaction", u"preaction", u"reduction"])
+        self.assertEqual(sp.suggest(u"animatoin", number=1), [u"animation"])
+        self.assertEqual(sp.suggest(u"intrenationalization"),
+                         [u"internationalization"])
+        self.assertEqual(sp.suggest(u"xyzzy"), [])
+        
+        sp.add_scored_words([(u"read", 5), (u"red", 2), (u"rod", 10)])
+        self.assertEqual(len(sp), len(wordlist) + 1)
+        self.assertEqual(sp.suggestions_and_scores(u"rad"),
+                         [(u"rod", 10, 1), (u"read", 5, 1), (u"red", 2, 1),
+                          (u"ready", 1, 2)])
+        self.assertEqual(sp.suggest(u"rad", usescores=True),
+                         [u"rod", u"read", u"red"])
+        self.assertEqual(sp.suggest(u"rad"), [u"read", u"red", u"rod"])
+        
+    def test_symmetric_short_words(self):
+        # Words no longer than maxdist can be reached by deleting every
+        # character
+        sp = spelling.SymmetricSpellChecker(maxdist=1)
+        sp.add_words([u"a", u"b", u"c", u"ab", u"xyz"])
+        self.assertEqual(sp.suggest(u"a", number=5), [u"ab", u"b", u"c"])
+        self.assertEqual(sp.suggest(u"x"), [u"a", u"b", u"c"])
+        self.assertEqual(sp.suggest(u"xy"), [u"xyz"])
+        
+        # Compare with a brute force search
+        from random import Random
+        from whoosh.support.levenshtein import distance
+        rnd = Random(3)
+        def randword():
+            return u"".join(rnd.choice(u"abc")
+                            for _ in xrange(rnd.randint(1, 6)))
+        
+        for maxdist, prefixlen in ((1, 7), (2, 7), (2, 3)):
+            words = list(set(randword() for _ in xrange(200)))
+            sp = spelling.SymmetricSpellChecker(maxdist=maxdist,
+                                                prefixlen=prefixlen)
+            sp.add_words(words)
+            for _ in xrange(100):
+                text = randword()
+                target = sorted(w for w in words
+                                if w != text and distance(text, w) <= maxdist)
+                found = sorted(w for w, _, _
+                               in sp.suggestions_and_scores(text))
+                self.assertEqual(found, target)
+    
+    def test_reader(self):
+        from whoosh import fields
+        from whoosh.filedb.filewriting import NO_MERGE
+        
+        schema = fields.Schema(text=fields.TEXT)
+        ix = RamStorage().create_index(schema)
+        docs = [u"render shader", u"reaction reduction", u"reaction",
+                u"preaction rendered", u"reaction shading"]
+        for text in docs:
+            w = ix.writer()
+            w.add_document(text=text)
+            w.commit(NO_MERGE)
+        
+        r = ix.reader()
+        sp = spelling.ReaderSpellChecker(r, "text")
+        self.assertEqual(sp.suggestions_and_scores(u"reoction"),
+                         [(u"reaction", 3, 1), (u"preaction", 1, 2),
+                          (u"reduction", 1, 2)])
+        self.assertEqual(sp.suggest(u"rendr"), [u"render"])
+        self.assertEqual(sp.suggest(u"shadng"), [u"shading", u"shader"])
+        
+        sp = spelling.ReaderSpellChecker(r, "text", minfreq=2)
+        self.assertEqual(sp.suggest(u"reoction"), [u"reaction"])
+        
+        # New documents are seen as soon as there's a new reader
+        w = ix.writer()
+        w.add_document(text=u"reduction reduction")
+        w.commit()
+        s = ix.searcher()
+        self.assertEqual(s.suggest("text", u"reoction", number=2),
+                         [u"reaction", u"reduction"])
+        self.assertEqual(s.suggest("text", u"reoction", maxdist=1), [u"reaction"])
+        self.assertEqual(s.suggest("text", u"eaction", prefix=1), [])
+        
+    def test_reader_marked_terms(self):
+        from whoosh import fields
+        
+        schema = fields.Schema(k=fields.KEYWORD(reverse=True),
+                               t=fields.TEXT(bigrams=True))
+        ix = RamStorage().create_index(schema)
+        w = ix.writer()
+        w.add_document(k=u"abd cba", t=u"beta gamma")
+        w.add_document(k=u"abd", t=u"beta gamma delta")
+        w.commit()
+        
+        s = ix.searcher()
+        self.assertEqual(s.suggest("k", u"abc"), [u"abd", u"cba"])
+        self.assertEqual(s.suggest("k", u"dba"), [u"cba", u"abd"])
+        self.assertEqual(s.suggest("t", u"beta gama", maxdist=3), [])
+        sp = spelling.ReaderSpellChecker(s.reader(), "k", maxdist=3)
+        self.assertEqual([w for w, _, _ in sp.suggestions_and_scores(u"abc")],
+                         [u"abd", u"cba"])
+        
+    def test_bounded_distance(self):
+        from whoosh.support.levenshtein import distance
+        
+        pairs = [("kitten", "sitting"), ("", "abc"), ("flaw", "lawn"),
+                 ("alfa", "alfa"), ("intention", "execution")]
+        for a, b in pairs:
+            d = distance(a, b)
+            for limit in xrange(0, 6):
+                self.assertEqual(distance(a, b, limit=limit), min(d, limit + 1))
 
 
 
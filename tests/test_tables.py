@@ -1,11 +1,19 @@
 import unittest
+from datetime import datetime
+from decimal import Decimal
 from os import mkdir
 from os.path import exists
 from shutil import rmtree
 
 from whoosh import analysis, fields, index, qparser
 from whoosh.filedb.filestore import FileStorage
-from whoosh.filedb.filetables import FileHashReader, FileHashWriter
+from whoosh.filedb.filetables import (FileHashReader, FileHashWriter,
+                                      FileTableReader, FileTableWriter,
+                                      PrefixTableReader, PrefixTableWriter,
+                                      StoredFieldReader, StoredFieldWriter,
+                                      encode_termkey, decode_termkey,
+                                      encode_value, decode_value,
+                                      decode_storedfields)
 
 
 class TestTables(unittest.TestCase):
@@ -34,6 +42,83 @@ class TestTables(unittest.TestCase):
         
         #self.destroy_dir("testindex")
     
+    def test_prefix_table(self):
+        self.make_dir("testindex")
+        st = FileStorage("testindex")
+        
+        keys = [(0, u"http://example.com/%s/%05d" % (d, i))
+                for d in ("alfa", "bravo", "charlie") for i in xrange(200)]
+        keys.append((1, u"\u00e9t\u00e9"))
+        
+        tw = PrefixTableWriter(st.create_file("test.tiz"),
+                               keycoder=encode_termkey)
+        hw = FileTableWriter(st.create_file("test.hsh"),
+                             keycoder=encode_termkey)
+        for i, key in enumerate(keys):
+            tw.add(key, i)
+            hw.add(key, i)
+        tw.close()
+        hw.close()
+        self.assertTrue(st.file_length("test.tiz") * 2
+                        < st.file_length("test.hsh"))
+        
+        tr = PrefixTableReader(st.open_file("test.tiz"),
+                               keycoder=encode_termkey,
+                               keydecoder=decode_termkey)
+        self.assertEqual(list(tr.keys()), keys)
+        self.assertEqual([v for _, v in tr.items()], range(len(keys)))
+        self.assertEqual(tr[(0, u"http://example.com/bravo/00150")], 350)
+        self.assertEqual(tr[(1, u"\u00e9t\u00e9")], 600)
+        self.assertTrue((0, u"http://example.com/charlie/00000") in tr)
+        self.assertFalse((0, u"http://example.com/charlie/1") in tr)
+        self.assertEqual(tr.get((2, u"a")), None)
+        self.assertRaises(KeyError, tr.__getitem__, (0, u"http://a"))
+        
+        fromkey = (0, u"http://example.com/bravo/0019")
+        self.assertEqual(list(tr.keys_from(fromkey))[:3],
+                         [(0, u"http://example.com/bravo/00190"),
+                          (0, u"http://example.com/bravo/00191"),
+                          (0, u"http://example.com/bravo/00192")])
+        self.assertEqual(list(tr.items_from((1, u""))),
+                         [((1, u"\u00e9t\u00e9"), 600)])
+        self.assertEqual(list(tr.keys_from((2, u""))), [])
+        tr.close()
+    
+    def test_stored_values(self):
+        values = [None, True, False, 0, -5, 2 ** 40, -(2 ** 70), 1.5,
+                  u"\u00e9t\u00e9", "bytes", [1, u"a"], (2, [None]),
+                  {u"a": 1, 2: (u"b", 3.0)}, datetime(2010, 4, 1, 12, 30),
+                  set([1, 2]), [Decimal("1.5")]]
+        for value in values:
+            decoded = decode_value(encode_value(value))
+            self.assertEqual(decoded, value)
+            self.assertEqual(type(decoded), type(value))
+        self.assertEqual(encode_value(u"a")[0], "u")
+        self.assertEqual(encode_value(set())[0], "p")
+        self.assertRaises(Exception, encode_value, lambda: None)
+    
+    def test_stored_fields(self):
+        self.make_dir("testindex")
+        st = FileStorage("testindex")
+        
+        for compression in (0, 3):
+            docs = [[u"doc %d" % i, i, u"text " * (i % 50)]
+                    for i in xrange(500)]
+            sw = StoredFieldWriter(st.create_file("test.dcz"), blocksize=1024,
+                                   compression=compression)
+            for values in docs:
+                sw.append(values)
+            sw.close()
+            
+            sr = StoredFieldReader(st.open_file("test.dcz"), cachesize=2)
+            self.assertTrue(len(sr.offsets) > 1)
+            for docnum in (0, 499, 250, 251, 3):
+                self.assertEqual(sr[docnum], docs[docnum])
+            self.assertEqual(decode_storedfields(sr.raw(42), [1]), [42])
+            self.assertRaises(IndexError, sr.__getitem__, 500)
+            self.assertTrue(len(sr.cache) <= 2)
+            sr.close()
+    
 
 if __name__ == '__main__':
     unittest.main()
@@ -90,6 +90,50 @@ class TestVectors(unittest.TestCase):
             pass
             #self.destroy_index("testindex")
 
+    def test_vector_ordinals(self):
+        from whoosh.filedb.filestore import RamStorage
+        from whoosh.filedb.filetables import VectorWriter, VectorReader
+        
+        st = RamStorage()
+        vw = VectorWriter(st.create_file("vecs"), st.create_file("terms"))
+        o1 = vw.add([(u"alfa", "a"), (u"bravo", "bb")], -1)
+        o2 = vw.add([(u"bravo", ""), (u"charlie", "c")], -1)
+        o3 = vw.add([(u"alfa", "xy"), (u"delta", "zw")], 2)
+        o4 = vw.add([], 0)
+        vw.close()
+        
+        vr = VectorReader(st.open_file("vecs"), st.open_file("terms"))
+        self.assertEqual(vr.items(o1, -1), [(u"alfa", "a"), (u"bravo", "bb")])
+        self.assertEqual(vr.items(o2, -1), [(u"bravo", ""), (u"charlie", "c")])
+        self.assertEqual(vr.items(o3, 2), [(u"alfa", "xy"), (u"delta", "zw")])
+        self.assertEqual(vr.items(o4, 0), [])
+        self.assertEqual(vr.term(3), u"delta")
+        vr.close()
+    
+    def test_key_terms(self):
+        from whoosh.filedb.filestore import RamStorage
+        
+        a = analysis.StandardAnalyzer()
+        schema = fields.Schema(content = fields.TEXT(vector=formats.Frequency(analyzer=a)))
+        ix = RamStorage().create_index(schema)
+        writer = ix.writer()
+        writer.add_document(content=u"alfa bravo charlie delta echo")
+        writer.add_document(content=u"alfa bravo bravo foxtrot")
+        writer.add_document(content=u"alfa charlie golf")
+        writer.add_document(content=u"alfa hotel india")
+        writer.commit()
+        
+        searcher = ix.searcher()
+        vec = searcher.reader().vector(1, "content")
+        vec.skip_to(u"c")
+        self.assertEqual(vec.id, u"foxtrot")
+        vec.skip_to(u"zulu")
+        self.assertEqual(vec.id, None)
+        
+        terms = searcher.key_terms([0, 1], "content", numterms=2)
+        self.assertEqual(len(terms), 2)
+        self.assertEqual(terms[0][0], u"bravo")
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 
-import os, random
+import os, random, sys
 
 from whoosh import fields, index, writing
 
@@ -45,6 +45,254 @@ class TestWriting(unittest.TestCase):
         # Check whether all documents made it into the index.
         r = ix.reader()
         self.assertEqual(sorted([int(id) for id in r.lexicon("id")]), range(20))
+    
+    def test_nrt_searcher(self):
+        from whoosh import analysis, formats, query
+        from whoosh.filedb.filestore import RamStorage
+        
+        a = analysis.StandardAnalyzer()
+        schema = fields.Schema(id=fields.ID(stored=True),
+                               text=fields.TEXT(vector=formats.Frequency(a)))
+        ix = RamStorage().create_index(schema)
+        w = ix.writer()
+        w.add_document(id=u"1", text=u"alfa bravo")
+        w.add_document(id=u"2", text=u"bravo charlie")
+        w.commit()
+        
+        w = ix.writer(nrt=True)
+        w.delete_by_term("id", u"1")
+        w.add_document(id=u"3", text=u"bravo delta")
+        s = w.nrt_searcher()
+        self.assertEqual(s.reader().doc_count(), 2)
+        r = s.search(query.Term("text", u"bravo"))
+        self.assertEqual(sorted(d["id"] for d in r), [u"2", u"3"])
+        self.assertEqual([d["id"] for d in s.search(query.Term("text", u"delta"))],
+                         [u"3"])
+        self.assertEqual(list(s.reader().vector_as("frequency", 2, "text")),
+                         [(u"bravo", 1), (u"delta", 1)])
+        
+        # The searcher only sees the documents added before it was created
+        w.add_document(id=u"4", text=u"delta echo")
+        self.assertEqual(len(s.search(query.Term("text", u"delta"))), 1)
+        s.close()
+        s = w.nrt_searcher()
+        self.assertEqual(len(s.search(query.Term("text", u"delta"))), 2)
+        self.assertEqual(list(s.reader().lexicon("text")),
+                         [u"alfa", u"bravo", u"charlie", u"delta", u"echo"])
+        s.close()
+        w.commit()
+        
+        s = ix.searcher()
+        self.assertEqual(sorted(d["id"] for d in s.search(query.Term("text", u"bravo"))),
+                         [u"2", u"3"])
+        w = ix.writer()
+        self.assertRaises(writing.IndexingError, w.nrt_searcher)
+        w.cancel()
+    
+    def test_nrt_reader_reuse(self):
+        from whoosh.filedb.filestore import RamStorage
+        from whoosh.filedb.filewriting import NO_MERGE
+        
+        schema = fields.Schema(id=fields.ID(stored=True))
+        ix = RamStorage().create_index(schema)
+        for ids in ([u"1", u"2"], [u"3", u"4"]):
+            w = ix.writer()
+            for id in ids:
+                w.add_document(id=id)
+            w.commit(NO_MERGE)
+        
+        w = ix.writer(nrt=True)
+        w.add_document(id=u"5")
+        r1 = w.nrt_reader()
+        
+        # The committed segments aren't reopened to see new documents, and
+        # closing an NRT reader leaves them open for the next one
+        w.add_document(id=u"6")
+        r1.close()
+        r2 = w.nrt_reader()
+        self.assertEqual(r2.readers[:2], r1.readers[:2])
+        self.assertFalse(r2.readers[0].is_closed)
+        self.assertEqual(r2.doc_count_all(), 6)
+        
+        # A deletion only reopens the segment it changes, and readers opened
+        # before the deletion don't see it
+        w.delete_by_term("id", u"3")
+        r3 = w.nrt_reader()
+        self.assertTrue(r3.readers[0] is r2.readers[0])
+        self.assertFalse(r3.readers[1] is r2.readers[1])
+        self.assertEqual(r3.doc_count(), 5)
+        self.assertEqual(r2.doc_count(), 6)
+        
+        readers = r2.readers[:2] + r3.readers[:2]
+        w.commit()
+        self.assertTrue(all(r.is_closed for r in readers))
+        self.assertEqual(ix.doc_count(), 5)
+    
+    def test_ram_index(self):
+        from whoosh import query
+        from whoosh.ramdb.ramindex import RamIndex
+        
+        schema = fields.Schema(id=fields.ID(stored=True), text=fields.TEXT)
+        ix = RamIndex(schema)
+        w = ix.writer()
+        w.add_document(id=u"1", text=u"echo alfa bravo")
+        w.add_document(id=u"2", text=u"bravo charlie")
+        w.add_document(id=u"3", text=u"alfa delta delta")
+        
+        r = ix.reader()
+        self.assertEqual(r.lexicon("text"),
+                         [u"alfa", u"bravo", u"charlie", u"delta", u"echo"])
+        self.assertEqual(r.frequency("text", u"delta"), 2)
+        self.assertEqual(list(r.expand_prefix("text", u"c")), [u"charlie"])
+        self.assertEqual(r.doc_field_length(2, "text"), 3)
+        
+        # Terms added after the reader was created are sorted in when a new
+        # reader asks for them, and the old reader doesn't see them
+        w.add_document(id=u"4", text=u"foxtrot alfa")
+        self.assertEqual(r.doc_frequency("text", u"alfa"), 2)
+        self.assertFalse(("text", u"foxtrot") in r)
+        r2 = ix.reader()
+        self.assertEqual(r2.lexicon("text"), [u"alfa", u"bravo", u"charlie",
+                                              u"delta", u"echo", u"foxtrot"])
+        p = r2.postings("text", u"alfa")
+        p.skip_to(2)
+        self.assertEqual(p.id, 2)
+        self.assertEqual(list(p.all_ids()), [0, 2, 3])
+        
+        w.delete_document(0)
+        w.delete_document(2)
+        ix.optimize()
+        self.assertEqual(ix.doc_count_all(), 2)
+        r3 = ix.reader()
+        self.assertEqual(r3.lexicon("text"),
+                         [u"alfa", u"bravo", u"charlie", u"foxtrot"])
+        self.assertEqual(list(r3.postings("text", u"alfa").all_ids()), [1])
+        self.assertEqual(r3.field_length("text"), 4)
+        self.assertEqual(r3.doc_field_length(1, "text"), 2)
+        self.assertEqual([d["id"] for d in r3.all_stored_fields()],
+                         [u"2", u"4"])
+        s = ix.searcher()
+        self.assertEqual([d["id"] for d in s.search(query.Term("text", u"foxtrot"))],
+                         [u"4"])
+        
+        # The reader created before optimizing still sees the old documents
+        self.assertEqual(r2.lexicon("text")[-1], u"foxtrot")
+        self.assertEqual(r2.stored_fields(2)["id"], u"3")
+        self.assertEqual(list(r2.postings("text", u"alfa").all_ids()), [3])
+    
+    def test_ram_index_concurrent_reads(self):
+        import threading
+        from whoosh.ramdb.ramindex import RamIndex
+        
+        schema = fields.Schema(text=fields.ID)
+        ix = RamIndex(schema)
+        w = ix.writer()
+        
+        # A term added by a document that isn't finished yet is in the
+        # inverted index but must not be visible to readers
+        ix.add_posting(0, u"alfa", 0, 1, "")
+        r = ix.reader()
+        self.assertFalse(("text", u"alfa") in r)
+        self.assertEqual(list(r.lexicon("text")), [])
+        self.assertEqual(r.doc_frequency("text", u"alfa"), 0)
+        ix.finish_document([])
+        
+        errors = []
+        done = []
+        def read():
+            try:
+                while not done:
+                    r = ix.reader()
+                    list(r.lexicon("text"))
+                    for i in xrange(2000):
+                        r.doc_frequency("text", u"t%s" % i)
+            except Exception, e:
+                errors.append(e)
+        
+        # Switch threads as often as possible to give the readers a chance to
+        # run in the middle of add_posting()
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        threads = [threading.Thread(target=read) for _ in xrange(3)]
+        for t in threads:
+            t.start()
+        try:
+            for i in xrange(2000):
+                w.add_document(text=u"t%s" % i)
+        finally:
+            done.append(True)
+            for t in threads:
+                t.join()
+            sys.setcheckinterval(interval)
+        self.assertEqual(errors, [])
+        self.assertEqual(ix.reader().doc_frequency("text", u"t1999"), 1)
+    
+    def test_add_ramindex(self):
+        from whoosh import analysis, query
+        from whoosh.filedb.filestore import RamStorage
+        from whoosh.ramdb.ramindex import RamIndex
+        
+        vformat = fields.Frequency(analysis.StandardAnalyzer())
+        schema = fields.Schema(id=fields.ID(stored=True),
+                               text=fields.TEXT(vector=vformat))
+        ram = RamIndex(schema)
+        rw = ram.writer()
+        rw.add_document(id=u"1", text=u"alfa bravo alfa")
+        rw.add_document(id=u"2", text=u"bravo charlie")
+        rw.add_document(id=u"3", text=u"charlie delta echo")
+        rw.delete_document(1)
+        
+        ix = RamStorage().create_index(schema)
+        w = ix.writer()
+        w.add_document(id=u"0", text=u"alfa zulu")
+        w.add_ramindex(ram)
+        w.commit()
+        
+        self.assertEqual(ix.doc_count_all(), 3)
+        r = ix.reader()
+        self.assertEqual(list(r.lexicon("text")),
+                         [u"alfa", u"bravo", u"charlie", u"delta", u"echo",
+                          u"zulu"])
+        self.assertEqual(r.frequency("text", u"alfa"), 3)
+        self.assertEqual(r.doc_frequency("text", u"charlie"), 1)
+        self.assertEqual(r.field_length("text"), 8)
+        self.assertEqual(sorted(d["id"] for d in r.all_stored_fields()),
+                         [u"0", u"1", u"3"])
+        
+        s = ix.searcher()
+        docnum = s.document_number(id=u"3")
+        self.assertEqual(r.doc_field_length(docnum, "text"), 3)
+        self.assertEqual(list(r.vector_as("weight", docnum, "text")),
+                         [(u"charlie", 1.0), (u"delta", 1.0), (u"echo", 1.0)])
+        results = s.search(query.Term("text", u"alfa"))
+        self.assertEqual(sorted(d["id"] for d in results), [u"0", u"1"])
+        self.assertEqual(len(s.search(query.Term("text", u"bravo"))), 1)
+        
+        ram2 = RamIndex(fields.Schema(title=fields.TEXT))
+        w = ix.writer()
+        self.assertRaises(writing.IndexingError, w.add_ramindex, ram2)
+        
+        # Same field names, but the postings have a different format
+        ram3 = RamIndex(fields.Schema(id=fields.ID(stored=True),
+                                      text=fields.TEXT(phrase=False,
+                                                       vector=vformat)))
+        ram3.writer().add_document(id=u"4", text=u"alfa bravo")
+        self.assertRaises(writing.IndexingError, w.add_ramindex, ram3)
+        ram4 = RamIndex(fields.Schema(id=fields.ID(stored=True),
+                                      text=fields.TEXT))
+        self.assertRaises(writing.IndexingError, w.add_ramindex, ram4)
+        w.cancel()
+        
+        # A separately created but identical schema is fine
+        ram5 = RamIndex(fields.Schema(id=fields.ID(stored=True),
+                                      text=fields.TEXT(vector=vformat)))
+        ram5.writer().add_document(id=u"5", text=u"alfa bravo")
+        w = ix.writer()
+        w.add_ramindex(ram5)
+        w.commit()
+        s = ix.searcher()
+        results = s.search(query.Phrase("text", [u"alfa", u"bravo"]))
+        self.assertEqual(sorted(d["id"] for d in results), [u"1", u"5"])
 
 
 